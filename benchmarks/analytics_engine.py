@@ -0,0 +1,112 @@
+"""
+Compares the columnar analytics engine with the dict/loop aggregation the
+Dashboard uses on raw records, over synthetic transactions.
+
+Usage: python -m benchmarks.analytics_engine [--records 100000] [--runs 5]
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from src.database.analytics import ColumnarSnapshot
+
+TYPES = ('Thu', 'Chi', 'Tiết kiệm')
+CATEGORIES = [f"Danh mục {i}" for i in range(40)]
+YEARS = [str(year) for year in range(2019, 2027)]
+
+
+def synthetic_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        record = {'id': str(i), 'name': rng.choice(CATEGORIES), 'amount': rng.randint(1, 5000) * 1000}
+        rows.append((rng.choice(YEARS), str(rng.randint(1, 12)).zfill(2), rng.choice(TYPES), record))
+    return rows
+
+
+# --- Loop-based baselines, mirroring the Dashboard record scans ---
+
+def loop_summary(rows, year, month=None):
+    income = expense = 0.0
+    for row_year, row_month, type_id, record in rows:
+        if row_year != year or (month is not None and row_month != month):
+            continue
+        amount = float(record['amount'])
+        if type_id == 'Thu':
+            income += amount
+        elif type_id == 'Chi':
+            expense += amount
+    return income, expense
+
+
+def loop_breakdown(rows, year):
+    aggregated = defaultdict(float)
+    for row_year, _, type_id, record in rows:
+        if row_year == year and type_id == 'Chi':
+            aggregated[record['name']] += float(record['amount'])
+    return dict(aggregated)
+
+
+def loop_trend(rows, years):
+    series = {year: [0.0] * 12 for year in years}
+    for row_year, row_month, type_id, record in rows:
+        if type_id == 'Chi' and row_year in series:
+            series[row_year][int(row_month) - 1] += float(record['amount'])
+    return series
+
+
+def loop_top(rows, year, n=5):
+    breakdown = loop_breakdown(rows, year)
+    return sorted(breakdown.items(), key=lambda item: -item[1])[:n]
+
+
+def timed(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.records)
+    start = time.perf_counter()
+    snapshot = ColumnarSnapshot.from_rows(rows)
+    build_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    snapshot.replace_months([('2026', '10')], [row for row in rows if row[0] == '2026' and row[1] == '10'])
+    refresh_ms = (time.perf_counter() - start) * 1000
+
+    year = '2025'
+    income, expense = loop_summary(rows, year, '06')
+    summary = snapshot.summary(year, '06')
+    assert abs(summary['income'] - income) < 1e-6 and abs(summary['expense'] - expense) < 1e-6
+    breakdown = loop_breakdown(rows, year)
+    assert all(abs(snapshot.category_breakdown(year)[name] - value) < 1e-6 for name, value in breakdown.items())
+
+    cases = [
+        ('month summary', lambda: loop_summary(rows, year, '06'), lambda: snapshot.summary(year, '06')),
+        ('year breakdown', lambda: loop_breakdown(rows, year), lambda: snapshot.category_breakdown(year)),
+        ('8-year trend', lambda: loop_trend(rows, YEARS), lambda: snapshot.monthly_series(YEARS, 'Chi')),
+        ('top-5 categories', lambda: loop_top(rows, year), lambda: snapshot.top_categories(5, year)),
+        ('rolling average', lambda: loop_trend(rows, YEARS), lambda: snapshot.rolling_average(YEARS, 'Chi', 3)),
+    ]
+
+    print(f"{args.records} records: snapshot build {build_ms:.1f} ms, one-month refresh {refresh_ms:.1f} ms")
+    print(f"{'query':<20}{'loops':>12}{'columnar':>12}{'speedup':>10}")
+    for name, loop_fn, columnar_fn in cases:
+        loop_ms = timed(loop_fn, args.runs)
+        columnar_ms = timed(columnar_fn, args.runs)
+        print(f"{name:<20}{loop_ms:>10.2f}ms{columnar_ms:>10.2f}ms{loop_ms / columnar_ms:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
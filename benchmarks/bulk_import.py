@@ -0,0 +1,82 @@
+"""
+Measures rows/sec for entering a month of transactions through the
+single-item endpoint (one request and one commit per row) versus the bulk
+import endpoint (one upload, chunked batched writes), against an emulated
+Firestore with injected per-call latency.
+
+Usage: python -m benchmarks.bulk_import [--rows 1000] [--latency-ms 20] [--storage array]
+"""
+import argparse
+import json
+import time
+
+from flask import Flask
+
+from benchmarks.fake_firestore import FakeFirestore
+from src.api.management_api import management_bp
+from src.database import decorators, firestore_queries, record_store, rollups, savings_index, tree_index
+
+TYPES = ('Thu', 'Chi', 'Tiết kiệm')
+
+
+def make_rows(count):
+    rows = []
+    for i in range(count):
+        row = {'Loại': TYPES[i % 3], 'Tên': f"Dòng sao kê {i % 25}", 'Số tiền': str(1000 * (i + 1)),
+               'date': f"2026-{str(i % 12 + 1).zfill(2)}-{str(i % 28 + 1).zfill(2)}"}
+        if row['Loại'] == 'Tiết kiệm':
+            row.update({'rate': '5.5', 'term': '6'})
+        rows.append(row)
+    return rows
+
+
+def fresh_store(latency):
+    store = FakeFirestore(latency=latency)
+    for module in (decorators, firestore_queries, record_store, rollups, savings_index, tree_index):
+        module.db = store
+    return store
+
+
+def totals(store):
+    return {path: {k: v for k, v in data.items() if k in ('income', 'expense', 'savings')}
+            for path, data in store.docs.items() if path.startswith('rollups/')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--storage', choices=('array', 'dual', 'documents'), default='array')
+    args = parser.parse_args()
+    record_store.RECORD_STORAGE = args.storage
+
+    app = Flask(__name__)
+    app.register_blueprint(management_bp)
+    client = app.test_client()
+    rows = make_rows(args.rows)
+
+    store = fresh_store(args.latency_ms / 1000)
+    start = time.perf_counter()
+    for row in rows:
+        response = client.post('/api/management/items', json=row,
+                               headers={'X-Action-Identifier': 'ADD_MANAGEMENT_ITEM'})
+        assert response.status_code == 201, response.get_json()
+    single_seconds, single_rpcs, single_totals = time.perf_counter() - start, store.rpc_count, totals(store)
+
+    store = fresh_store(args.latency_ms / 1000)
+    start = time.perf_counter()
+    response = client.post('/api/management/items/import', data=json.dumps(rows), content_type='application/json',
+                           headers={'X-Action-Identifier': 'IMPORT_MANAGEMENT_ITEMS'})
+    bulk_seconds, bulk_rpcs = time.perf_counter() - start, store.rpc_count
+    report = response.get_json()
+    assert response.status_code == 201 and report['created'] == args.rows, report
+    assert totals(store) == single_totals, "rollups differ between single and bulk import"
+
+    print(f"{args.rows} rows, {args.latency_ms} ms per RPC, RECORD_STORAGE={args.storage}")
+    print(f"{'path':<14}{'seconds':>10}{'rows/sec':>12}{'RPCs':>8}")
+    print(f"{'single item':<14}{single_seconds:>10.2f}{args.rows / single_seconds:>12.0f}{single_rpcs:>8}")
+    print(f"{'bulk import':<14}{bulk_seconds:>10.2f}{args.rows / bulk_seconds:>12.0f}{bulk_rpcs:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Load test for a cache stampede: after the `books` metadata version changes,
+N concurrent requests hit `CRUDApi('books').get_all()` at once. Reports how
+many times the collection was streamed from an emulated Firestore (with
+injected per-call latency) and the request latencies, with single-flight
+off, on, and on with stale-while-revalidate.
+
+Single process only: set REDIS_URL and run several copies at once to
+exercise the cross-worker lock as well.
+
+Usage: python -m benchmarks.cache_stampede [--clients 50] [--docs 500] [--latency-ms 20]
+"""
+import argparse
+import statistics
+import threading
+import time
+from collections import Counter
+
+from flask import Flask
+
+from benchmarks.fake_firestore import FakeFirestore, FakeCollectionRef
+from src.database import decorators, generic_queries
+from src.database.generic_queries import CRUDApi
+from src.database.local_cache import note_version_all, query_cache
+
+app = Flask(__name__)
+streams = Counter()
+_stream = FakeCollectionRef.stream
+
+
+def counting_stream(self, *args, **kwargs):
+    streams[self.path] += 1
+    return _stream(self, *args, **kwargs)
+
+
+def seed(store, docs):
+    for i in range(docs):
+        store.put(f"books/book{i}", {'title': f"Sách {i}", 'description': 'Mô tả ' * 40, 'row': i % 5})
+    store.put('metadata/books', {'version': decorators.new_metadata_version()})
+
+
+def stampede(store, clients):
+    """Bumps the version as another worker would, then fires `clients` concurrent reads."""
+    api = CRUDApi('books')
+    with app.app_context():
+        api.get_all()  # warm: the previous version is cached
+    version = decorators.new_metadata_version() + 1
+    store.put('metadata/books', {'version': version})
+    note_version_all('books', version)
+
+    streams.clear()
+    barrier = threading.Barrier(clients)
+    latencies = []
+
+    def client():
+        with app.app_context():
+            barrier.wait()
+            start = time.perf_counter()
+            api.get_all()
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return streams['books'], latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--docs', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+    FakeCollectionRef.stream = counting_stream
+
+    print(f"{args.clients} concurrent clients, {args.docs} books, {args.latency_ms} ms per RPC")
+    print(f"{'mode':<26}{'reads':>7}{'p50 ms':>10}{'max ms':>10}")
+    for label, single_flight, stale_ttl in (('no coalescing', 'off', 0), ('single-flight', 'on', 0),
+                                            ('single-flight + stale', 'on', 30)):
+        store = FakeFirestore(latency=args.latency_ms / 1000)
+        decorators.db = generic_queries.db = store
+        decorators.SINGLE_FLIGHT, decorators.QUERY_CACHE_STALE_TTL = single_flight, stale_ttl
+        query_cache.clear()
+        seed(store, args.docs)
+        reads, latencies = stampede(store, args.clients)
+        print(f"{label:<26}{reads:>7}{statistics.median(latencies) * 1000:>10.1f}{max(latencies) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
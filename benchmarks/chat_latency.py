@@ -0,0 +1,64 @@
+"""
+Time to first token vs time to last token for the chatbot, against the fake
+OpenAI-compatible server (benchmarks.fake_openai) started in-process.
+Compares POST /api/chatbot (the reply arrives all at once) with POST
+/api/chatbot/stream (Server-Sent Events), without saving history.
+
+Usage: python -m benchmarks.chat_latency [--requests 5] [--words 60] [--first-token-ms 300] [--word-ms 30]
+"""
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from benchmarks.fake_openai import create_app
+
+PORT = 8765
+
+
+def measure(client, path, requests):
+    first, last = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.post(path, json={'message': 'Xin chào', 'saveHistory': False}, buffered=False)
+        first_chunk = None
+        for _ in response.response:
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+        last.append(time.perf_counter() - start)
+        first.append(first_chunk)
+        response.close()
+    return statistics.median(first), statistics.median(last)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5)
+    parser.add_argument('--words', type=int, default=60)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--word-ms', type=float, default=30)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', PORT, create_app(args.words, args.first_token_ms, args.word_ms), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{PORT}/v1"
+    os.environ.setdefault('OPENAI_API_KEY', 'fake')
+    os.environ.pop('API_SECRET_KEY', None)
+
+    from main import app
+    client = app.test_client()
+    print(f"{args.words} words, first token after {args.first_token_ms} ms, {args.word_ms} ms per word")
+    print(f"{'endpoint':<22}{'first byte ms':>15}{'last byte ms':>15}")
+    for path in ('/api/chatbot', '/api/chatbot/stream'):
+        first, last = measure(client, path, args.requests)
+        print(f"{path:<22}{first * 1000:>15.1f}{last * 1000:>15.1f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
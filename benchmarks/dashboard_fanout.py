@@ -0,0 +1,115 @@
+"""
+Benchmarks the Dashboard multi-month reads against an emulated Firestore with
+injected per-call latency, comparing the previous serial loops with the
+batched get_all / collection-group fan-out.
+
+Usage: python -m benchmarks.dashboard_fanout [--years 5] [--latency-ms 20] [--runs 30]
+"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.fake_firestore import FakeFirestore
+from src.database import decorators, firestore_queries, record_store, rollups
+from src.database.firestore_queries import Dashboard
+
+
+def seed(store, years, records_per_type=20):
+    for year in range(2026 - years + 1, 2027):
+        store.put(f"Year/{year}", {})
+        for month in range(1, 13):
+            month_id = str(month).zfill(2)
+            store.put(f"Year/{year}/Months/{month_id}", {})
+            for type_id in ('Thu', 'Chi', 'Tiết kiệm'):
+                records = [
+                    {'id': f"{year}{month_id}{type_id}{i}", 'name': f"Mục {i % 7}", 'amount': 1000 * (i + 1),
+                     'date': f"{year}-{month_id}-01", 'rate': 5.5, 'term': 6}
+                    for i in range(records_per_type)
+                ]
+                store.put(f"Year/{year}/Months/{month_id}/Types/{type_id}", {'records': records})
+
+
+# --- Previous serial implementations, kept here as the baseline ---
+
+def serial_income_and_expense_year(db, year):
+    total_income = total_expense = 0
+    for month_doc in db.collection('Year').document(str(year)).collection('Months').stream():
+        for type_doc in month_doc.reference.collection('Types').stream():
+            for record in type_doc.to_dict().get('records', []):
+                amount = float(record['amount'])
+                if type_doc.id == 'Thu':
+                    total_income += amount
+                elif type_doc.id == 'Chi':
+                    total_expense += amount
+    return {"income": total_income, "expense": total_expense}
+
+
+def serial_piechart_for_year(db, year):
+    aggregated_data = defaultdict(float)
+    for month_doc in db.collection('Year').document(str(year)).collection('Months').stream():
+        chi_doc = month_doc.reference.collection('Types').document('Chi').get()
+        if chi_doc.exists:
+            for record in chi_doc.to_dict().get('records', []):
+                aggregated_data[record['name']] += float(record['amount'])
+    return {"labels": list(aggregated_data.keys()), "data": list(aggregated_data.values())}
+
+
+def serial_total_saving(db):
+    saving_data = []
+    for year_doc in db.collection('Year').stream():
+        for month_doc in year_doc.reference.collection('Months').stream():
+            saving_doc = month_doc.reference.collection('Types').document('Tiết kiệm').get()
+            if saving_doc.exists:
+                saving_data.extend(saving_doc.to_dict().get('records', []))
+    return saving_data
+
+
+def measure(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95_index = min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))
+    return result, statistics.median(timings), timings[p95_index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+
+    store = FakeFirestore(latency=args.latency_ms / 1000)
+    seed(store, args.years)
+    # Point the query layer at the emulated store. No rollup docs are seeded, so
+    # the Dashboard methods take the raw-record path being measured here.
+    firestore_queries.db = store
+    rollups.db = store
+    record_store.db = store
+    # Measure the queries themselves, not the result cache.
+    decorators.QUERY_CACHE = 'off'
+
+    year = 2026
+    cases = [
+        ('income/expense year', lambda: serial_income_and_expense_year(store, year),
+         lambda: Dashboard.get_total_income_and_expense_year(year)),
+        ('piechart year', lambda: serial_piechart_for_year(store, year),
+         lambda: Dashboard.get_piechart_for_year(year)),
+        ('total saving', lambda: serial_total_saving(store), Dashboard.get_total_saving),
+    ]
+
+    print(f"{args.years} years x 12 months, {args.latency_ms} ms per RPC, {args.runs} runs")
+    print(f"{'case':<22}{'serial p50':>12}{'serial p95':>12}{'batched p50':>13}{'batched p95':>13}")
+    for name, serial_fn, batched_fn in cases:
+        serial_result, serial_p50, serial_p95 = measure(serial_fn, args.runs)
+        batched_result, batched_p50, batched_p95 = measure(batched_fn, args.runs)
+        assert serial_result == batched_result, f"{name}: results differ"
+        print(f"{name:<22}{serial_p50:>10.1f}ms{serial_p95:>10.1f}ms{batched_p50:>11.1f}ms{batched_p95:>11.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+A small in-memory stand-in for the Firestore client used by the benchmarks.
+
+Every RPC (a document get, a query stream, a batched get_all or a commit)
+sleeps for `latency` seconds so round-trip counts show up in wall-clock time.
+Only the subset of the client API the app uses is implemented.
+"""
+import threading
+import time
+
+
+class FakeFirestore:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.docs = {}  # path -> dict
+        self.rpc_count = 0
+        self._lock = threading.Lock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpc_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # --- client API ---
+    def collection(self, name):
+        return FakeCollectionRef(self, name)
+
+    def document(self, path):
+        return FakeDocRef(self, path)
+
+    def collection_group(self, collection_id):
+        return FakeCollectionGroup(self, collection_id)
+
+    def get_all(self, refs):
+        self._rpc()
+        return [ref._snapshot() for ref in refs]
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    # --- seeding helpers ---
+    def put(self, path, data):
+        self.docs[path] = dict(data)
+
+
+class FakeDocSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class FakeDocRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionRef(self._store, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionRef(self._store, f"{self.path}/{name}")
+
+    def _snapshot(self):
+        return FakeDocSnapshot(self, self._store.docs.get(self.path))
+
+    def get(self, *args, **kwargs):
+        self._store._rpc()
+        return self._snapshot()
+
+    def set(self, data, merge=False):
+        self._store._rpc()
+        _apply_set(self._store, self.path, data, merge)
+
+    def update(self, data):
+        self._store._rpc()
+        _apply_set(self._store, self.path, data, merge=True)
+
+    def delete(self):
+        self._store._rpc()
+        self._store.docs.pop(self.path, None)
+
+
+class FakeCollectionRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeDocRef(self._store, self.path.rsplit('/', 1)[0]) if '/' in self.path else None
+
+    def document(self, doc_id):
+        return FakeDocRef(self._store, f"{self.path}/{doc_id}")
+
+    def _children(self):
+        prefix = self.path + '/'
+        paths = sorted(p for p in self._store.docs if p.startswith(prefix) and '/' not in p[len(prefix):])
+        return [FakeDocRef(self._store, p)._snapshot() for p in paths]
+
+    def stream(self, *args, **kwargs):
+        self._store._rpc()
+        return iter(self._children())
+
+    def get(self, *args, **kwargs):
+        return list(self.stream())
+
+    # Query methods return a FakeQuery over this collection.
+    def select(self, fields):
+        return FakeQuery(self).select(fields)
+
+    def where(self, *args, **kwargs):
+        return FakeQuery(self).where(*args, **kwargs)
+
+    def order_by(self, field, direction='ASCENDING'):
+        return FakeQuery(self).order_by(field, direction)
+
+    def limit(self, count):
+        return FakeQuery(self).limit(count)
+
+    def count(self):
+        return FakeCountQuery(self)
+
+
+class FakeAggregationResult:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeCountQuery:
+    """count() aggregation: get() returns [[result]] like the real client."""
+
+    def __init__(self, source):
+        self._source = source
+
+    def get(self, *args, **kwargs):
+        self._source._store._rpc()
+        return [[FakeAggregationResult(len(self._source._children()))]]
+
+
+class FakeCollectionGroup:
+    def __init__(self, store, collection_id):
+        self._store = store
+        self.collection_id = collection_id
+
+    def _children(self):
+        paths = sorted(p for p in self._store.docs if p.split('/')[-2] == self.collection_id)
+        return [FakeDocRef(self._store, p)._snapshot() for p in paths]
+
+    def stream(self, *args, **kwargs):
+        self._store._rpc()
+        return iter(self._children())
+
+    def select(self, fields):
+        return FakeQuery(self).select(fields)
+
+    def where(self, *args, **kwargs):
+        return FakeQuery(self).where(*args, **kwargs)
+
+    def order_by(self, field, direction='ASCENDING'):
+        return FakeQuery(self).order_by(field, direction)
+
+    def limit(self, count):
+        return FakeQuery(self).limit(count)
+
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+}
+
+
+def _field_value(snapshot, field):
+    return snapshot.reference.path if field == '__name__' else (snapshot._data or {}).get(field)
+
+
+def _sortable(value):
+    # Missing fields sort first, as in Firestore.
+    return (0, 0) if value is None else (1, value)
+
+
+class FakeQuery:
+    """Filters, orders and pages a collection's documents in memory."""
+
+    def __init__(self, source):
+        self._source = source
+        self._store = source._store
+        self._fields = None
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._limit_to_last = False
+        self._cursor = None
+        self._end_before = None
+
+    def _copy(self, **changes):
+        query = FakeQuery(self._source)
+        query.__dict__.update({**self.__dict__, **changes})
+        return query
+
+    def select(self, fields):
+        return self._copy(_fields=list(fields))
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(_filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(_orders=self._orders + [(field, direction == 'DESCENDING')])
+
+    def limit(self, count):
+        return self._copy(_limit=count, _limit_to_last=False)
+
+    def limit_to_last(self, count):
+        return self._copy(_limit=count, _limit_to_last=True)
+
+    def start_after(self, cursor):
+        return self._copy(_cursor=cursor)
+
+    def end_before(self, cursor):
+        return self._copy(_end_before=cursor)
+
+    def _cursor_orders(self):
+        # Firestore orders by document name last, implicitly.
+        if any(field == '__name__' for field, _ in self._orders):
+            return self._orders
+        return self._orders + [('__name__', self._orders[-1][1] if self._orders else False)]
+
+    def _compare(self, doc, cursor):
+        """-1, 0 or 1: where doc sits relative to a cursor (snapshot or dict) in query order."""
+        for field, descending in self._cursor_orders():
+            if isinstance(cursor, dict):
+                value = cursor.get(field)
+                if field == '__name__' and isinstance(value, str) and '/' not in value:
+                    value = f"{getattr(self._source, 'path', '')}/{value}"
+            else:
+                value = _field_value(cursor, field)
+            a, b = _sortable(_field_value(doc, field)), _sortable(value)
+            if a != b:
+                result = -1 if a < b else 1
+                return -result if descending else result
+        return 0
+
+    def _results(self):
+        docs = [doc for doc in self._source._children()
+                if all(_OPERATORS[op](_field_value(doc, field), value) for field, op, value in self._filters)]
+        # Stable multi-key sort: apply the orderings from last to first.
+        docs.sort(key=lambda doc: doc.reference.path)
+        for field, descending in reversed(self._orders):
+            docs.sort(key=lambda doc: _sortable(_field_value(doc, field)), reverse=descending)
+        if self._cursor is not None:
+            docs = [doc for doc in docs if self._compare(doc, self._cursor) > 0]
+        if self._end_before is not None:
+            docs = [doc for doc in docs if self._compare(doc, self._end_before) < 0]
+        if self._limit is not None:
+            docs = docs[-self._limit:] if self._limit_to_last else docs[:self._limit]
+        if self._fields is not None:
+            docs = [FakeDocSnapshot(doc.reference, {k: v for k, v in doc._data.items() if k in self._fields})
+                    for doc in docs]
+        return docs
+
+    def stream(self, *args, **kwargs):
+        self._store._rpc()
+        return iter(self._results())
+
+    def get(self, *args, **kwargs):
+        return list(self.stream())
+
+
+class FakeWriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref.path, data, merge))
+
+    def update(self, ref, data):
+        self._ops.append((ref.path, data, True))
+
+    def delete(self, ref):
+        self._ops.append((ref.path, None, False))
+
+    def commit(self):
+        self._store._rpc()
+        for path, data, merge in self._ops:
+            if data is None:
+                self._store.docs.pop(path, None)
+            else:
+                _apply_set(self._store, path, data, merge)
+        self._ops = []
+
+
+def _apply_set(store, path, data, merge):
+    """Applies a set/update, resolving the Firestore sentinels the app writes."""
+    current = dict(store.docs.get(path) or {}) if merge else {}
+    _merge_into(current, data, merge)
+    store.docs[path] = current
+
+
+def _merge_into(target, data, merge):
+    for key, value in data.items():
+        kind = type(value).__name__
+        if kind == 'Sentinel' and 'delete' in repr(value):
+            target.pop(key, None)
+        elif kind == 'Increment':
+            target[key] = target.get(key, 0) + value.value
+        elif kind == 'ArrayUnion':
+            existing = list(target.get(key, []))
+            existing.extend(v for v in value.values if v not in existing)
+            target[key] = existing
+        elif isinstance(value, dict) and merge:
+            child = dict(target.get(key) or {})
+            _merge_into(child, value, merge)
+            target[key] = child
+        else:
+            target[key] = value
@@ -0,0 +1,77 @@
+"""
+A local, OpenAI-compatible chat completions server for testing the chatbot
+without an API key or network access. Replies are generated word by word
+with a configurable delay, streamed (stream=true) or not.
+
+Usage: python -m benchmarks.fake_openai [--port 8001] [--words 60] [--first-token-ms 300] [--word-ms 30]
+       OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=fake python main.py
+"""
+import argparse
+import json
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+LOREM = ("Tiết kiệm đều đặn mỗi tháng giúp bạn chủ động hơn với các khoản chi lớn và "
+         "giảm áp lực khi trả nợ đúng hạn").split()
+
+
+def create_app(words=60, first_token_ms=300, word_ms=30):
+    app = Flask(__name__)
+
+    def reply_words(message):
+        return [f"[{message[:20]}]"] + [LOREM[i % len(LOREM)] for i in range(words - 1)]
+
+    @app.get('/v1/models')
+    def models():
+        return jsonify({"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "fake"}]})
+
+    @app.post('/v1/chat/completions')
+    def chat_completions():
+        body = request.get_json()
+        message = body['messages'][-1]['content']
+        model = body.get('model', 'fake-model')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get('stream'):
+            time.sleep((first_token_ms + word_ms * (words - 1)) / 1000)
+            return jsonify({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": ' '.join(reply_words(message))}}],
+            })
+
+        def chunk(delta, finish_reason=None):
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        def generate():
+            yield chunk({"role": "assistant", "content": ""})
+            time.sleep(first_token_ms / 1000)
+            for i, word in enumerate(reply_words(message)):
+                if i:
+                    time.sleep(word_ms / 1000)
+                yield chunk({"content": word if i == 0 else f" {word}"})
+            yield chunk({}, finish_reason='stop')
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype='text/event-stream')
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--words', type=int, default=60)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--word-ms', type=float, default=30)
+    args = parser.parse_args()
+    create_app(args.words, args.first_token_ms, args.word_ms).run(port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
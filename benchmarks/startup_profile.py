@@ -0,0 +1,87 @@
+"""
+Startup profile of a fresh worker: how long `import main` takes, which
+packages and app modules that time goes to (python -X importtime), and the
+time to the first response. Runs the app in a subprocess so every import is
+cold, like a gunicorn worker boot.
+
+Usage: python -m benchmarks.startup_profile [--top 15] [--path /api/metrics] [--budget-s 2.0]
+Exits with status 1 when import + first response exceeds --budget-s.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+client = main.app.test_client()
+response = client.get(sys.argv[1])
+done = time.perf_counter()
+from src import lazy
+with open(sys.argv[2], "w") as report:
+    json.dump({"import_s": imported - start, "first_response_s": done - imported,
+               "status": response.status_code, "clients": lazy.stats()["clients"]}, report)
+'''
+
+
+def parse_importtime(stderr):
+    """Returns (self_us by top-level package, cumulative_us by first-party module)."""
+    by_package, first_party = defaultdict(int), {}
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = int(match.group(1)), int(match.group(2)), match.group(4)
+        by_package[name.split('.')[0]] += self_us
+        if name == 'main' or name.startswith('src.'):
+            first_party[name] = cumulative_us
+    return by_package, first_party
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--path', default='/api/metrics', help='Route requested as the first request.')
+    parser.add_argument('--budget-s', type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = os.path.join(tmp, 'report.json')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, args.path, report_path],
+                                capture_output=True, text=True, cwd=os.getcwd())
+        if result.returncode or not os.path.exists(report_path):
+            print(result.stdout + result.stderr)
+            sys.exit(result.returncode or 1)
+        with open(report_path) as f:
+            report = json.load(f)
+
+    by_package, first_party = parse_importtime(result.stderr)
+    initialized = [f"{name} ({info['init_ms']} ms)" for name, info in report['clients'].items() if info['initialized']]
+    print(f"import main: {report['import_s'] * 1000:.0f} ms   "
+          f"first response ({args.path} -> {report['status']}): {report['first_response_s'] * 1000:.0f} ms")
+    print(f"clients initialized by then: {', '.join(initialized) or 'none'}")
+
+    print(f"\n{'package (self time)':<40}{'ms':>10}")
+    for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40}{us / 1000:>10.1f}")
+    print(f"\n{'app module (cumulative)':<40}{'ms':>10}")
+    for name, us in sorted(first_party.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40}{us / 1000:>10.1f}")
+
+    total = report['import_s'] + report['first_response_s']
+    if args.budget_s is not None and total > args.budget_s:
+        print(f"\nOver budget: {total:.2f}s > {args.budget_s:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
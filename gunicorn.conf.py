@@ -0,0 +1,45 @@
+# Gunicorn settings. Usage: gunicorn -c gunicorn.conf.py main:app
+#
+# The gevent worker serves each request on a greenlet, so an open chatbot
+# stream (/api/chatbot/stream) waits on the OpenAI socket without holding an
+# OS thread; one worker keeps up to GUNICORN_WORKER_CONNECTIONS streams open.
+# GUNICORN_WORKER_CLASS=gthread falls back to a fixed thread pool per worker.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '200'))
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))  # gthread only
+
+# A stream can outlive the default 30s while the model generates; the gevent
+# worker keeps heartbeating during it, so this only bounds hung workers.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    # Patch before the app is imported in the worker, and let gRPC (Firestore)
+    # cooperate with the gevent hub instead of blocking it.
+    from gevent import monkey
+    monkey.patch_all()
+    import grpc.experimental.gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+
+
+def post_worker_init(worker):
+    # The worker is ready to accept requests; WARMUP=1 connects the clients in the background.
+    from src.lazy import start_warmup
+    start_warmup()
+
+
+def worker_exit(server, worker):
+    # Commit the queued non-critical writes (chat history, metadata bumps) before the worker goes away.
+    from src.database.write_behind import write_behind
+    write_behind.stop()
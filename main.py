@@ -1,6 +1,9 @@
 from dotenv import load_dotenv
 load_dotenv() # Tải các biến môi trường từ file .env
 
+# Imported first: startup timings (GET /api/metrics -> startup) count from here.
+from src import lazy
+
 import os
 from flask import Flask, render_template
 # Import a class that holds icon SVGs
@@ -14,6 +17,9 @@ from src.api.chatbot_api import chatbot_bp
 from src.api.loan_api import loan_bp
 from src.api.books_api import books_bp
 from src.api.genre_api import genre_api_blueprint # Import the new genre blueprint
+from src.api.metrics import metrics_bp
+from src.database.metadata_watcher import watcher as metadata_watcher
+from src.cli import rollups_cli, savings_cli, records_cli, tree_cli, loans_cli, chat_cli
 
 app = Flask(__name__,
             template_folder='templates',
@@ -21,6 +27,20 @@ app = Flask(__name__,
 
 app.config['JSON_AS_ASCII'] = False
 
+# === BACKGROUND SERVICES ===
+
+@app.before_request
+def start_metadata_watcher():
+    """Starts the metadata listener lazily, so each forked worker runs its own."""
+    metadata_watcher.ensure_started()
+
+
+@app.after_request
+def record_first_response(response):
+    lazy.mark_first_response()
+    return response
+
+
 # === CONTEXT PROCESSORS ===
 
 @app.context_processor
@@ -36,11 +56,21 @@ app.register_blueprint(report_bp)
 app.register_blueprint(chatbot_bp)
 app.register_blueprint(loan_bp)
 app.register_blueprint(books_bp)
+app.register_blueprint(metrics_bp)
 
 # Register the new genre blueprint with a URL prefix
 app.register_blueprint(genre_api_blueprint, url_prefix='/api/genres')
 
 
+# === REGISTER CLI COMMANDS ===
+app.cli.add_command(rollups_cli)
+app.cli.add_command(savings_cli)
+app.cli.add_command(records_cli)
+app.cli.add_command(tree_cli)
+app.cli.add_command(loans_cli)
+app.cli.add_command(chat_cli)
+
+
 # === VIEW ROUTES ===
 
 # These routes all serve the single-page application's entry point.
@@ -69,8 +99,12 @@ def pages(filename):
     return render_template(os.path.join('pages', filename))
 
 
+lazy.mark_app_ready()
+
+
 # === START APPLICATION ===
 def main():
+    lazy.start_warmup()
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
 
 if __name__ == "__main__":
@@ -18,6 +18,7 @@ ACTION_CONFIG = {
 
     # === Management API Endpoints ===
     'management_api.add_new_item': ['ADD_MANAGEMENT_ITEM'],
+    'management_api.import_items': ['IMPORT_MANAGEMENT_ITEMS'],
     'management_api.update_record': ['UPDATE_MANAGEMENT_RECORD'],
     'management_api.delete_record': ['DELETE_MANAGEMENT_RECORD'],
 
@@ -1,8 +1,10 @@
 from flask import Blueprint, jsonify, render_template, abort
-from google.cloud.firestore_v1.base_query import FieldFilter
 from src.database.generic_queries import CRUDApi
+from src.database.firestore_queries import BookStore
+from src.database.shelf_index import get_shelf_index
 from src.database.firebase_config import db
 from src.api.auth import require_api_key, require_action
+from src.api.http_cache import conditional_get
 
 # Update Blueprint to include template folder
 books_bp = Blueprint('books_bp', __name__, template_folder='../../templates', static_folder='../../static')
@@ -10,32 +12,26 @@ books_bp = Blueprint('books_bp', __name__, template_folder='../../templates', st
 books_crud = CRUDApi('books')
 
 @books_bp.route('/api/shelves', methods=['GET'])
+@conditional_get()
 def get_shelves_layout():
     try:
-        shelves_query = db.collection('shelves').order_by('row').order_by('order').stream()
-        rows = {}
-        for shelf_doc in shelves_query:
-            shelf_data = shelf_doc.to_dict()
-            row_num = shelf_data.get('row', 1)
-            unit = {
-                'type': shelf_data.get('orientation', 'vertical'),
-                'compartments': shelf_data.get('compartments', 1)
-            }
-            if row_num not in rows:
-                rows[row_num] = []
-            rows[row_num].append(unit)
-        layout = [{'units': rows[row_num]} for row_num in sorted(rows.keys())]
-        if not layout:
-             layout = [
-                {'units': [{'type': 'vertical', 'compartments': 5}]},
-                {'units': [{'type': 'horizontal', 'compartments': 5}]}
-             ]
-        return jsonify(layout), 200
+        return jsonify(get_shelf_index().layout), 200
     except Exception as e:
         print(f"ERROR in /api/shelves: {e}")
         return jsonify({"error": "Failed to fetch shelf layout."}), 500
 
+@books_bp.route('/api/shelves/occupancy', methods=['GET'])
+@conditional_get(['books', 'shelves'])
+def get_shelves_occupancy():
+    """Book counts per compartment, following the /api/shelves layout, and library-wide totals."""
+    try:
+        return jsonify(get_shelf_index().occupancy()), 200
+    except Exception as e:
+        print(f"ERROR in /api/shelves/occupancy: {e}")
+        return jsonify({"error": "Failed to fetch shelf occupancy."}), 500
+
 @books_bp.route('/api/books', methods=['GET'])
+@conditional_get(['books'])
 def get_all_books():
     return books_crud.get_all()
 
@@ -46,6 +42,7 @@ def add_new_book():
     return books_crud.create()
 
 @books_bp.route('/api/books/<string:doc_id>', methods=['GET'])
+@conditional_get(['books'])
 def get_one_book(doc_id):
     return books_crud.get_one(doc_id)
 
@@ -67,12 +64,7 @@ def delete_existing_book(doc_id):
 def shelf_books_content(row_index, unit_index, comp_index):
     """Serves the HTML fragment for the page that lists books on a specific shelf."""
     try:
-        books_query = db.collection('books').where(filter=FieldFilter('rowIndex', '==', row_index)).where(filter=FieldFilter('unitIndex', '==', unit_index)).where(filter=FieldFilter('compIndex', '==', comp_index)).stream()
-        books_list = []
-        for book in books_query:
-            book_data = book.to_dict()
-            book_data['id'] = book.id
-            books_list.append(book_data)
+        books_list = BookStore.get_books_on_shelf(row_index, unit_index, comp_index)
         return render_template('pages/shelf_books.html', books=books_list, row_index=row_index, unit_index=unit_index, comp_index=comp_index)
     except Exception as e:
         print(f"Error fetching books for shelf: {e}")
@@ -1,28 +1,84 @@
 import os
+import json
 import datetime
-from flask import Blueprint, request, jsonify
-from openai import OpenAI
+import time
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from firebase_admin import firestore
 from src.api.auth import require_api_key # Import decorator
+from src.lazy import LazyClient, on_warmup
+from src.api.prompt_cache import prompt_cache, prompt_key, prompt_cache_disabled
 
 # Import the database object from your firebase_config
 from src.database.firebase_config import db
+from src.database.chat_history import ChatHistory, HISTORY_FIELDS
+from src.database.write_behind import write_behind
 
 chatbot_bp = Blueprint('chatbot_bp', __name__)
-# Initialize the OpenAI client
-try:
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    client.models.list() # Test the client connection
-except Exception as e:
-    print(f"CRITICAL: OpenAI client could not be initialized. Chatbot will not work. Error: {e}")
-    client = None
+
+SYSTEM_PROMPT = "Bạn là chuyên gia AI. Chuyên tư vấn và giải đáp các thắc mắc về tài chính học tập, chuyên gia tiếng anh"
+NOT_CONFIGURED_REPLY = "Lỗi: Chatbot chưa được cấu hình đúng trên máy chủ. Vui lòng liên hệ quản trị viên."
+ERROR_REPLY = "Rất tiếc, đã có lỗi xảy ra khi xử lý yêu cầu của bạn."
+
+def _create_openai_client():
+    # Imported here: the openai package alone takes about half of the app's import time.
+    from openai import OpenAI
+    try:
+        # OPENAI_BASE_URL points the client at any OpenAI-compatible server,
+        # e.g. `python -m benchmarks.fake_openai` for local testing.
+        return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), base_url=os.environ.get("OPENAI_BASE_URL") or None)
+    except Exception as e:
+        print(f"CRITICAL: OpenAI client could not be initialized. Chatbot will not work. Error: {e}")
+        return None
+
+
+def _check_openai_connection():
+    """Warm-up step: one round trip to the API, off the request path."""
+    if client:
+        client.models.list()
+
+
+# Created on first use, so importing the app makes no network call (see src.lazy).
+client = LazyClient('openai', _create_openai_client)
+on_warmup('openai_connection', _check_openai_connection)
+
+
+def _chat_model():
+    return os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
+
+
+def _chat_messages(user_message):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_message}
+    ]
+
+
+def _save_history(user_message, bot_reply):
+    try:
+        # Queued (see write_behind): the reply doesn't wait for the history write.
+        chat_ref = db.collection('chat_history').document()
+        write_behind.set(chat_ref, {
+            'message': user_message,
+            'reply': bot_reply,
+            'timestamp': firestore.SERVER_TIMESTAMP
+        })
+    except Exception as db_error:
+        # Log but don't fail the request if saving fails
+        print(f"WARNING: Failed to save chat history: {db_error}")
+
+
+def _sse(data, event=None):
+    """One Server-Sent Event; `data` is sent as JSON."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
 @chatbot_bp.route('/api/chatbot', methods=['POST'])
 @require_api_key # Protect this endpoint
 def handle_chat():
     """Handles incoming chat messages, gets a reply from OpenAI, and optionally saves the interaction."""
     if not client:
-        return jsonify({"reply": "Lỗi: Chatbot chưa được cấu hình đúng trên máy chủ. Vui lòng liên hệ quản trị viên."}), 200
+        return jsonify({"reply": NOT_CONFIGURED_REPLY}), 200
 
     data = request.get_json()
     if not data or 'message' not in data:
@@ -31,53 +87,150 @@ def handle_chat():
     user_message = data['message']
     # Check if we should save to history (default: True for backward compatibility)
     save_history = data.get('saveHistory', True)
-    
-    # Get model from environment or use default
-    model = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
+    model = _chat_model()
 
-    try:
-        # 1. Get bot's reply from OpenAI
+    def generate():
         completion = client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": "Bạn là chuyên gia AI. Chuyên tư vấn và giải đáp các thắc mắc về tài chính học tập, chuyên gia tiếng anh"},
-                {"role": "user", "content": user_message}
-            ]
+            messages=_chat_messages(user_message)
         )
-        bot_reply = completion.choices[0].message.content
+        return completion.choices[0].message.content
+
+    try:
+        # 1. Get bot's reply from the prompt cache or OpenAI
+        bot_reply, cached = prompt_cache.get_or_generate(
+            prompt_key(model, SYSTEM_PROMPT, user_message), user_message, generate,
+            bypass=bool(data.get('bypassCache')))
 
         # 2. Save the conversation to Firestore only if saveHistory is True
         if save_history:
-            try:
-                chat_ref = db.collection('chat_history').document()
-                chat_ref.set({
-                    'message': user_message,
-                    'reply': bot_reply,
-                    'timestamp': firestore.SERVER_TIMESTAMP
-                })
-            except Exception as db_error:
-                # Log but don't fail the request if saving fails
-                print(f"WARNING: Failed to save chat history: {db_error}")
+            _save_history(user_message, bot_reply)
 
         # 3. Return the bot's reply to the frontend
-        return jsonify({"reply": bot_reply})
+        return jsonify({"reply": bot_reply, "cached": cached})
 
     except Exception as e:
         print(f"ERROR: An error occurred during chatbot processing: {e}")
-        error_reply = "Rất tiếc, đã có lỗi xảy ra khi xử lý yêu cầu của bạn."
-        return jsonify({"reply": error_reply}), 500
+        return jsonify({"reply": ERROR_REPLY}), 500
+
+@chatbot_bp.route('/api/chatbot/stream', methods=['POST'])
+@require_api_key
+def stream_chat():
+    """
+    Same request body as /api/chatbot, but the reply is streamed as Server-Sent
+    Events while the model generates it: `data: {"delta": "..."}` per chunk,
+    then `event: done` with the full reply, or `event: error`. History is saved
+    in the background once the stream has ended.
+    """
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({"error": "Message is required in the request body."}), 400
+    user_message = data['message']
+    save_history = data.get('saveHistory', True)
+    model = _chat_model()
+    bypass_cache = bool(data.get('bypassCache')) or prompt_cache_disabled()
+    key = prompt_key(model, SYSTEM_PROMPT, user_message)
+
+    def generate():
+        if not client:
+            yield _sse({"reply": NOT_CONFIGURED_REPLY}, event='done')
+            return
+        cached_reply = None if bypass_cache else prompt_cache.get(key)
+        if cached_reply is not None:
+            if save_history:
+                _save_history(user_message, cached_reply)
+            yield _sse({"delta": cached_reply})
+            yield _sse({"reply": cached_reply, "cached": True}, event='done')
+            return
+        parts = []
+        started = time.perf_counter()
+        try:
+            # Closing the stream (also when the client disconnects) ends the upstream request.
+            with client.chat.completions.create(
+                model=model,
+                messages=_chat_messages(user_message),
+                stream=True
+            ) as stream:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield _sse({"delta": delta})
+        except Exception as e:
+            print(f"ERROR: An error occurred during chatbot streaming: {e}")
+            yield _sse({"reply": ERROR_REPLY}, event='error')
+            return
+        # Runs only when the whole reply was generated: a client that disconnects
+        # closes this generator at its last yield, and the partial reply is dropped.
+        bot_reply = ''.join(parts)
+        if not bypass_cache and bot_reply:
+            prompt_cache.store(key, user_message, bot_reply, (time.perf_counter() - started) * 1000)
+        if save_history and bot_reply:
+            _save_history(user_message, bot_reply)
+        yield _sse({"reply": bot_reply}, event='done')
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx, Render) from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @chatbot_bp.route('/api/chatbot/history', methods=['GET'])
 def get_chat_history():
-    """Retrieves the entire chat history from Firestore, ordered by time."""
+    """
+    Retrieves the chat history.
+      - ?pageSize=N: one page, newest first, as {data, next_cursor, prev_cursor};
+        ?cursor=<next_cursor> loads older conversations.
+      - ?format=ndjson: every conversation, oldest first, one JSON object per
+        line, streamed as documents arrive from Firestore (?limit=N caps it).
+      - ?fields=message,reply: only return those fields.
+    Without pageSize or format, the whole history is returned as one array.
+    """
     try:
-        history_query = db.collection('chat_history').order_by('timestamp', direction=firestore.Query.ASCENDING).stream()
-        
-        history = []
-        for doc in history_query:
-            history.append(doc.to_dict())
-            
-        return jsonify(history)
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+        unknown = set(fields) - set(HISTORY_FIELDS)
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+
+        if request.args.get('format') == 'ndjson':
+            limit = request.args.get('limit', default=None, type=int)
+            if limit is not None and limit <= 0:
+                return jsonify({"error": "limit must be a positive integer"}), 400
+            return Response(stream_with_context(_ndjson(ChatHistory.stream(fields, limit=limit))),
+                            mimetype='application/x-ndjson')
+
+        page_size = request.args.get('pageSize', default=None, type=int)
+        if page_size is not None:
+            if page_size <= 0:
+                return jsonify({"error": "pageSize must be a positive integer"}), 400
+            cursor = request.args.get('cursor', default=None, type=str)
+            direction = request.args.get('direction', default='next', type=str)
+            return jsonify(ChatHistory.get_page(page_size, cursor, direction, fields))
+
+        return jsonify(list(ChatHistory.stream(fields)))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         print(f"ERROR: Failed to fetch chat history: {e}")
         return jsonify({"error": "Could not retrieve chat history."}), 500
+
+@chatbot_bp.route('/api/chatbot/history/archive/<month>', methods=['GET'])
+def get_archived_chat_history(month):
+    """Retrieves the archived conversations of one month (YYYY-MM), oldest first."""
+    try:
+        datetime.datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+    try:
+        return jsonify(ChatHistory.get_archive(month))
+    except Exception as e:
+        print(f"ERROR: Failed to fetch archived chat history: {e}")
+        return jsonify({"error": "Could not retrieve archived chat history."}), 500
+
+def _ndjson(conversations):
+    # Errors after the first line can no longer change the status code; end the stream instead.
+    try:
+        for conversation in conversations:
+            yield current_app.json.dumps(conversation) + '\n'
+    except Exception as e:
+        print(f"ERROR: Chat history stream failed: {e}")
@@ -1,7 +1,9 @@
+import math
 from flask import Blueprint, jsonify, request
-from src.database.firestore_queries import DocumentHandler
+from src.database.firestore_queries import DocumentHandler, collection_dependencies
 from src.database.generic_queries import CRUDApi
 from src.api.auth import require_api_key, require_action # Import decorators
+from src.api.http_cache import conditional_get
 
 # Create a Blueprint for the collections API
 collections_bp = Blueprint('collections_api', __name__)
@@ -9,23 +11,39 @@ collections_bp = Blueprint('collections_api', __name__)
 # --- Read Operations (GET) ---
 
 @collections_bp.route("/api/collections/<string:collection_name>/documents", methods=['GET'])
+@conditional_get(collection_dependencies)
 def get_documents(collection_name):
-    """Fetches a paginated list of documents from a collection."""
+    """
+    Fetches a page of documents from a collection. Pass the `next_cursor` or
+    `prev_cursor` of a page as `cursor` with `direction=next|prev`; add
+    `includeTotal=1` for total_records/total_pages (cached per collection version).
+    """
     try:
         page_size = request.args.get('pageSize', default=10, type=int)
-        start_after = request.args.get('startAfter', default=None, type=str)
-        
+        if page_size <= 0:
+            return jsonify({"error": "pageSize must be a positive integer"}), 400
+        cursor = request.args.get('cursor', default=None, type=str)
+        direction = request.args.get('direction', default='next', type=str)
+
         result = DocumentHandler.get_paginated_documents(
             collection_name=collection_name,
             page_size=page_size,
-            start_after_doc_id=start_after
+            cursor=cursor,
+            direction=direction
         )
+        if request.args.get('includeTotal') == '1':
+            total_records = DocumentHandler.count_documents(collection_name)
+            result['total_records'] = total_records
+            result['total_pages'] = math.ceil(total_records / page_size)
         return jsonify(result)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         print(f"Error getting paginated documents: {e}")
         return jsonify({"error": "Failed to retrieve documents"}), 500
 
 @collections_bp.route("/api/collections/<path:collection_name>/recent", methods=['GET'])
+@conditional_get(collection_dependencies)
 def get_recent_documents(collection_name):
     """Fetches the most recent documents from a collection."""
     try:
@@ -40,6 +58,7 @@ def get_recent_documents(collection_name):
         return jsonify({"error": "Failed to retrieve recent documents"}), 500
 
 @collections_bp.route("/api/items", methods=['GET'])
+@conditional_get(['items'])
 def get_items_for_dropdown():
     """API endpoint to get all items from the 'items' collection for dropdowns."""
     try:
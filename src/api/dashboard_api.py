@@ -1,10 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, jsonify, request
-from src.database.firestore_queries import Dashboard
+from src.database.firestore_queries import Dashboard, BookStore
+from src.database.analytics import engine as analytics_engine
+from src.database.tree_index import TreeIndex
+from src.api.http_cache import versioned_json, conditional_get
+from src.database.versioning import year_path
 
 # Tạo một Blueprint cho các API của trang quản lý
 report_bp = Blueprint('dashboard_api', __name__)
 
+# Shared pool used to fan out the independent reads of the dashboard bundle.
+_bundle_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='dashboard-bundle')
+
 @report_bp.route("/api/dashboard/summary/<string:year>")
+@conditional_get(lambda year: [year_path(year)])
 def get_report_summary(year):
     """Tính tổng thu và chi trên toàn bộ cơ sở dữ liệu."""
     try:
@@ -16,6 +25,7 @@ def get_report_summary(year):
         return jsonify({"error": "Failed to get summary data"}), 500
 
 @report_bp.route("/api/dashboard/summary/<string:year>/<string:month>")
+@conditional_get(lambda year, month: [year_path(year, month)])
 def get_report_summary_for_month(year,month):
     """Tính tổng thu và chi trên toàn bộ cơ sở dữ liệu."""
     try:
@@ -28,15 +38,27 @@ def get_report_summary_for_month(year,month):
 
 @report_bp.route("/api/dashboard/years")
 def get_years():
+    try:
+        index = TreeIndex.get()
+        summary = Dashboard.get_year_list(index)
+        return versioned_json(summary, TreeIndex.etag_version(index), 'years')
+    except Exception as e:
+        print(f"Lỗi khi lấy dữ liệu tổng quan: {e}")
+        return jsonify({"error": "Failed to get summary data"}), 500
+
+@report_bp.route("/api/dashboard/pie/<string:year>")
+@conditional_get(lambda year: [year_path(year)])
+def get_report_piechart_for_year(year):
     try:
         db = Dashboard()
-        summary = db.get_year_list()
+        summary = db.get_piechart_for_year(year)
         return jsonify(summary)
     except Exception as e:
         print(f"Lỗi khi lấy dữ liệu tổng quan: {e}")
         return jsonify({"error": "Failed to get summary data"}), 500
 
 @report_bp.route("/api/dashboard/pie/<string:year>/<string:month>")
+@conditional_get(lambda year, month: [year_path(year, month, 'Chi')])
 def get_report_piechart_for_month(year,month):
     try:        
         db = Dashboard()
@@ -46,12 +68,117 @@ def get_report_piechart_for_month(year,month):
         print(f"Lỗi khi lấy dữ liệu tổng quan: {e}")
         return jsonify({"error": "Failed to get summary data"}), 500
 
+def _years_arg():
+    years = request.args.get('years', default='', type=str)
+    return [year for year in years.split(',') if year] or Dashboard.get_year_list()
+
+@report_bp.route("/api/dashboard/trend")
+@conditional_get()
+def get_trend():
+    """Chuỗi thu/chi/tiết kiệm theo tháng cho nhiều năm (?years=2024,2025)."""
+    try:
+        return jsonify(analytics_engine.snapshot().trend(_years_arg()))
+    except Exception as e:
+        print(f"Lỗi khi lấy dữ liệu xu hướng: {e}")
+        return jsonify({"error": "Failed to get trend data"}), 500
+
+@report_bp.route("/api/dashboard/rolling")
+@conditional_get()
+def get_rolling_average():
+    """Trung bình trượt theo tháng (?years=2025&type=Chi&window=3)."""
+    try:
+        type_id = request.args.get('type', default='Chi', type=str)
+        window = request.args.get('window', default=3, type=int)
+        return jsonify(analytics_engine.snapshot().rolling_average(_years_arg(), type_id, window))
+    except Exception as e:
+        print(f"Lỗi khi lấy trung bình trượt: {e}")
+        return jsonify({"error": "Failed to get rolling average"}), 500
+
+@report_bp.route("/api/dashboard/top/<string:year>")
+@conditional_get()
+def get_top_categories(year):
+    """Các danh mục lớn nhất trong năm, hoặc trong tháng nếu có ?month= (?n=5&type=Chi)."""
+    try:
+        n = request.args.get('n', default=5, type=int)
+        month = request.args.get('month', default=None, type=str)
+        type_id = request.args.get('type', default='Chi', type=str)
+        return jsonify(analytics_engine.snapshot().top_categories(n, year, month, type_id))
+    except Exception as e:
+        print(f"Lỗi khi lấy danh mục lớn nhất: {e}")
+        return jsonify({"error": "Failed to get top categories"}), 500
+
 @report_bp.route("/api/dashboard/save")
+@conditional_get(['Year'])
 def get_total_saving():
+    """
+    Tổng hợp các khoản tiết kiệm từ chỉ mục tiết kiệm: `summary` chứa tổng gốc,
+    số khoản và phân nhóm theo kỳ hạn/lãi suất; `data` là danh sách khoản gửi,
+    có thể phân trang bằng `pageSize`/`startAfter` hoặc bỏ qua bằng `deposits=0`.
+    """
     try:
+        page_size = request.args.get('pageSize', default=0, type=int)
+        start_after = request.args.get('startAfter', default=None, type=str)
+        include_deposits = request.args.get('deposits', default='1') != '0'
         db = Dashboard()
-        summary = db.get_total_saving()
+        summary = db.get_savings_overview(page_size, start_after, include_deposits)
         return jsonify(summary)  
     except Exception as e:
         print(f"d",{e})
         return jsonify({"error": "Failed to get_total_saving"}), 500
+
+def _previous_month(year, month):
+    """Returns (year, month) of the previous month, keeping the caller's zero-padding."""
+    year_num, month_num = int(year), int(month)
+    if month_num == 1:
+        year_num, month_num = year_num - 1, 12
+    else:
+        month_num -= 1
+    return str(year_num), str(month_num).zfill(len(month))
+
+@report_bp.route("/api/dashboard/bundle/<string:year>/<string:month>")
+# Savings read the whole Year hierarchy, so the bundle follows the global version.
+@conditional_get(['Year', 'books'])
+def get_dashboard_bundle(year, month):
+    """
+    Gom toàn bộ dữ liệu trang chủ vào một request. Các nguồn dữ liệu độc lập được
+    đọc song song; các Types của tháng chỉ đọc một lần cho tổng quan, biểu đồ và
+    giao dịch gần đây. Lỗi của một phần được ghi vào `errors` thay vì làm hỏng cả trang.
+    """
+    try:
+        prev_year, prev_month = _previous_month(year, month)
+    except ValueError:
+        return jsonify({"error": "Invalid year or month"}), 400
+
+    futures = {
+        'month_types': _bundle_executor.submit(Dashboard.get_month_types, year, month),
+        'previous_summary': _bundle_executor.submit(Dashboard.get_total_income_and_expense_month, prev_year, prev_month),
+        'savings': _bundle_executor.submit(Dashboard.get_savings_overview),
+        'total_books': _bundle_executor.submit(BookStore.count_books),
+    }
+
+    bundle = {'year': year, 'month': month, 'errors': {}}
+
+    def fail(names, e):
+        print(f"Lỗi khi lấy dữ liệu {names} cho bundle {year}-{month}: {e}")
+        for name in names:
+            bundle[name] = None
+            bundle['errors'][name] = f"Failed to get {name}"
+
+    # summary, pie and recent all derive from the same read of the month's Types docs.
+    try:
+        month_types = futures['month_types'].result()
+        totals = Dashboard.summarize_month_types(month_types)
+        bundle['summary'] = {"income": totals['income'], "expense": totals['expense']}
+        bundle['pie'] = [{'name': name, 'value': total_amount}
+                         for name, total_amount in totals['categories'].get('Chi', {}).items()]
+        bundle['recent'] = Dashboard.recent_from_month_types(month_types)
+    except Exception as e:
+        fail(['summary', 'pie', 'recent'], e)
+
+    for name in ('previous_summary', 'savings', 'total_books'):
+        try:
+            bundle[name] = futures[name].result()
+        except Exception as e:
+            fail([name], e)
+
+    return jsonify(bundle)
@@ -2,6 +2,7 @@
 from flask import Blueprint
 from src.database.generic_queries import CRUDApi
 from src.api.auth import require_api_key, require_action
+from src.api.http_cache import conditional_get
 
 # Create a Blueprint for the genre API
 genre_api_blueprint = Blueprint('genre_api', __name__)
@@ -13,6 +14,7 @@ genre_crud = CRUDApi('genre')
 # --- Genre API Endpoints ---
 
 @genre_api_blueprint.route('/', methods=['GET'])
+@conditional_get(['genre'])
 # @require_api_key # Commented out to allow frontend to fetch without key for now
 def get_genres():
     """
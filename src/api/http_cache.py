@@ -0,0 +1,101 @@
+# src/api/http_cache.py
+
+"""
+Hỗ trợ HTTP conditional GET: gắn ETag theo version của dữ liệu và trả về
+304 Not Modified khi client gửi If-None-Match trùng khớp.
+"""
+import functools
+import hashlib
+
+from flask import current_app, jsonify, make_response, request
+
+from src.database.decorators import current_versions, unverified_versions
+
+# Browsers must revalidate, which is cheap: a matching ETag costs a version lookup.
+CACHE_CONTROL = 'no-cache'
+# Responses may be compressed by the proxy in front of the app.
+VARY = 'Accept-Encoding'
+
+
+def _cache_headers(response):
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add(VARY)
+    return response
+
+
+def versioned_json(payload, version, prefix):
+    """
+    jsonify(payload) with an ETag derived from a data version. The response
+    becomes a 304 when the request's If-None-Match matches. Without a
+    version the response is returned uncached.
+    """
+    response = jsonify(payload)
+    if version is None:
+        return response
+    response.set_etag(f"{prefix}-{version}")
+    return _cache_headers(response).make_conditional(request)
+
+
+def _version_etag(prefix, versions):
+    digest = hashlib.sha1(repr(sorted(versions.items())).encode('utf-8')).hexdigest()[:20]
+    return f"{prefix}-{digest}"
+
+
+def _body_at(versions):
+    """
+    Whether the body just built can carry an ETag for `versions`. Data read
+    from Firestore or compared against the current versions during the view
+    is at least that new (a concurrent write only makes the ETag older, and
+    clients just refetch). A cached value served without a comparison (a
+    recently checked L1 entry or a stale one) must be at exactly those
+    versions, or the client would keep old data under a new ETag.
+    """
+    for served in unverified_versions():
+        if any(name not in versions or str(versions[name]) != str(version) for name, version in served.items()):
+            return False
+    return True
+
+
+def conditional_get(depends_on=None):
+    """
+    Conditional GET for a JSON route.
+
+    `depends_on` lists the metadata collections (or Year/... paths, see
+    versioning) the response is read from, or is a callable taking the
+    route's arguments and returning that list. The ETag is built from those
+    versions *before* the view runs, so a matching If-None-Match is answered
+    with a 304 without reading the data or encoding JSON. Without
+    `depends_on`, while a collection has no version yet, or when the view
+    served a cached value at other versions than those, the ETag is a hash
+    of the response body. Only 200 responses get an ETag.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = None
+            if depends_on is not None:
+                names = depends_on(*args, **kwargs) if callable(depends_on) else depends_on
+                try:
+                    versions = current_versions(names)
+                except Exception as e:
+                    print(f"Error reading versions for the ETag of {request.path}: {e}")
+                    versions = {}
+                if versions and all(version is not None for version in versions.values()):
+                    etag = _version_etag(request.endpoint, versions)
+                    if request.if_none_match.contains_weak(etag):
+                        response = current_app.response_class(status=304)
+                        response.set_etag(etag)
+                        return _cache_headers(response)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if etag is not None and not _body_at(versions):
+                etag = None
+            if etag is not None:
+                response.set_etag(etag)
+            else:
+                response.add_etag()
+            return _cache_headers(response).make_conditional(request)
+        return wrapper
+    return decorator
@@ -1,14 +1,17 @@
 import uuid
 from flask import Blueprint, jsonify, request
 from src.database.firestore_queries import Loan
-from src.database.firebase_config import db
 from google.cloud import firestore
 from datetime import datetime
 from src.api.auth import require_api_key, require_action # Import decorators
+from src.api.http_cache import conditional_get
 
 # Create a Blueprint for the loan APIs
 loan_bp = Blueprint('loan_api', __name__)
 
+# Upper bound on ?ids for /api/loans/summaries (one batched Firestore read).
+MAX_SUMMARY_IDS = 100
+
 @loan_bp.route("/api/loans/all")
 def get_all_loans():
     """Fetches all loans without pagination."""
@@ -21,29 +24,104 @@ def get_all_loans():
 
 @loan_bp.route("/api/dashboard/loan")
 def get_list_loan():
-    """Fetches a paginated list of loans."""
+    """Fetches a page of loans; page with ?cursor=<next_cursor|prev_cursor>&direction=next|prev."""
     try:
         page_size = request.args.get('pageSize', default=5, type=int)
         if page_size <= 0:
             return jsonify({"error": "pageSize must be a positive integer"}), 400
 
-        start_after = request.args.get('startAfter', default=None, type=str)
-        result = Loan.get_list_loan(page_size=page_size, start_after_doc_id=start_after)
+        cursor = request.args.get('cursor', default=None, type=str)
+        direction = request.args.get('direction', default='next', type=str)
+        result = Loan.get_list_loan(page_size=page_size, cursor=cursor, direction=direction)
         return jsonify(result)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         print(f"Error getting paginated loan list: {e}")
         return jsonify({"error": "Failed to get paginated loan list"}), 500
 
 @loan_bp.route("/api/dashboard/loan/<loan_id>/payments")
 def get_loan_payments(loan_id):
-    """Lấy lịch sử trả lãi cho một khoản vay cụ thể."""
+    """
+    Lấy lịch sử trả lãi cho một khoản vay cụ thể; ?order=desc|asc sắp theo ngày trả.
+    Có ?pageSize thì trả về một trang {data, next_cursor, prev_cursor} (mặc định mới
+    nhất trước); phân trang bằng ?cursor=<next_cursor|prev_cursor>&direction=next|prev.
+    """
     try:
-        payments = Loan.get_loan_payments(loan_id)
+        page_size = request.args.get('pageSize', default=None, type=int)
+        if page_size is not None and page_size <= 0:
+            return jsonify({"error": "pageSize must be a positive integer"}), 400
+        order = request.args.get('order', default=None, type=str)
+        if order not in (None, 'asc', 'desc'):
+            return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+
+        cursor = request.args.get('cursor', default=None, type=str)
+        direction = request.args.get('direction', default='next', type=str)
+        payments = Loan.get_loan_payments(loan_id, page_size=page_size, cursor=cursor,
+                                          direction=direction, newest_first=None if order is None else order == 'desc')
         return jsonify(payments)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         print(f"Error getting loan payments: {e}")
         return jsonify({"error": "Failed to get loan payments"}), 500
 
+@loan_bp.route("/api/loans/summaries")
+def get_loan_summaries():
+    """Lấy nhiều khoản vay kèm tổng gốc/lãi đã trả trong một lần gọi (?ids=a,b,c)."""
+    try:
+        loan_ids = tuple(dict.fromkeys(i.strip() for i in request.args.get('ids', '').split(',') if i.strip()))
+        if not loan_ids:
+            return jsonify({"error": "ids is required"}), 400
+        if len(loan_ids) > MAX_SUMMARY_IDS:
+            return jsonify({"error": f"At most {MAX_SUMMARY_IDS} ids per request"}), 400
+        return jsonify(Loan.get_loan_summaries(loan_ids))
+    except Exception as e:
+        print(f"Error getting loan summaries: {e}")
+        return jsonify({"error": "Failed to get loan summaries"}), 500
+
+@loan_bp.route("/api/loans/<loan_id>/schedule")
+@conditional_get()
+def get_loan_schedule(loan_id):
+    """
+    Lịch trả nợ còn lại của một khoản vay (?method=annuity|equal_principal).
+    Thử trả trước với ?extra=<số tiền thêm mỗi tháng> và/hoặc
+    ?lumpSum=<số tiền>&lumpPeriod=<kỳ thứ mấy>.
+    """
+    try:
+        method = request.args.get('method', default=None, type=str)
+        extra = request.args.get('extra', default=0.0, type=float)
+        lump_sum = request.args.get('lumpSum', default=0.0, type=float)
+        lump_period = request.args.get('lumpPeriod', default=None, type=int)
+        if extra < 0 or lump_sum < 0:
+            return jsonify({"error": "extra and lumpSum must not be negative"}), 400
+        if lump_sum and (lump_period is None or lump_period <= 0):
+            return jsonify({"error": "lumpPeriod must be a positive integer"}), 400
+
+        schedule = Loan.get_loan_schedule(loan_id, method=method, extra_payment=extra,
+                                          lump_sum=lump_sum, lump_period=lump_period)
+        if schedule is None:
+            return jsonify({"error": "Loan not found"}), 404
+        return jsonify(schedule)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        print(f"Error building loan schedule: {e}")
+        return jsonify({"error": "Failed to build loan schedule"}), 500
+
+@loan_bp.route("/api/loans/projection")
+@conditional_get()
+def get_portfolio_projection():
+    """Dự báo tổng tiền trả, lãi và dư nợ theo tháng cho toàn bộ khoản vay (?extra=...)."""
+    try:
+        extra = request.args.get('extra', default=0.0, type=float)
+        if extra < 0:
+            return jsonify({"error": "extra must not be negative"}), 400
+        return jsonify(Loan.get_portfolio_projection(extra_payment=extra))
+    except Exception as e:
+        print(f"Error building loan projection: {e}")
+        return jsonify({"error": "Failed to build loan projection"}), 500
+
 @loan_bp.route("/api/loans/payments", methods=['POST'])
 @require_api_key
 @require_action
@@ -65,10 +143,7 @@ def add_loan_payment():
         if principal_paid <= 0 and interest_paid <= 0:
             return jsonify({"message": "Either principal or interest paid must be greater than zero."}), 400
 
-        transaction = db.transaction()
-        
-        payment_id = Loan.add_payment(
-            transaction,
+        payment_id = Loan.record_payment(
             loan_id,
             payment_date_str, 
             principal_paid, 
@@ -1,23 +1,109 @@
+import os
 import uuid
 from flask import Blueprint, jsonify, request
 from src.database.firestore_queries import ManagementTree
 from datetime import datetime
 from src.api.auth import require_api_key, require_action # Import decorators
+from src.api.upload_parsers import iter_json_array, iter_ndjson, iter_csv
+from src.api.http_cache import versioned_json, conditional_get
+from src.database.versioning import year_path
+from src.database.tree_index import TreeIndex
 
 # Create a Blueprint for the management APIs
 management_bp = Blueprint('management_api', __name__)
 
+# Upper bound on rows per import; every row is validated before anything is written.
+MAX_IMPORT_ROWS = int(os.environ.get('MAX_IMPORT_ROWS', '5000'))
+
+# English column names accepted in imported files.
+IMPORT_FIELD_ALIASES = {'type': 'Loại', 'name': 'Tên', 'amount': 'Số tiền'}
+
+
+def _parse_item(data):
+    """
+    Validates one item payload and returns (year, month, type_id, record_data).
+    Raises ValueError with a user-facing message when the payload is invalid.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Item must be a JSON object.")
+    type_id = data.get('Loại')
+    item_name = data.get('Tên')
+    amount_str = data.get('Số tiền')
+    date_str = data.get('date')
+    rate_str = data.get('rate')
+    term_str = data.get('term')
+
+    if not amount_str or not date_str:
+        raise ValueError("Amount and Date are required.")
+
+    try:
+        amount = int(amount_str)
+        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+        year = str(date_obj.year)
+        month = str(date_obj.month).zfill(2)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid amount or date format: {e}")
+
+    if not all([year, month, type_id, item_name, amount, date_str]):
+        raise ValueError("Missing data: year, month, type, name, amount, or date")
+
+    record_data = {
+        'id': str(uuid.uuid4()),
+        'name': item_name,
+        'amount': amount,
+        'date': date_str
+    }
+
+    if type_id == 'Tiết kiệm':
+        try:
+            record_data.update({
+                'rate': float(rate_str) if rate_str else 0,
+                'term': int(term_str) if term_str else 0,
+                'note': data.get('note', '')
+            })
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid rate or term format: {e}")
+
+    return year, month, type_id, record_data
+
+
+def _import_rows():
+    """Picks a streaming parser from the uploaded file name or the request Content-Type."""
+    upload = request.files.get('file')
+    if upload is not None:
+        name, mimetype, stream = (upload.filename or '').lower(), upload.mimetype or '', upload.stream
+    else:
+        name, mimetype, stream = '', request.mimetype or '', request.stream
+
+    if name.endswith('.csv') or mimetype == 'text/csv':
+        rows = iter_csv(stream)
+    elif name.endswith(('.ndjson', '.jsonl')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = iter_ndjson(stream)
+    else:
+        rows = iter_json_array(stream)
+    for row in rows:
+        if isinstance(row, dict):
+            row = {IMPORT_FIELD_ALIASES.get(key, key): value for key, value in row.items()}
+        yield row
+
 @management_bp.route("/api/management/tree")
 def get_management_tree():
-    """Fetches the Year -> Month tree data for the management page."""
+    """
+    Fetches the Year -> Month tree data for the management page.
+    ?counts=1 returns per-month record counts instead of month lists.
+    """
     try:
-        tree = ManagementTree.get_data_tree()
-        return jsonify(tree)
+        index = TreeIndex.get()
+        if index is not None and request.args.get('counts') in ('1', 'true'):
+            return versioned_json(TreeIndex.tree(index, counts=True), TreeIndex.etag_version(index), 'tree-counts')
+        tree = ManagementTree.get_data_tree(index)
+        return versioned_json(tree, TreeIndex.etag_version(index), 'tree')
     except Exception as e:
         print(f"Error getting management tree: {e}")
         return jsonify({"error": "Failed to get data tree"}), 500
 
 @management_bp.route("/api/management/items/<string:year>/<string:month>")
+@conditional_get(lambda year, month: [year_path(year, month)])
 def get_items(year, month):
     """Fetches all expense items for a specific month."""
     try:
@@ -34,40 +120,10 @@ def add_new_item():
     """Creates a new expense item."""
     try:
         data = request.get_json()
-        type_id = data.get('Loại')
-        item_name = data.get('Tên')
-        amount_str = data.get('Số tiền')
-        date_str = data.get('date')
-        rate_str = data.get('rate')
-        term_str = data.get('term')
-
-        if not amount_str or not date_str:
-            return jsonify({"error": "Amount and Date are required."}), 400
-
         try:
-            amount = int(amount_str)
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            year = str(date_obj.year)
-            month = str(date_obj.month).zfill(2)
-        except (ValueError, TypeError) as e:
-            return jsonify({"error": f"Invalid amount or date format: {e}"}), 400
-
-        if not all([year, month, type_id, item_name, amount, date_str]):
-            return jsonify({"error": "Missing data: year, month, type, name, amount, or date"}), 400
-
-        record_data = {
-            'id': str(uuid.uuid4()),
-            'name': item_name,
-            'amount': amount,
-            'date': date_str
-        }
-
-        if type_id == 'Tiết kiệm':
-            record_data.update({
-                'rate': float(rate_str) if rate_str else 0,
-                'term': int(term_str) if term_str else 0,
-                'note': data.get('note', '')
-            })
+            year, month, type_id, record_data = _parse_item(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         new_item_id = ManagementTree.add_item(year, month, type_id, record_data)
         return jsonify({"success": True, "id": new_item_id}), 201
@@ -76,6 +132,56 @@ def add_new_item():
         print(f"Error creating new item: {e}")
         return jsonify({"error": "Failed to create new item"}), 500
 
+@management_bp.route("/api/management/items/import", methods=['POST'])
+@require_api_key
+@require_action
+def import_items():
+    """
+    Imports many items from a JSON array, NDJSON or CSV (request body or a 'file' upload).
+    Every row is validated first; nothing is written if any row is invalid unless
+    ?allowPartial=1 is set. ?dryRun=1 only validates. Returns a per-row report.
+    """
+    dry_run = request.args.get('dryRun') in ('1', 'true')
+    allow_partial = request.args.get('allowPartial') in ('1', 'true')
+    try:
+        items, report = [], []
+        for row_number, row in enumerate(_import_rows(), start=1):
+            if row_number > MAX_IMPORT_ROWS:
+                return jsonify({"error": f"Too many rows; the limit is {MAX_IMPORT_ROWS}."}), 413
+            try:
+                items.append(_parse_item(row))
+                report.append({'row': row_number, 'status': 'valid'})
+            except ValueError as e:
+                report.append({'row': row_number, 'status': 'invalid', 'error': str(e)})
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Could not parse upload: {e}"}), 400
+    except Exception as e:
+        print(f"Error reading import upload: {e}")
+        return jsonify({"error": "Failed to read upload"}), 500
+
+    invalid = sum(1 for entry in report if entry['status'] == 'invalid')
+    summary = {'total': len(report), 'invalid': invalid, 'created': 0, 'failed': 0}
+    if not report:
+        return jsonify({"error": "No rows to import."}), 400
+    if dry_run or (invalid and not allow_partial) or not items:
+        status = 400 if invalid else 200
+        return jsonify({"success": not invalid, "dryRun": dry_run, **summary, "rows": report}), status
+
+    try:
+        results = iter(ManagementTree.add_items(items))
+    except Exception as e:
+        print(f"Error importing items: {e}")
+        return jsonify({"error": "Failed to import items"}), 500
+
+    for entry in report:
+        if entry['status'] == 'valid':
+            entry.update(next(results))
+            summary[entry['status']] += 1
+
+    success = summary['created'] == summary['total']
+    status = 201 if success else (207 if summary['created'] else 500)
+    return jsonify({"success": success, **summary, "rows": report}), status
+
 @management_bp.route("/api/management/record", methods=['DELETE'])
 @require_api_key
 @require_action
@@ -0,0 +1,39 @@
+# src/api/metrics.py
+
+"""
+Điểm tập trung các thống kê nội bộ của tiến trình (cache, kết nối, ...).
+Mỗi module đăng ký một hàm trả về dict qua `register_source`, và
+GET /api/metrics trả về tất cả dưới dạng JSON.
+"""
+import threading
+from flask import Blueprint, jsonify
+
+metrics_bp = Blueprint('metrics_api', __name__)
+
+_sources = {}
+_lock = threading.Lock()
+
+
+def register_source(name, collect):
+    """Registers a zero-argument callable returning a JSON-serializable dict."""
+    with _lock:
+        _sources[name] = collect
+
+
+def collect_all():
+    with _lock:
+        sources = dict(_sources)
+    results = {}
+    for name, collect in sources.items():
+        try:
+            results[name] = collect()
+        except Exception as e:
+            print(f"Error collecting metrics from '{name}': {e}")
+            results[name] = {'error': str(e)}
+    return results
+
+
+@metrics_bp.route("/api/metrics")
+def get_metrics():
+    """Trả về thống kê của tiến trình hiện tại (mỗi worker có số liệu riêng)."""
+    return jsonify(collect_all())
@@ -0,0 +1,193 @@
+"""
+Response cache for chatbot prompts.
+
+Replies are cached under a hash of (model, system prompt, normalized user
+message), where normalizing ignores case, repeated whitespace and Vietnamese
+diacritics, so "Tóm tắt  Dế Mèn" and "tom tat de men" share an entry.
+Entries live in Redis (a hash with the reply, generation time and a hit
+counter, expiring after PROMPT_CACHE_TTL) and in a per-process LRU that also
+serves while Redis is unavailable. Concurrent requests for the same prompt
+wait for one upstream call: in-process via single-flight, across workers
+via a short Redis lock.
+
+PROMPT_CACHE=off disables it; a request can skip it with "bypassCache": true.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from src.api.metrics import register_source
+from src.api.redis_cache import get_redis_client
+from src.database.local_cache import LocalCache
+from src.database.single_flight import SingleFlight, redis_lock, release, wait_for, LOCK_FAILED
+
+PROMPT_CACHE = os.environ.get('PROMPT_CACHE', 'on')
+PROMPT_CACHE_TTL = int(os.environ.get('PROMPT_CACHE_TTL', str(7 * 24 * 3600)))
+PROMPT_CACHE_L1_SIZE = int(os.environ.get('PROMPT_CACHE_L1_SIZE', '512'))
+# How long a worker waits for another worker's upstream call for the same prompt.
+PROMPT_CACHE_LOCK_TIMEOUT = float(os.environ.get('PROMPT_CACHE_LOCK_TIMEOUT', '60'))
+
+# Local entries that report their hit counts in the metrics.
+TOP_ENTRIES = 10
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(message):
+    """Case-, whitespace- and diacritic-insensitive form of a prompt."""
+    text = unicodedata.normalize('NFKD', message.replace('đ', 'd').replace('Đ', 'D'))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _WHITESPACE.sub(' ', text.casefold()).strip()
+
+
+def prompt_cache_disabled():
+    return PROMPT_CACHE == 'off'
+
+
+def prompt_key(model, system_prompt, message):
+    digest = hashlib.sha256(json.dumps([model, system_prompt, normalize(message)], ensure_ascii=False)
+                            .encode('utf-8')).hexdigest()
+    return f"prompt:{digest}"
+
+
+class PromptCache:
+    def __init__(self):
+        # check_interval == ttl: entries have no versions to revalidate, only an age.
+        self._l1 = LocalCache(maxsize=PROMPT_CACHE_L1_SIZE, ttl=PROMPT_CACHE_TTL, check_interval=PROMPT_CACHE_TTL)
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'l1_hits': 0, 'redis_hits': 0, 'misses': 0, 'bypassed': 0,
+                       'coalesced': 0, 'upstream_calls': 0, 'upstream_ms': 0.0, 'saved_ms': 0.0}
+        # key -> {'prompt', 'hits'} for the entries this process has served.
+        self._entries = {}
+
+    def _count(self, **increments):
+        with self._lock:
+            for stat, value in increments.items():
+                self._stats[stat] += value
+
+    def _hit(self, key, entry, source, started):
+        lookup_ms = (time.perf_counter() - started) * 1000
+        self._count(**{f'{source}_hits': 1, 'saved_ms': max(entry['gen_ms'] - lookup_ms, 0.0)})
+        with self._lock:
+            local = self._entries.setdefault(key, {'prompt': entry.get('prompt', ''), 'hits': 0})
+            local['hits'] += 1
+            if len(self._entries) > PROMPT_CACHE_L1_SIZE:
+                del self._entries[min(self._entries, key=lambda k: self._entries[k]['hits'])]
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                redis_client.hincrby(key, 'hits', 1)
+            except Exception as e:
+                print(f"Error counting prompt cache hit: {e}")
+        return entry['reply']
+
+    def lookup(self, key):
+        """The cached entry {'reply', 'gen_ms', 'prompt'} for a key, or None."""
+        entry, _ = self._l1.get(key)
+        if entry is not None:
+            return entry.value
+        redis_client = get_redis_client()
+        if not redis_client:
+            return None
+        try:
+            stored = redis_client.hgetall(key)
+        except Exception as e:
+            print(f"Error reading prompt cache: {e}")
+            return None
+        if not stored or b'reply' not in stored:
+            return None
+        value = {'reply': stored[b'reply'].decode('utf-8'), 'gen_ms': float(stored.get(b'gen_ms', 0)),
+                 'prompt': stored.get(b'prompt', b'').decode('utf-8')}
+        self._l1.put(key, value, {}, size=len(stored[b'reply']))
+        return {**value, 'source': 'redis'}
+
+    def store(self, key, message, reply, gen_ms):
+        """Caches the reply of an upstream call that took gen_ms."""
+        self._count(upstream_calls=1, upstream_ms=gen_ms)
+        value = {'reply': reply, 'gen_ms': gen_ms, 'prompt': normalize(message)[:80]}
+        self._l1.put(key, value, {}, size=len(reply.encode('utf-8')))
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                pipe = redis_client.pipeline()
+                pipe.hset(key, mapping={**value, 'hits': 0})
+                pipe.expire(key, PROMPT_CACHE_TTL)
+                pipe.execute()
+            except Exception as e:
+                print(f"Error updating prompt cache: {e}")
+
+    def get(self, key):
+        """The cached reply for a key, counting the hit, or None."""
+        started = time.perf_counter()
+        self._count(lookups=1)
+        entry = self.lookup(key)
+        if entry is None:
+            self._count(misses=1)
+            return None
+        return self._hit(key, entry, entry.get('source', 'l1'), started)
+
+    def get_or_generate(self, key, message, generate, bypass=False):
+        """
+        Returns (reply, cached). On a miss, generate() makes the upstream call;
+        concurrent callers with the same key share it.
+        """
+        if bypass or prompt_cache_disabled():
+            self._count(bypassed=1)
+            return generate(), False
+        reply = self.get(key)
+        if reply is not None:
+            return reply, True
+
+        def call():
+            lock = None
+            redis_client = get_redis_client()
+            if redis_client:
+                lock = redis_lock(redis_client, key, PROMPT_CACHE_LOCK_TIMEOUT)
+                if lock is LOCK_FAILED:
+                    # Redis is failing: call upstream rather than wait on it.
+                    lock = None
+                elif lock is None:
+                    # Another worker is generating this reply.
+                    entry = wait_for(lambda: self.lookup(key), PROMPT_CACHE_LOCK_TIMEOUT)
+                    if entry is not None:
+                        return entry['reply'], True
+            try:
+                started = time.perf_counter()
+                reply = generate()
+                gen_ms = (time.perf_counter() - started) * 1000
+                if reply:
+                    self.store(key, message, reply, gen_ms)
+                return reply, False
+            finally:
+                if lock is not None:
+                    release(lock)
+
+        (reply, shared), leader = self._flights.do(key, call)
+        if not leader or shared:
+            self._count(coalesced=1)
+            return reply, True
+        return reply, False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            top = sorted(self._entries.items(), key=lambda item: -item[1]['hits'])[:TOP_ENTRIES]
+        hits = stats['l1_hits'] + stats['redis_hits']
+        return {
+            **stats,
+            'upstream_ms': round(stats['upstream_ms'], 1),
+            'saved_ms': round(stats['saved_ms'], 1),
+            'enabled': not prompt_cache_disabled(),
+            'hit_ratio': round(hits / stats['lookups'], 4) if stats['lookups'] else None,
+            'top_entries': [{'key': key[-12:], **entry} for key, entry in top],
+            'l1': self._l1.stats(),
+        }
+
+
+prompt_cache = PromptCache()
+register_source('prompt_cache', prompt_cache.stats)
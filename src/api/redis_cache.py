@@ -1,55 +1,199 @@
-import redis
 import os
-from urllib.parse import urlparse
+import threading
+import time
+
+import redis
+from redis.backoff import EqualJitterBackoff
+from redis.retry import Retry
+
+from src.api.metrics import register_source
+from src.lazy import on_warmup
+
+# Connection settings. REDIS_URL may use rediss:// for TLS (as Render provides).
+# Each gunicorn worker has its own pool, so REDIS_MAX_CONNECTIONS only needs to
+# cover the threads of one worker (plus the metadata pub/sub subscriber).
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', '16'))
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', '0.5'))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '0.5'))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', '1'))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+REDIS_RETRIES = int(os.environ.get('REDIS_RETRIES', '1'))
+
+# Circuit breaker: after REDIS_BREAKER_THRESHOLD consecutive failures Redis is
+# skipped for REDIS_BREAKER_RESET seconds, then a single probe decides.
+REDIS_BREAKER_THRESHOLD = int(os.environ.get('REDIS_BREAKER_THRESHOLD', '5'))
+REDIS_BREAKER_RESET = float(os.environ.get('REDIS_BREAKER_RESET', '30'))
+
+# Errors that mean Redis itself is unhealthy (as opposed to e.g. a bad command).
+REDIS_FAILURES = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, TimeoutError, OSError)
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; open -> half_open
+    once `reset_timeout` has passed, letting one probe through; the probe's
+    outcome closes or re-opens it.
+    """
+
+    def __init__(self, threshold=REDIS_BREAKER_THRESHOLD, reset_timeout=REDIS_BREAKER_RESET, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._stats = {'trips': 0, 'rejected': 0, 'failures': 0, 'probes': 0}
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            # A probe that never reports back does not keep the breaker half-open forever.
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                self.state, self._opened_at = 'half_open', self._clock()
+                self._stats['probes'] += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self._failures = 'closed', 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._stats['failures'] += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self._failures >= self.threshold):
+                if self.state == 'closed':
+                    self._stats['trips'] += 1
+                self.state, self._opened_at = 'open', self._clock()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'state': self.state, 'consecutive_failures': self._failures}
+
+
+breaker = CircuitBreaker()
+
+
+class GuardedRedis(redis.Redis):
+    """A Redis client that reports the outcome of every command (and pipeline) to the breaker."""
+
+    def execute_command(self, *args, **options):
+        return _guarded(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+        pipe.execute = lambda *args, **kwargs: _guarded(execute, *args, **kwargs)
+        return pipe
+
+
+def _guarded(call, *args, **kwargs):
+    try:
+        result = call(*args, **kwargs)
+    except REDIS_FAILURES:
+        breaker.record_failure()
+        raise
+    except Exception:
+        # Redis answered (e.g. with a ResponseError), so it is reachable.
+        breaker.record_success()
+        raise
+    breaker.record_success()
+    return result
+
 
 # Singleton instance to hold the Redis connection
 redis_client = None
+_pool = None
+_client_lock = threading.Lock()
+_warned_disabled = False
+
+
+def redis_enabled():
+    return bool(os.getenv('REDIS_URL'))
+
+
+def _create_client():
+    global _pool
+    redis_url = os.getenv('REDIS_URL')
+    _pool = redis.BlockingConnectionPool.from_url(
+        redis_url,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        # How long a thread waits for a free connection before giving up.
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(EqualJitterBackoff(cap=0.2, base=0.02), REDIS_RETRIES),
+    )
+    return GuardedRedis(connection_pool=_pool)
+
 
 def get_redis_client():
     """
-    Establishes and returns a Redis client instance.
-    It uses a singleton pattern to avoid creating multiple connections.
+    Returns the shared Redis client, or None when Redis is not configured or
+    the circuit breaker is open. Callers treat None as a cache miss and read
+    from the local cache or Firestore instead.
     """
-    global redis_client
+    global redis_client, _warned_disabled
+    if not redis_enabled():
+        if not _warned_disabled:
+            print("REDIS_URL environment variable not set. Redis cache is disabled.")
+            _warned_disabled = True
+        return None
+    if not breaker.allow():
+        return None
     if redis_client:
         return redis_client
 
-    # Get the Redis URL from the environment variable provided by Render
-    redis_url = os.getenv('REDIS_URL')
+    with _client_lock:
+        if redis_client is None:
+            try:
+                # The pool connects lazily; failures surface (and trip the breaker) on first use.
+                redis_client = _create_client()
+            except Exception as e:
+                print(f"An unexpected error occurred when connecting to Redis: {e}")
+                breaker.record_failure()
+                return None
+    return redis_client
 
-    if not redis_url:
-        print("REDIS_URL environment variable not set. Redis cache is disabled.")
-        return None
 
-    try:
-        # Parse the Redis URL
-        url = urlparse(redis_url)        
-        # Create a Redis client instance. Render provides SSL-enabled Redis.
-        redis_client = redis.Redis(
-            host=url.hostname,
-            port=url.port,
-            password=url.password
-        )               
-        print("Successfully connected to Redis on Render!")
-        return redis_client
+def create_pubsub():
+    """
+    A PubSub on its own connection without a read timeout, for long-lived
+    subscribers (a socket timeout would end every idle listen()). It
+    bypasses the breaker; subscribers reconnect with their own backoff.
+    """
+    client = redis.Redis.from_url(
+        os.getenv('REDIS_URL'),
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    )
+    return client.pubsub(ignore_subscribe_messages=True)
 
-    except redis.exceptions.ConnectionError as e:
-        print(f"Failed to connect to Redis: {e}")
-        redis_client = None
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred when connecting to Redis: {e}")
-        redis_client = None
-        return None
 
-# Example of how to use the client:
-#
-# from .redis_cache import get_redis_client
-#
-# def my_function():
-#     r = get_redis_client()
-#     if r:
-#         r.set('mykey', 'Hello Redis!')
-#         value = r.get('mykey')
-#         print(value)
+def pool_stats():
+    pool = _pool
+    if pool is None:
+        return {'created': 0, 'in_use': 0, 'max_connections': REDIS_MAX_CONNECTIONS}
+    created = len(pool._connections)
+    idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return {'created': created, 'in_use': created - idle, 'max_connections': pool.max_connections}
+
+
+def stats():
+    return {'enabled': redis_enabled(), 'breaker': breaker.stats(), 'pool': pool_stats()}
+
+
+def _warm_up():
+    """Opens the first pooled connection ahead of the first request."""
+    client = get_redis_client()
+    if client is not None:
+        client.ping()
+
 
+register_source('redis', stats)
+on_warmup('redis', _warm_up)
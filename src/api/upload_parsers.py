@@ -0,0 +1,75 @@
+# src/api/upload_parsers.py
+
+"""
+Đọc dần (streaming) các file upload lớn thay vì nạp toàn bộ vào bộ nhớ.
+Mỗi hàm nhận một stream nhị phân và yield từng dòng dữ liệu dạng dict.
+"""
+import codecs
+import csv
+import io
+import json
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yields the elements of a top-level JSON array while reading the stream chunk by chunk."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, eof = '', False
+    # 'start' -> expecting '[', 'first' -> value or ']', 'value' -> value, 'separator' -> ',' or ']'
+    state = 'start'
+
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            if state == 'start':
+                if buffer[0] != '[':
+                    raise ValueError("Expected a JSON array")
+                buffer, state = buffer[1:], 'first'
+                continue
+            if state in ('first', 'separator') and buffer[0] == ']':
+                return
+            if state == 'separator':
+                if buffer[0] != ',':
+                    raise ValueError("Expected ',' between array elements")
+                buffer, state = buffer[1:], 'value'
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Malformed JSON: {e}")
+            else:
+                # A value that ends exactly at the buffer end may be a truncated number.
+                if end < len(buffer) or eof:
+                    yield item
+                    buffer, state = buffer[end:], 'separator'
+                    continue
+
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        chunk = stream.read(chunk_size)
+        if chunk:
+            buffer += text_decoder.decode(chunk)
+        else:
+            buffer += text_decoder.decode(b'', final=True)
+            eof = True
+
+
+def iter_ndjson(stream):
+    """Yields one JSON value per non-empty line (NDJSON / JSON Lines)."""
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8-sig'), start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Malformed JSON on line {line_number}: {e}")
+
+
+def iter_csv(stream):
+    """Yields each CSV row as a dict keyed by the header row."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield {key.strip(): value.strip() if isinstance(value, str) else value
+               for key, value in row.items() if key}
@@ -0,0 +1,131 @@
+import click
+from flask.cli import AppGroup
+from src.database.rollups import Rollup
+from src.database.savings_index import SavingsIndex
+from src.database.record_store import RecordStore
+from src.database.tree_index import TreeIndex
+from src.database.firestore_queries import Loan
+from src.database.chat_history import ChatHistory
+
+# === ROLLUP COMMANDS ===
+# Usage: flask --app main rollups verify [--year 2025]
+#        flask --app main rollups rebuild [--year 2025]
+rollups_cli = AppGroup('rollups', help='Maintain the dashboard rollup documents.')
+
+
+def _print_drift_report(report):
+    if not report:
+        click.echo("No drift found.")
+        return
+    for doc_id, drift in sorted(report.items()):
+        click.echo(f"rollups/{doc_id}:")
+        for item in drift:
+            click.echo(f"  {item['field']}: stored={item['stored']} expected={item['expected']}")
+
+
+@rollups_cli.command('verify')
+@click.option('--year', 'years', multiple=True, help='Year to check (repeatable). Defaults to all years.')
+def verify_rollups(years):
+    """Recomputes rollups from raw records and reports drift without writing."""
+    report = Rollup.rebuild(years=years, apply=False)
+    _print_drift_report(report)
+
+
+@rollups_cli.command('rebuild')
+@click.option('--year', 'years', multiple=True, help='Year to rebuild (repeatable). Defaults to all years.')
+def rebuild_rollups(years):
+    """Recomputes rollups from raw records, overwrites the stored documents and marks the years complete."""
+    report = Rollup.rebuild(years=years, apply=True)
+    _print_drift_report(report)
+    click.echo("Rollups rebuilt.")
+
+
+# === SAVINGS INDEX COMMANDS ===
+# Usage: flask --app main savings rebuild
+savings_cli = AppGroup('savings', help='Maintain the savings ledger index.')
+
+
+@savings_cli.command('rebuild')
+def rebuild_savings_index():
+    """Rebuilds the savings index and its aggregate document from raw records."""
+    count = SavingsIndex.rebuild()
+    click.echo(f"Indexed {count} deposits.")
+
+
+# === RECORD STORAGE COMMANDS ===
+# Usage: RECORD_STORAGE=dual flask --app main records migrate [--restart]
+#        flask --app main records status
+records_cli = AppGroup('records', help='Migrate management records to per-record documents.')
+
+
+@records_cli.command('migrate')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and start from the first Types document.')
+def migrate_records(restart):
+    """Moves `records` arrays into per-record documents (resumable)."""
+    status = RecordStore.migrate(restart=restart, log=click.echo)
+    click.echo(f"Migrated {status.get('migrated_records', 0)} records from {status.get('migrated_types', 0)} type documents.")
+
+
+@records_cli.command('status')
+def migration_status():
+    """Shows the progress of the record migration."""
+    status = RecordStore.migration_status()
+    if not status:
+        click.echo("Migration has not started.")
+        return
+    state = 'completed' if status.get('done') else f"in progress (last: {status.get('last_path')})"
+    click.echo(f"Migration {state}: {status.get('migrated_records', 0)} records, {status.get('migrated_types', 0)} type documents.")
+
+
+# === TREE INDEX COMMANDS ===
+# Usage: flask --app main tree repair [--dry-run]
+tree_cli = AppGroup('tree', help='Maintain the Year -> Month tree index.')
+
+
+@tree_cli.command('repair')
+@click.option('--dry-run', is_flag=True, help='Only report differences, do not write the index.')
+def repair_tree_index(dry_run):
+    """Rebuilds the tree index from the real Year/Months hierarchy."""
+    drift = TreeIndex.repair(apply=not dry_run)
+    if not drift:
+        click.echo("No drift found.")
+    for year, month, stored, actual in drift:
+        label = f"{year}-{month}" if month else year
+        click.echo(f"  {label}: stored={stored} actual={actual}")
+    if not dry_run:
+        click.echo("Tree index rebuilt.")
+
+
+# === LOAN COMMANDS ===
+# Usage: flask --app main loans backfill-totals [--dry-run]
+loans_cli = AppGroup('loans', help='Maintain the denormalized loan payment totals.')
+
+
+@loans_cli.command('backfill-totals')
+@click.option('--dry-run', is_flag=True, help='Only report differences, do not write the loans.')
+def backfill_loan_totals(dry_run):
+    """Recomputes each loan's payment totals from its repayments."""
+    drift = Loan.backfill_payment_totals(apply=not dry_run)
+    if not drift:
+        click.echo("No drift found.")
+    for loan_id, field, stored, actual in drift:
+        click.echo(f"  {loan_id} {field}: stored={stored} actual={actual}")
+    if not dry_run:
+        click.echo("Loan totals updated and marked complete.")
+
+
+# === CHAT HISTORY COMMANDS ===
+# Usage: flask --app main chat archive [--older-than-days 90] [--dry-run]
+chat_cli = AppGroup('chat', help='Maintain the chatbot conversation history.')
+
+
+@chat_cli.command('archive')
+@click.option('--older-than-days', default=90, show_default=True, help='Archive conversations older than this.')
+@click.option('--dry-run', is_flag=True, help='Only count what would be archived.')
+def archive_chat_history(older_than_days, dry_run):
+    """Moves old conversations into per-month bundle documents."""
+    archived = ChatHistory.archive(older_than_days=older_than_days, apply=not dry_run, log=click.echo)
+    if not archived:
+        click.echo("Nothing to archive.")
+    for month, count in sorted(archived.items()):
+        click.echo(f"  {month}: {count} conversations")
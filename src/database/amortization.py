@@ -0,0 +1,170 @@
+"""
+Vectorized amortization schedules for all loans at once.
+
+Every loan follows the linear recurrence b[t] = b[t-1] * g - pay[t], with
+g = 1 + monthly rate for annuity loans (interest is part of the payment) and
+g = 1 for equal-principal loans (pay is the principal part only). Unrolled,
+b[t] = g^t * (b[0] - sum_{s<=t} pay[s] * g^-s), so the balances of every loan
+in every period come out of one cumulative sum over a (loans x periods)
+matrix, prepayments included, with no loop over loans or periods.
+
+Loan documents carry `outstanding`, `term` (months), `startDate` and
+optionally `rate` (annual %, like savings deposits) and `repaymentMethod`
+('annuity' or 'equal_principal').
+"""
+from datetime import datetime
+
+import numpy as np
+
+ANNUITY, EQUAL_PRINCIPAL = 'annuity', 'equal_principal'
+METHODS = (ANNUITY, EQUAL_PRINCIPAL)
+# A balance below this fraction of the opening balance counts as paid off.
+PAYOFF_TOLERANCE = 1e-9
+
+
+def _month_index(date):
+    return date.year * 12 + date.month - 1
+
+
+def _month_label(index):
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def _annual_rate(loan):
+    rate = loan.get('rate', loan.get('interestRate'))
+    try:
+        return float(rate or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def loan_terms(loan, as_of=None, method=None):
+    """
+    The inputs of a loan's remaining schedule as of `as_of` (default now):
+    {'balance', 'annual_rate', 'periods', 'method', 'first_due'}, where
+    first_due is the month index of the next payment. Remaining periods count
+    from the start date; a loan past its term is repaid in one period.
+    """
+    as_of = as_of or datetime.utcnow()
+    start = loan.get('startDate')
+    elapsed = _month_index(as_of) - _month_index(start) if isinstance(start, datetime) else 0
+    try:
+        term = int(loan.get('term') or 0)
+    except (TypeError, ValueError):
+        term = 0
+    method = method or loan.get('repaymentMethod') or ANNUITY
+    if method not in METHODS:
+        raise ValueError(f"Unknown repayment method: {method}")
+    return {
+        'balance': max(float(loan.get('outstanding') or 0), 0.0),
+        'annual_rate': _annual_rate(loan),
+        'periods': max(term - elapsed, 1),
+        'method': method,
+        'first_due': _month_index(as_of) + 1,
+    }
+
+
+class Schedules:
+    """
+    Per-period payment, principal, interest and closing balance of many
+    loans as (loans x periods) arrays, plus each loan's payoff period
+    (1-based, 0 for a loan with nothing outstanding).
+    """
+
+    def __init__(self, balance, principal, interest, payoff_period):
+        self.balance = balance
+        self.principal = principal
+        self.interest = interest
+        self.payment = principal + interest
+        self.payoff_period = payoff_period
+
+    @property
+    def total_interest(self):
+        return self.interest.sum(axis=1)
+
+    def rows(self, i, first_due):
+        """The schedule of loan i as a list of dicts, one per period until payoff."""
+        return [
+            {
+                'period': t + 1,
+                'month': _month_label(first_due + t),
+                'payment': float(self.payment[i, t]),
+                'principal': float(self.principal[i, t]),
+                'interest': float(self.interest[i, t]),
+                'balance': float(self.balance[i, t]),
+            }
+            for t in range(int(self.payoff_period[i]))
+        ]
+
+
+def build_schedules(balances, annual_rates, periods, methods, extra_payment=0.0, lump_sums=None):
+    """
+    Schedules for many loans at once. `balances`, `annual_rates` (%),
+    `periods` and `methods` are per loan; `extra_payment` is added to every
+    regular payment and `lump_sums` maps a 1-based period to a one-off
+    prepayment (scalars apply to all loans, arrays per loan). Prepayments
+    keep the regular payment and shorten the term.
+    """
+    balances = np.asarray(balances, dtype=np.float64)
+    periods = np.asarray(periods, dtype=np.int64)
+    n_loans = len(balances)
+    horizon = int(periods.max()) if n_loans else 0
+    if horizon == 0:
+        empty = np.zeros((n_loans, 0))
+        return Schedules(empty, empty, empty, np.zeros(n_loans, dtype=np.int64))
+
+    r = np.asarray(annual_rates, dtype=np.float64) / 1200.0
+    annuity = np.asarray(methods) == ANNUITY
+    t = np.arange(1, horizon + 1)
+
+    # Regular payment: the level annuity payment, or the fixed principal part.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        level = np.where(r > 0, balances * r / (1 - (1 + r) ** -periods), balances / periods)
+    regular = np.where(annuity, level, balances / periods)
+    pay = np.broadcast_to((regular + np.broadcast_to(extra_payment, n_loans))[:, None], (n_loans, horizon)).copy()
+    for period, amount in (lump_sums or {}).items():
+        if 1 <= period <= horizon:
+            pay[:, period - 1] += amount
+
+    g = np.where(annuity, 1 + r, 1.0)[:, None]
+    growth = g ** t
+    raw = growth * (balances[:, None] - np.cumsum(pay / growth, axis=1))
+
+    # Paid off once the balance reaches zero, and at the latest at the end of the term.
+    paid = (raw <= PAYOFF_TOLERANCE * balances[:, None]) | (t >= periods[:, None])
+    balance = np.where(paid, 0.0, raw)
+    balance = np.where(np.maximum.accumulate(paid, axis=1), 0.0, balance)
+    opening = np.hstack([balances[:, None], balance[:, :-1]])
+    principal = opening - balance
+    interest = opening * r[:, None]
+    payoff_period = np.where(balances > 0, paid.argmax(axis=1) + 1, 0)
+    return Schedules(balance, principal, interest, payoff_period)
+
+
+def project_portfolio(schedules, first_dues):
+    """
+    Totals across loans per calendar month: [{'month', 'payment', 'principal',
+    'interest', 'balance'}], where balance is the portfolio outstanding at
+    the end of the month.
+    """
+    first_dues = np.asarray(first_dues, dtype=np.int64)
+    n_loans, horizon = schedules.payment.shape
+    if n_loans == 0 or horizon == 0:
+        return []
+    base = int(first_dues.min())
+    columns = (first_dues - base)[:, None] + np.arange(horizon)
+    width = int(columns.max()) + 1
+    active = np.arange(horizon) < schedules.payoff_period[:, None]
+    totals = {}
+    for field in ('payment', 'principal', 'interest', 'balance'):
+        sums = np.zeros(width)
+        np.add.at(sums, columns[active], getattr(schedules, field)[active])
+        totals[field] = sums
+    return [
+        {'month': _month_label(base + k), **{field: float(values[k]) for field, values in totals.items()}}
+        for k in range(width)
+    ]
+
+
+def payoff_month(terms, payoff_period):
+    return _month_label(terms['first_due'] + int(payoff_period) - 1) if payoff_period else None
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+import numpy as np
+from .firebase_config import db
+from .rollups import TYPE_FIELDS, record_amount
+from .record_store import RecordStore
+from .metadata_watcher import watcher as metadata_watcher
+
+# Set ANALYTICS_ENGINE=columnar to serve the dashboard from the in-memory engine
+# instead of Firestore rollups / record scans.
+ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'firestore')
+# How often (seconds) the engine re-reads metadata/Year to look for changed months.
+REFRESH_INTERVAL = float(os.environ.get('ANALYTICS_REFRESH_INTERVAL', '5'))
+
+METADATA_COLLECTION = 'Year'
+
+
+def is_enabled():
+    return ANALYTICS_ENGINE == 'columnar'
+
+
+class Interner:
+    """Maps strings to stable integer codes so they can be stored in typed arrays."""
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class ColumnarSnapshot:
+    """
+    An immutable, column-oriented copy of every transaction record:
+    parallel typed arrays of year, month, type code, category code and amount.
+    """
+
+    def __init__(self, year, month, type_code, category_code, amount, types, categories):
+        self.year = year
+        self.month = month
+        self.type_code = type_code
+        self.category_code = category_code
+        self.amount = amount
+        self.types = types
+        self.categories = categories
+
+    @classmethod
+    def from_rows(cls, rows, types=None, categories=None):
+        """Builds a snapshot from (year, month, type_id, record) tuples."""
+        types = types or Interner()
+        categories = categories or Interner()
+        years, months, type_codes, category_codes, amounts = [], [], [], [], []
+        for year, month, type_id, record in rows:
+            amount = record_amount(record)
+            if amount is None:
+                continue
+            years.append(int(year))
+            months.append(int(month))
+            type_codes.append(types.code(type_id))
+            category_codes.append(categories.code(record.get('name') or ''))
+            amounts.append(amount)
+        return cls(
+            np.array(years, dtype=np.int16),
+            np.array(months, dtype=np.int8),
+            np.array(type_codes, dtype=np.int16),
+            np.array(category_codes, dtype=np.int32),
+            np.array(amounts, dtype=np.float64),
+            types,
+            categories,
+        )
+
+    def replace_months(self, month_keys, rows):
+        """Returns a new snapshot where the given (year, month) pairs are replaced by `rows`."""
+        keep = np.ones(len(self.amount), dtype=bool)
+        for year, month in month_keys:
+            keep &= ~((self.year == int(year)) & (self.month == int(month)))
+        fresh = ColumnarSnapshot.from_rows(rows, self.types, self.categories)
+        return ColumnarSnapshot(
+            np.concatenate([self.year[keep], fresh.year]),
+            np.concatenate([self.month[keep], fresh.month]),
+            np.concatenate([self.type_code[keep], fresh.type_code]),
+            np.concatenate([self.category_code[keep], fresh.category_code]),
+            np.concatenate([self.amount[keep], fresh.amount]),
+            self.types,
+            self.categories,
+        )
+
+    def __len__(self):
+        return len(self.amount)
+
+    # --- vectorized queries ---
+
+    def _mask(self, year=None, month=None, type_id=None):
+        mask = np.ones(len(self.amount), dtype=bool)
+        if year is not None:
+            mask &= self.year == int(year)
+        if month is not None:
+            mask &= self.month == int(month)
+        if type_id is not None:
+            code = self.types.codes.get(type_id)
+            if code is None:
+                return np.zeros(len(self.amount), dtype=bool)
+            mask &= self.type_code == code
+        return mask
+
+    def totals_by_type(self, year=None, month=None):
+        """Returns {type_id: total} for the selected period."""
+        mask = self._mask(year, month)
+        sums = np.bincount(self.type_code[mask], weights=self.amount[mask], minlength=len(self.types.names))
+        return {name: float(sums[code]) for code, name in enumerate(self.types.names)}
+
+    def summary(self, year=None, month=None):
+        totals = self.totals_by_type(year, month)
+        return {field: totals.get(type_id, 0.0) for type_id, field in TYPE_FIELDS.items()}
+
+    def category_breakdown(self, year=None, month=None, type_id='Chi'):
+        """Returns {category: total} for one type, skipping empty category names."""
+        mask = self._mask(year, month, type_id)
+        sums = np.bincount(self.category_code[mask], weights=self.amount[mask], minlength=len(self.categories.names))
+        present = np.bincount(self.category_code[mask], minlength=len(self.categories.names)) > 0
+        return {
+            self.categories.names[code]: float(sums[code])
+            for code in np.flatnonzero(present)
+            if self.categories.names[code]
+        }
+
+    def top_categories(self, n=5, year=None, month=None, type_id='Chi'):
+        breakdown = self.category_breakdown(year, month, type_id)
+        names = np.array(list(breakdown.keys()), dtype=object)
+        values = np.array(list(breakdown.values()), dtype=np.float64)
+        order = np.argsort(-values, kind='stable')[:n]
+        return [{'name': names[i], 'value': float(values[i])} for i in order]
+
+    def monthly_series(self, years, type_id):
+        """Returns a (len(years), 12) matrix of monthly totals for one type, years ascending."""
+        years = np.array(sorted(int(year) for year in years), dtype=np.int64)
+        series = np.zeros((len(years), 12), dtype=np.float64)
+        if not len(years):
+            return series
+        mask = self._mask(type_id=type_id) & np.isin(self.year, years)
+        rows = np.searchsorted(years, self.year[mask])
+        flat_index = rows * 12 + (self.month[mask].astype(np.int64) - 1)
+        sums = np.bincount(flat_index, weights=self.amount[mask], minlength=len(years) * 12)
+        return sums.reshape(len(years), 12)
+
+    def trend(self, years):
+        """Monthly income/expense/savings series for several years."""
+        years = sorted((str(year) for year in years), key=int)
+        return {
+            'years': years,
+            **{field: self.monthly_series(years, type_id).tolist() for type_id, field in TYPE_FIELDS.items()},
+        }
+
+    def rolling_average(self, years, type_id='Chi', window=3):
+        """Rolling mean over the concatenated monthly series of the given years."""
+        years = sorted((str(year) for year in years), key=int)
+        flat = self.monthly_series(years, type_id).ravel()
+        if window <= 0 or len(flat) < window:
+            return []
+        cumulative = np.cumsum(np.insert(flat, 0, 0.0))
+        averages = (cumulative[window:] - cumulative[:-window]) / window
+        labels = [f"{year}-{str(month).zfill(2)}" for year in years for month in range(1, 13)][window - 1:]
+        return [{'period': label, 'value': float(value)} for label, value in zip(labels, averages)]
+
+
+class AnalyticsEngine:
+    """
+    Holds the current ColumnarSnapshot. The snapshot is loaded once, then kept
+    fresh by comparing metadata/Year month versions (at most every
+    REFRESH_INTERVAL seconds) and reloading only the months that changed.
+    Callers that cache or ETag the result under the versions they read pass
+    verify=True: the snapshot is then checked against metadata/Year unless
+    the watcher vouches for its version.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._version = None
+        self._month_versions = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_metadata():
+        data = metadata_watcher.current(METADATA_COLLECTION)
+        if data is None:
+            doc = db.collection('metadata').document(METADATA_COLLECTION).get()
+            data = doc.to_dict() if doc.exists else {}
+        return data.get('version'), data.get('months', {})
+
+    def _load_all(self):
+        version, month_versions = self._read_metadata()
+        # RecordStore.iter_all reads every record with collection-group queries.
+        snapshot = ColumnarSnapshot.from_rows(RecordStore.iter_all())
+        return snapshot, version, month_versions
+
+    def _load_months(self, keys):
+        rows = []
+        for key in keys:
+            year, month = key.split('-', 1)
+            _, month_records = RecordStore.read_month(year, month, fields=('name', 'amount'))
+            rows.extend((year, month, type_id, record) for type_id, records in month_records.items() for record in records)
+        return rows
+
+    def refresh(self, force=False, verify=False):
+        """Loads or incrementally refreshes the snapshot if metadata changed."""
+        with self._lock:
+            now = time.monotonic()
+            # A version pushed to the metadata watcher skips the wait, so results
+            # cached or ETagged under that version are computed from it.
+            pushed = metadata_watcher.current_version(METADATA_COLLECTION)
+            if not force and self._snapshot is not None:
+                if pushed is not None and pushed == self._version:
+                    return self._snapshot
+                # Without a pushed version, only unverified callers may skip the read.
+                if pushed is None and not verify and now - self._checked_at < self.refresh_interval:
+                    return self._snapshot
+
+            if self._snapshot is None or force:
+                self._snapshot, self._version, self._month_versions = self._load_all()
+            else:
+                version, month_versions = self._read_metadata()
+                if version != self._version:
+                    changed = [key for key, value in month_versions.items() if self._month_versions.get(key) != value]
+                    if changed:
+                        month_pairs = [key.split('-', 1) for key in changed]
+                        self._snapshot = self._snapshot.replace_months(month_pairs, self._load_months(changed))
+                    self._version, self._month_versions = version, month_versions
+            self._checked_at = now
+            return self._snapshot
+
+    def snapshot(self, verify=False):
+        return self.refresh(verify=verify)
+
+
+engine = AnalyticsEngine()
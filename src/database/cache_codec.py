@@ -0,0 +1,192 @@
+"""
+Encoding of cached JSON responses (cached_query) in L1 and Redis, and of
+the plain Python values cached by `cached` (encode_value / decode_value).
+
+A payload is one tag byte followed by the body:
+    b'J' JSON text               b'G' gzip-compressed JSON text
+    b'M' msgpack                 b'Z' zlib-compressed msgpack
+Entries written before the tag existed are plain JSON text and still decode.
+
+CACHE_CODEC picks how new entries are written: 'json' (the default) stores
+JSON and gzips it once it reaches CACHE_COMPRESS_MIN_BYTES; 'msgpack' needs
+the optional msgpack package and falls back to 'json' without it. JSON
+payloads can be sent as the HTTP body as they are, gzip ones even without
+decompressing when the client accepts gzip.
+"""
+import base64
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+from flask import current_app, has_request_context, request
+
+from src.api.metrics import register_source
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CACHE_CODEC = os.environ.get('CACHE_CODEC', 'json')
+CACHE_COMPRESS_MIN_BYTES = int(os.environ.get('CACHE_COMPRESS_MIN_BYTES', '1024'))
+CACHE_COMPRESS_LEVEL = int(os.environ.get('CACHE_COMPRESS_LEVEL', '6'))
+
+JSON, GZIP_JSON, MSGPACK, ZLIB_MSGPACK = b'J', b'G', b'M', b'Z'
+
+
+class CodecStats:
+    """Encode/decode counts and timings, and the stored size of each cache key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'encodes': 0, 'encode_ms': 0.0, 'decodes': 0, 'decode_ms': 0.0,
+                       'passthrough': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+        self._key_bytes = {}
+
+    def encoded(self, key, raw_size, stored_size, seconds):
+        with self._lock:
+            self._stats['encodes'] += 1
+            self._stats['encode_ms'] += seconds * 1000
+            self._stats['raw_bytes'] += raw_size
+            self._stats['stored_bytes'] += stored_size
+            self._key_bytes[key] = stored_size
+
+    def decoded(self, seconds, passthrough=False):
+        with self._lock:
+            self._stats['passthrough' if passthrough else 'decodes'] += 1
+            self._stats['decode_ms'] += seconds * 1000
+
+    def stats(self):
+        with self._lock:
+            raw, stored = self._stats['raw_bytes'], self._stats['stored_bytes']
+            return {
+                **self._stats,
+                'encode_ms': round(self._stats['encode_ms'], 3),
+                'decode_ms': round(self._stats['decode_ms'], 3),
+                'codec': _codec_name(),
+                'compression_ratio': round(stored / raw, 4) if raw else None,
+                'bytes_per_key': dict(self._key_bytes),
+            }
+
+
+codec_stats = CodecStats()
+register_source('cache_codec', codec_stats.stats)
+
+
+def _codec_name():
+    return 'msgpack' if CACHE_CODEC == 'msgpack' and msgpack is not None else 'json'
+
+
+def encode(json_text, key):
+    """Encodes a JSON response body (str or bytes) for the cache entry `key`."""
+    start = time.perf_counter()
+    raw = json_text.encode('utf-8') if isinstance(json_text, str) else json_text
+    if _codec_name() == 'msgpack':
+        body = msgpack.packb(json.loads(raw), use_bin_type=True)
+        if len(body) >= CACHE_COMPRESS_MIN_BYTES:
+            payload = ZLIB_MSGPACK + zlib.compress(body, CACHE_COMPRESS_LEVEL)
+        else:
+            payload = MSGPACK + body
+    elif len(raw) >= CACHE_COMPRESS_MIN_BYTES:
+        # mtime=0 keeps the bytes (and so content-hash ETags) identical for identical data.
+        payload = GZIP_JSON + gzip.compress(raw, CACHE_COMPRESS_LEVEL, mtime=0)
+    else:
+        payload = JSON + raw
+    codec_stats.encoded(key, len(raw), len(payload), time.perf_counter() - start)
+    return payload
+
+
+def _json_bytes(payload):
+    tag, body = payload[:1], payload[1:]
+    if tag == JSON:
+        return body
+    if tag == GZIP_JSON:
+        return gzip.decompress(body)
+    if tag == MSGPACK:
+        return json.dumps(msgpack.unpackb(body, raw=False), ensure_ascii=False).encode('utf-8')
+    if tag == ZLIB_MSGPACK:
+        return json.dumps(msgpack.unpackb(zlib.decompress(body), raw=False), ensure_ascii=False).encode('utf-8')
+    # Entries stored before payloads were tagged are plain JSON text.
+    return payload
+
+
+def _accepts_gzip():
+    return has_request_context() and 'gzip' in request.accept_encodings
+
+
+def to_response(payload, status=200):
+    """
+    A JSON response for a payload, as (response, status) like CRUDApi. A gzip
+    payload is sent as is (Content-Encoding: gzip) to clients that accept it.
+    """
+    start = time.perf_counter()
+    compressed = payload[:1] == GZIP_JSON and _accepts_gzip()
+    body = payload[1:] if compressed else _json_bytes(payload)
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # JSON bodies (and gzip ones sent compressed) go out without being decoded.
+    codec_stats.decoded(time.perf_counter() - start, passthrough=compressed or payload[:1] == JSON)
+    return response, status
+
+
+# --- plain Python values (decorators.cached) ---
+# JSON rather than pickle, so a value read back from Redis can never run code.
+# Types JSON lacks are written as single-key objects tagged with one of these.
+_TAGS = ('__datetime__', '__date__', '__tuple__', '__bytes__', '__dict__')
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and not (len(value) == 1 and next(iter(value)) in _TAGS):
+            return {key: _to_json(item) for key, item in value.items()}
+        return {'__dict__': [[_to_json(key), _to_json(item)] for key, item in value.items()]}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, tuple):
+        return {'__tuple__': [_to_json(item) for item in value]}
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if hasattr(value, 'tolist'):
+        # numpy scalars and arrays
+        return _to_json(value.tolist())
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        tag, item = next(iter(value.items()))
+        if tag == '__datetime__':
+            return datetime.datetime.fromisoformat(item)
+        if tag == '__date__':
+            return datetime.date.fromisoformat(item)
+        if tag == '__tuple__':
+            return tuple(_from_json(element) for element in item)
+        if tag == '__bytes__':
+            return base64.b64decode(item)
+        if tag == '__dict__':
+            return {_from_json(key): _from_json(element) for key, element in item}
+    return {key: _from_json(item) for key, item in value.items()}
+
+
+def encode_value(value):
+    """Encodes a cached return value as JSON bytes. Raises TypeError for unsupported types."""
+    return json.dumps(_to_json(value), ensure_ascii=False, allow_nan=True).encode('utf-8')
+
+
+def decode_value(payload):
+    """Decodes encode_value's bytes into a fresh copy of the value."""
+    return _from_json(json.loads(payload))
@@ -0,0 +1,143 @@
+"""
+Chatbot conversation history.
+
+Recent conversations live one per document in `chat_history`. Older ones
+are moved by `ChatHistory.archive` (`flask chat archive`) into per-month
+bundle documents `chat_archive/{YYYY-MM}-{part}`, each holding a
+`messages` array, so the hot collection stays small. A bundle starts a new
+part before it would outgrow ARCHIVE_BUNDLE_BYTES (Firestore caps a
+document at 1 MiB).
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from .firebase_config import db
+from .pagination import paginate
+
+HISTORY_COLLECTION = 'chat_history'
+ARCHIVE_COLLECTION = 'chat_archive'
+HISTORY_FIELDS = ('message', 'reply', 'timestamp')
+
+ARCHIVE_BUNDLE_BYTES = int(os.environ.get('CHAT_ARCHIVE_BUNDLE_BYTES', '800000'))
+# Deletes per batch; the rest of the 500 operations are left for the bundle writes.
+ARCHIVE_BATCH_SIZE = 400
+
+
+def _entry_size(entry):
+    return len(json.dumps(entry, default=str, ensure_ascii=False).encode('utf-8'))
+
+
+def _naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+class ChatHistory:
+    @staticmethod
+    def collection():
+        return db.collection(HISTORY_COLLECTION)
+
+    @staticmethod
+    def get_page(page_size=20, cursor=None, direction='next', fields=None):
+        """
+        A page of conversations, newest first; 'next' pages go back in time.
+        Raises ValueError for an invalid cursor.
+        """
+        return paginate(ChatHistory.collection(), ['-timestamp'], page_size, cursor, direction, fields)
+
+    @staticmethod
+    def stream(fields=None, newest_first=False, limit=None):
+        """Yields conversations as dicts as Firestore returns them, without buffering the collection."""
+        query = ChatHistory.collection()
+        if fields:
+            query = query.select(list(fields))
+        query = query.order_by('timestamp', direction=firestore.Query.DESCENDING if newest_first
+                               else firestore.Query.ASCENDING)
+        if limit:
+            query = query.limit(limit)
+        for doc in query.stream():
+            yield {**doc.to_dict(), 'id': doc.id}
+
+    @staticmethod
+    def get_archive(month):
+        """Archived conversations of a month ('YYYY-MM'), oldest first."""
+        messages = []
+        for bundle in ChatHistory._bundles(month):
+            messages.extend(bundle.get('messages') or [])
+        return sorted(messages, key=lambda entry: (_naive_utc(entry.get('timestamp')) or datetime.min, entry.get('id')))
+
+    @staticmethod
+    def _bundles(month):
+        """The bundle documents of a month, read part by part until the first missing one."""
+        bundles, part = [], 0
+        while True:
+            snapshot = db.collection(ARCHIVE_COLLECTION).document(f"{month}-{part}").get()
+            if not snapshot.exists:
+                return bundles
+            bundles.append(snapshot.to_dict())
+            part += 1
+
+    @staticmethod
+    def archive(older_than_days=90, apply=True, log=print):
+        """
+        Moves conversations older than `older_than_days` into their month's
+        bundle. Each batch appends to the bundles and deletes the originals
+        together, so an interrupted run loses nothing and a rerun continues
+        with what is left. Returns {month: archived_count}.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        query = (ChatHistory.collection()
+                 .where(filter=FieldFilter('timestamp', '<', cutoff))
+                 .order_by('timestamp'))
+        # month -> [part, bytes] of the bundle new entries go to.
+        open_parts = {}
+        archived = {}
+        pending = []
+
+        def flush():
+            if not pending:
+                return
+            batch = db.batch()
+            appends = {}
+            for doc_ref, bundle_id, month, part, entry in pending:
+                appends.setdefault(bundle_id, (month, part, []))[2].append(entry)
+                batch.delete(doc_ref)
+            for bundle_id, (month, part, entries) in appends.items():
+                batch.set(db.collection(ARCHIVE_COLLECTION).document(bundle_id), {
+                    'month': month,
+                    'part': part,
+                    'messages': firestore.ArrayUnion(entries),
+                    'count': firestore.Increment(len(entries)),
+                    'bytes': firestore.Increment(sum(_entry_size(entry) for entry in entries)),
+                }, merge=True)
+            batch.commit()
+            log(f"Archived {len(pending)} conversations into {', '.join(sorted(appends))}")
+            pending.clear()
+
+        for doc in query.stream():
+            data = doc.to_dict()
+            timestamp = _naive_utc(data.get('timestamp'))
+            month = timestamp.strftime('%Y-%m')
+            entry = {**{field: data.get(field) for field in HISTORY_FIELDS}, 'id': doc.id}
+            archived[month] = archived.get(month, 0) + 1
+            if not apply:
+                continue
+
+            if month not in open_parts:
+                bundles = ChatHistory._bundles(month)
+                open_parts[month] = [max(len(bundles) - 1, 0), bundles[-1].get('bytes', 0) if bundles else 0]
+            size = _entry_size(entry)
+            if open_parts[month][1] and open_parts[month][1] + size > ARCHIVE_BUNDLE_BYTES:
+                open_parts[month] = [open_parts[month][0] + 1, 0]
+            open_parts[month][1] += size
+            part = open_parts[month][0]
+            pending.append((doc.reference, f"{month}-{part}", month, part, entry))
+            if len(pending) >= ARCHIVE_BATCH_SIZE:
+                flush()
+        flush()
+        return archived
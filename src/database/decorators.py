@@ -1,9 +1,21 @@
 
 import functools
+import json
+import os
 from firebase_admin import firestore
 import time
-import json
+import hashlib
+import threading
+from flask import g, has_request_context
 from src.api.redis_cache import get_redis_client
+from .firebase_config import db
+from .local_cache import query_cache, create_cache, invalidate_all
+from .metadata_watcher import watcher as metadata_watcher
+from .single_flight import single_flight, redis_lock, release, wait_for, LOCK_FAILED
+from .write_behind import write_behind
+from . import cache_codec
+from .cache_codec import to_response, encode_value, decode_value
+from . import versioning
 
 def _get_collection_name(func, args, kwargs):
     """Helper to intelligently find collection_name."""
@@ -27,6 +39,46 @@ def _get_collection_name(func, args, kwargs):
     
     return None
 
+def note_unverified(versions):
+    """
+    Records, for the current request, the versions of a value served without
+    comparing them to the current ones (a recently checked L1 entry, or a
+    stale value). conditional_get uses them to avoid an ETag newer than the body.
+    """
+    if has_request_context():
+        g.setdefault('unverified_versions', []).append(dict(versions))
+
+def unverified_versions():
+    """The versions recorded by note_unverified during the current request."""
+    return g.get('unverified_versions', []) if has_request_context() else []
+
+def new_metadata_version():
+    """Versions are millisecond timestamps, as written by update_metadata_on_change."""
+    return int(time.time() * 1000)
+
+def queue_metadata_bump(writer, collection_name, extra_fields=None, new_version=None):
+    """
+    Queues a `metadata/{collection_name}` version bump on a WriteBatch or
+    Transaction so it commits atomically with the data change it describes.
+    Returns the new version.
+    """
+    new_version = new_version or new_metadata_version()
+    metadata_ref = db.collection('metadata').document(collection_name)
+    writer.set(metadata_ref, {'version': new_version, **(extra_fields or {})}, merge=True)
+    return new_version
+
+def notify_metadata_change(collection_name, new_version, names=None):
+    """
+    Call after a metadata bump has been committed. Drops this process's L1
+    entries for the collection (read-your-writes) and tells sibling workers
+    so they evict theirs without waiting for their listener. `names` lists
+    the hierarchical dependencies bumped with it (see versioning.bump_fields).
+    """
+    names = names or [collection_name]
+    for name in names:
+        invalidate_all(name)
+    metadata_watcher.publish(collection_name, new_version, names)
+
 def update_metadata_on_change(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
@@ -35,61 +87,377 @@ def update_metadata_on_change(func):
         collection_name = _get_collection_name(func, args, kwargs)        
         if collection_name:
             db = firestore.client()
-            metadata_ref = db.collection('metadata').document(collection_name)
             new_version = int(time.time() * 1000)
-            metadata_ref.set({'version': new_version}, merge=True)
+            path = versioning.collection_path(collection_name)
+            if path:
+                # A path under Year bumps its own level of metadata/Year (see versioning).
+                fields, names = versioning.bump_fields([path], new_version)
+                collection_name = versioning.ROOT
+            else:
+                fields, names = {}, None
+            metadata_ref = db.collection('metadata').document(collection_name)
+            # Queued: the response doesn't wait for it, and bumps in a burst share one write.
+            write_behind.set(metadata_ref, {'version': new_version, **fields}, merge=True, coalesce=True)
+            notify_metadata_change(collection_name, new_version, names)
             print(f"Updated metadata for {collection_name} to version {new_version}")
 
         return result
     return wrapper
 
+def _staleness(stale_versions, versions):
+    """
+    Seconds since the newest version that differs from `stale_versions` was
+    written (versions are millisecond timestamps), or None if unknown.
+    """
+    try:
+        newest = max(int(version) for name, version in versions.items()
+                     if str(stale_versions.get(name)) != str(version))
+    except (TypeError, ValueError):
+        return None
+    return time.time() - newest / 1000
+
+def _within_stale_window(stale_versions, versions, stale_ttl):
+    if not stale_ttl:
+        return False
+    age = _staleness(stale_versions, versions)
+    return age is not None and age <= stale_ttl
+
 def cached_query(func):
+    """
+    Caches a CRUDApi-style (response, status) result per collection, keyed
+    by the collection's metadata version. Lookups go L1 (in-process, see
+    local_cache for the staleness contract) -> Redis -> Firestore. The body
+    is stored encoded (see cache_codec) and hits are answered with those
+    bytes, without decoding and re-encoding the JSON.
+    Concurrent misses are coalesced (see single_flight); with
+    QUERY_CACHE_STALE_TTL set, callers arriving while another one refreshes
+    get the previous version instead of waiting.
+    """
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         collection_name = _get_collection_name(func, args, kwargs)
-
-        redis_client = get_redis_client()
-        if not redis_client or not collection_name:
+        if not collection_name:
             return func(*args, **kwargs)
 
-        db = firestore.client()
         cache_key = f"cache:{collection_name}"
         version_key = f"version:{collection_name}"
-        print(f"Checking cache for '{collection_name}'...")
+
+        # L1: served without any network call while the version check is recent.
+        entry, fresh = query_cache.get(cache_key)
+        if entry is not None and fresh:
+            note_unverified(entry.versions)
+            return to_response(entry.value)
+
         try:
-            metadata_ref = db.collection('metadata').document(collection_name)
-            metadata_doc = metadata_ref.get()
-            firestore_version = metadata_doc.to_dict().get('version') if metadata_doc.exists else None
+            firestore_version = current_versions([collection_name])[collection_name]
         except Exception as e:
             print(f"Firestore metadata error: {e}")
             return func(*args, **kwargs)
+        if firestore_version is None:
+            return func(*args, **kwargs)
+        versions = {collection_name: firestore_version}
 
-        cached_version = redis_client.get(version_key)        
-        if firestore_version and cached_version and str(firestore_version) == cached_version.decode('utf-8'):
-            cached_data = redis_client.get(cache_key)
-            if cached_data:
-                print(f"Cache hit for '{collection_name}'. Serving from Redis.")
-                # The CRUDApi.get_all method returns a Flask Response object.
-                # The decorator should do the same to be transparent.
-                return json.loads(cached_data)
+        if entry is not None and query_cache.confirm(cache_key, versions):
+            return to_response(entry.value)
 
-        print(f"Cache miss for '{collection_name}'. Fetching from Firestore.")
-        result = func(*args, **kwargs)
+        stale = (entry.versions, entry.value) if entry is not None else None
+        redis_client = get_redis_client()
+
+        def read_redis():
+            nonlocal stale
+            if not redis_client:
+                return None
+            try:
+                cached_version, cached_data = redis_client.mget(version_key, cache_key)
+            except Exception as e:
+                print(f"Error reading redis cache: {e}")
+                return None
+            if not (cached_version and cached_data):
+                return None
+            if str(firestore_version) != cached_version.decode('utf-8'):
+                if stale is None:
+                    stale = ({collection_name: cached_version.decode('utf-8')}, cached_data)
+                return None
+            query_cache.put(cache_key, cached_data, versions, size=len(cached_data))
+            return cached_data
+
+        def serve_stale():
+            if stale is None or not _within_stale_window(stale[0], versions, QUERY_CACHE_STALE_TTL):
+                return None
+            single_flight.count('stale_served')
+            note_unverified(stale[0])
+            return stale[1]
 
-        if result is not None and firestore_version is not None:
+        if redis_client:
+            print(f"Checking cache for '{collection_name}'...")
+        payload = read_redis()
+        if payload is not None:
+            print(f"Cache hit for '{collection_name}'. Serving from Redis.")
+            return to_response(payload)
+
+        flight_key = f"cached_query:{collection_name}:{firestore_version}"
+        if SINGLE_FLIGHT == 'on' and single_flight.in_flight(flight_key):
+            payload = serve_stale()
+            if payload is not None:
+                return to_response(payload)
+
+        def store(result):
+            if result is None:
+                return None
             # Result is a tuple (response_data, status_code)
             # We only want to cache the response_data
             response_data, status_code = result
-            if status_code == 200:
+            if status_code != 200:
+                return None
+            payload = cache_codec.encode(response_data.get_data(), collection_name) #jsonify makes it a response object
+            query_cache.put(cache_key, payload, versions, size=len(payload))
+            if redis_client:
                 try:
                     with redis_client.pipeline() as pipe:
-                        pipe.set(cache_key, response_data.get_data(as_text=True)) #jsonify makes it a response object
-                        pipe.set(version_key, str(firestore_version))
+                        pipe.set(cache_key, payload, ex=QUERY_CACHE_REDIS_TTL)
+                        pipe.set(version_key, str(firestore_version), ex=QUERY_CACHE_REDIS_TTL)
                         pipe.execute()
                     print(f"Updated Redis cache for '{collection_name}' with version {firestore_version}.")
                 except Exception as e:
                     print(f"Error updating redis cache: {e}")
+            return payload
 
+        def refresh():
+            lock = None
+            if redis_client and SINGLE_FLIGHT == 'on':
+                lock = redis_lock(redis_client, cache_key, QUERY_CACHE_LOCK_TIMEOUT)
+                if lock is LOCK_FAILED:
+                    # Redis is failing: refresh here rather than wait on it.
+                    single_flight.count('lock_errors')
+                    lock = None
+                elif lock is None:
+                    # Another worker is refreshing this collection.
+                    single_flight.count('lock_waits')
+                    payload = serve_stale()
+                    if payload is None:
+                        payload = wait_for(read_redis, QUERY_CACHE_LOCK_TIMEOUT)
+                    if payload is not None:
+                        return payload, None
+                    single_flight.count('lock_timeouts')
+                else:
+                    single_flight.count('lock_acquired')
+            try:
+                print(f"Cache miss for '{collection_name}'. Fetching from Firestore.")
+                result = func(*args, **kwargs)
+                return store(result), result
+            finally:
+                if lock is not None:
+                    release(lock)
 
-        return result
+        if SINGLE_FLIGHT != 'on':
+            return refresh()[1]
+        (payload, result), leader = single_flight.do(flight_key, refresh)
+        if leader and result is not None:
+            return result
+        # Followers build their own response from the payload; if the leader got an error they try themselves.
+        return to_response(payload) if payload is not None else func(*args, **kwargs)
     return wrapper
+
+
+# Set QUERY_CACHE=off to bypass the `cached` decorator (e.g. when benchmarking the queries themselves).
+QUERY_CACHE = os.environ.get('QUERY_CACHE', 'on')
+# Set QUERY_CACHE_SINGLE_FLIGHT=off to let every concurrent miss recompute on its own.
+SINGLE_FLIGHT = os.environ.get('QUERY_CACHE_SINGLE_FLIGHT', 'on')
+# Seconds a previous version may still be served while another caller refreshes it (0 disables).
+QUERY_CACHE_STALE_TTL = float(os.environ.get('QUERY_CACHE_STALE_TTL', '0'))
+# Expiry of the cross-worker refresh lock, and how long other workers wait for its value.
+QUERY_CACHE_LOCK_TIMEOUT = float(os.environ.get('QUERY_CACHE_LOCK_TIMEOUT', '5'))
+# Expiry of cached_query's Redis entries: bounds how long a lost version bump leaves them stale.
+QUERY_CACHE_REDIS_TTL = int(os.environ.get('QUERY_CACHE_REDIS_TTL', '3600'))
+
+def current_versions(collection_names):
+    """
+    Returns {collection: version} for the given metadata documents. Versions
+    come from the metadata watcher when it is trustworthy; the rest are read
+    with one batched get_all. Collections without metadata map to None.
+    Hierarchical names ('Year/2026/10', see versioning) are read from the
+    metadata/Year document.
+    """
+    versions, missing = {}, set()
+    year_document = None
+    for name in collection_names:
+        if versioning.is_hierarchical(name):
+            if year_document is None:
+                year_document = metadata_watcher.current(versioning.ROOT)
+            if year_document is None:
+                missing.add(versioning.ROOT)
+            else:
+                versions[name] = versioning.nested_version(year_document, name)
+        else:
+            versions[name] = metadata_watcher.current_version(name)
+            if versions[name] is None:
+                missing.add(name)
+    if missing:
+        refs = [db.collection('metadata').document(name) for name in sorted(missing)]
+        documents = {snapshot.id: (snapshot.to_dict() or {}) if snapshot.exists else {}
+                     for snapshot in db.get_all(refs)}
+        for name in collection_names:
+            if versioning.is_hierarchical(name) and versioning.ROOT in missing:
+                versions[name] = versioning.nested_version(documents.get(versioning.ROOT), name)
+            elif name in documents:
+                versions[name] = documents[name].get('version')
+    return versions
+
+_skipped = threading.local()
+
+def skip_cache():
+    """
+    Called by a `cached` function that returns a fallback instead of raising
+    (e.g. from an except block): that result is returned but not cached, so
+    a transient error is not served for the whole TTL.
+    """
+    _skipped.flag = True
+
+def _call_key(args, kwargs):
+    # repr() keeps keys readable; objects used as arguments (e.g. CRUDApi) define a stable __repr__.
+    return repr((args, sorted(kwargs.items())))
+
+def cached(depends_on, ttl=60, maxsize=128, stale_ttl=None):
+    """
+    Caches a function's plain Python return value per set of arguments.
+
+    `depends_on` lists the metadata collections the result is read from, or
+    is a callable taking the function's arguments and returning that list.
+    Year data can be named per level ('Year/2026', 'Year/2026/10/Chi'), so a
+    write only invalidates results that read the part it changed.
+    A cached value is served while every one of those versions is unchanged
+    (checked at most every L1_CACHE_CHECK_INTERVAL seconds, or on push) and
+    it is younger than `ttl`. Values are kept in a per-function L1 cache of
+    `maxsize` entries and in Redis, encoded as JSON (see cache_codec.encode_value),
+    so callers always get a private copy. Results flagged with skip_cache()
+    are not stored.
+    Concurrent misses for the same arguments run the function once; with
+    `stale_ttl` (default QUERY_CACHE_STALE_TTL) seconds, callers arriving
+    during that refresh get the previous value if its versions changed less
+    than `stale_ttl` seconds ago.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        l1 = create_cache(name, maxsize=maxsize, ttl=ttl)
+        max_stale = QUERY_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if QUERY_CACHE == 'off':
+                return func(*args, **kwargs)
+            dependencies = depends_on(*args, **kwargs) if callable(depends_on) else depends_on
+            call_key = _call_key(args, kwargs)
+
+            entry, fresh = l1.get(call_key)
+            if entry is not None and fresh:
+                note_unverified(entry.versions)
+                return decode_value(entry.value)
+
+            try:
+                versions = current_versions(dependencies)
+            except Exception as e:
+                print(f"Error reading metadata versions for {name}: {e}")
+                return func(*args, **kwargs)
+            if entry is not None and l1.confirm(call_key, versions):
+                return decode_value(entry.value)
+
+            stale = (entry.versions, entry.value) if entry is not None else None
+            redis_client = get_redis_client()
+            redis_key = f"qcache:{name}:{hashlib.sha1(call_key.encode('utf-8')).hexdigest()}"
+
+            def read_redis():
+                nonlocal stale
+                if not redis_client:
+                    return None
+                try:
+                    cached_data = redis_client.get(redis_key)
+                    if not cached_data:
+                        return None
+                    versions_json, payload = cached_data.split(b'\n', 1)
+                    cached_versions = json.loads(versions_json)
+                except Exception as e:
+                    print(f"Error reading redis cache for {name}: {e}")
+                    return None
+                if cached_versions != versions:
+                    if stale is None:
+                        stale = (cached_versions, payload)
+                    return None
+                l1.put(call_key, payload, versions, size=len(payload))
+                return payload
+
+            def serve_stale():
+                if stale is None or not _within_stale_window(stale[0], versions, max_stale):
+                    return None
+                single_flight.count('stale_served')
+                note_unverified(stale[0])
+                return stale[1]
+
+            payload = read_redis()
+            if payload is not None:
+                return decode_value(payload)
+
+            flight_key = f"{name}:{call_key}:{sorted(versions.items())!r}"
+            if SINGLE_FLIGHT == 'on' and single_flight.in_flight(flight_key):
+                payload = serve_stale()
+                if payload is not None:
+                    return decode_value(payload)
+
+            def store(result):
+                try:
+                    payload = encode_value(result)
+                except Exception as e:
+                    print(f"Result of {name} cannot be cached: {e}")
+                    return None
+                l1.put(call_key, payload, versions, size=len(payload))
+                if redis_client:
+                    try:
+                        redis_client.set(redis_key, json.dumps(versions).encode('utf-8') + b'\n' + payload, ex=int(ttl))
+                    except Exception as e:
+                        print(f"Error updating redis cache for {name}: {e}")
+                return payload
+
+            def refresh():
+                """Returns (payload, computed, result)."""
+                lock = None
+                if redis_client and SINGLE_FLIGHT == 'on':
+                    lock = redis_lock(redis_client, redis_key, QUERY_CACHE_LOCK_TIMEOUT)
+                    if lock is LOCK_FAILED:
+                        # Redis is failing: compute here rather than wait on it.
+                        single_flight.count('lock_errors')
+                        lock = None
+                    elif lock is None:
+                        # Another worker is computing this value.
+                        single_flight.count('lock_waits')
+                        payload = serve_stale()
+                        if payload is None:
+                            payload = wait_for(read_redis, QUERY_CACHE_LOCK_TIMEOUT)
+                        if payload is not None:
+                            return payload, False, None
+                        single_flight.count('lock_timeouts')
+                    else:
+                        single_flight.count('lock_acquired')
+                try:
+                    outer_skipped = getattr(_skipped, 'flag', False)
+                    _skipped.flag = False
+                    try:
+                        result = func(*args, **kwargs)
+                        skipped = _skipped.flag
+                    finally:
+                        # A fallback from a nested cached call also taints the caller's result.
+                        _skipped.flag = outer_skipped or _skipped.flag
+                    return (None if skipped else store(result)), True, result
+                finally:
+                    if lock is not None:
+                        release(lock)
+
+            if SINGLE_FLIGHT != 'on':
+                return refresh()[2]
+            (payload, computed, result), leader = single_flight.do(flight_key, refresh)
+            if leader and computed:
+                return result
+            if payload is None:
+                # The leader's result could not be encoded or was a fallback, so it is not shared.
+                return func(*args, **kwargs)
+            return decode_value(payload)
+        return wrapper
+    return decorator
@@ -2,6 +2,7 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import os
 import json
+from src.lazy import LazyClient
 
 # --- A Mock Firestore Client for Graceful Failure ---
 # This allows the server to run even if Firebase is not configured.
@@ -10,6 +11,22 @@ class MockFirestoreClient:
     def collection(self, *args, **kwargs):
         print("WARNING: Using MockFirestoreClient. Firebase is not configured.")
         return MockCollectionRef()
+    def collection_group(self, *args, **kwargs):
+        return MockCollectionRef()
+    def get_all(self, *args, **kwargs):
+        return []
+    def batch(self, *args, **kwargs):
+        return MockWriteBatch()
+
+class MockWriteBatch:
+    def set(self, *args, **kwargs):
+        pass
+    def update(self, *args, **kwargs):
+        pass
+    def delete(self, *args, **kwargs):
+        pass
+    def commit(self, *args, **kwargs):
+        return []
 
 class MockCollectionRef:
     def document(self, *args, **kwargs):
@@ -42,38 +59,40 @@ class MockDocSnapshot:
         return self._data
 
 # --- Firebase Admin SDK Configuration ---
-db = None
+def _create_client():
+    try:
+        cred = None
+        firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS_JSON')
 
-try:
-    cred = None
-    firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS_JSON')
-
-    if firebase_creds_json:
-        print("Initializing Firebase from environment variable...")
-        firebase_creds_dict = json.loads(firebase_creds_json)
-        cred = credentials.Certificate(firebase_creds_dict)
-    else:
-        # Fallback for local development
-        key_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
-        if os.path.exists(key_path):
-            print(f"Initializing Firebase from file: {key_path}")
-            cred = credentials.Certificate(key_path)
+        if firebase_creds_json:
+            print("Initializing Firebase from environment variable...")
+            firebase_creds_dict = json.loads(firebase_creds_json)
+            cred = credentials.Certificate(firebase_creds_dict)
         else:
-            print("CRITICAL WARNING: Firebase credentials not found.")
-            print(" - For local dev, place 'serviceAccountKey.json' in the 'src/database/' directory.")
-            print(" - For deployment, set the 'FIREBASE_CREDENTIALS_JSON' environment variable.")
+            # Fallback for local development
+            key_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
+            if os.path.exists(key_path):
+                print(f"Initializing Firebase from file: {key_path}")
+                cred = credentials.Certificate(key_path)
+            else:
+                print("CRITICAL WARNING: Firebase credentials not found.")
+                print(" - For local dev, place 'serviceAccountKey.json' in the 'src/database/' directory.")
+                print(" - For deployment, set the 'FIREBASE_CREDENTIALS_JSON' environment variable.")
 
-    # Initialize the app if credentials were found
-    if cred and not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        print("Firebase connection successful.")
-    else:
+        # Initialize the app if credentials were found
+        if cred and not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+            print("Firebase connection successful.")
+            return firestore.client()
         # If no credentials, use the Mock client to prevent a server crash
         print("Using Mock Firestore Client. The application will run in a degraded mode.")
-        db = MockFirestoreClient()
+        return MockFirestoreClient()
+
+    except Exception as e:
+        print(f"FATAL ERROR during Firebase initialization: {e}")
+        print("Using Mock Firestore Client as a fallback.")
+        return MockFirestoreClient()
+
 
-except Exception as e:
-    print(f"FATAL ERROR during Firebase initialization: {e}")
-    print("Using Mock Firestore Client as a fallback.")
-    db = MockFirestoreClient()
+# Initialized on first use (see src.lazy), not when the app is imported.
+db = LazyClient('firestore', _create_client)
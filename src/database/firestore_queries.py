@@ -2,10 +2,22 @@ from src.database.firebase_config import db
 from collections import defaultdict
 from google.cloud import firestore
 import uuid
+import numpy as np
 from datetime import datetime
-import math
 import bleach
-from .decorators import update_metadata_on_change
+from .shelf_index import get_shelf_index
+from .decorators import update_metadata_on_change, queue_metadata_bump, new_metadata_version, notify_metadata_change, cached, skip_cache
+from .rollups import Rollup
+from .savings_index import SavingsIndex, SAVINGS_TYPE
+from . import analytics
+from .record_store import RecordStore
+from .tree_index import TreeIndex
+from . import versioning
+from .pagination import paginate
+from . import amortization
+
+# Firestore rejects a batched write with more than 500 operations.
+BATCH_WRITE_LIMIT = 500
 
 # Helper function to sanitize dictionaries
 def sanitize_dict(data):
@@ -13,10 +25,28 @@ def sanitize_dict(data):
         return data
     return {key: bleach.clean(str(value)) if isinstance(value, str) else value for key, value in data.items()}
 
+def collection_dependencies(collection_name, *args, **kwargs):
+    """
+    Cache dependency of DocumentHandler reads: the top-level collection of
+    the path, or the matching level of the Year hierarchy for
+    Year/{y}/Months/{m}/Types/{t} paths.
+    """
+    path = versioning.collection_path(collection_name)
+    return [versioning.year_path(*path)] if path else [collection_name.split('/')[0]]
+
+
+def _year_dependency(year, *args, **kwargs):
+    return [versioning.year_path(year)]
+
+
+def _month_dependency(year, month, *args, **kwargs):
+    return [versioning.year_path(year, month)]
+
 class DocumentHandler:
     """Handles generic CRUD operations for Firestore documents and collections."""
 
     @staticmethod
+    @cached(collection_dependencies, ttl=300)
     def get_all_documents_from_collection(collection_name):
         """Fetches all documents from a specified collection."""
         try:
@@ -32,59 +62,35 @@ class DocumentHandler:
             return results
         except Exception as e:
             print(f"Error getting all documents: {e}")
+            skip_cache()
             return []
             
     @staticmethod
-    def get_paginated_documents(collection_name, page_size=10, start_after_doc_id=None, order_by_field='id'):
+    @cached(collection_dependencies, ttl=120, maxsize=256)
+    def get_paginated_documents(collection_name, page_size=10, cursor=None, direction='next', order_by_field='id'):
         """
-        Fetches a paginated list of documents, including total records and total pages.
+        Fetches one page of a collection with opaque cursors (see pagination):
+        {'data', 'next_cursor', 'prev_cursor', 'last_doc_id'}. Raises ValueError
+        for an invalid cursor or direction.
         """
         try:
-            collection_ref = db.collection(collection_name)
-            
-            # 1. Get total number of records efficiently
-            count_query = collection_ref.count()
-            total_records_result = count_query.get()
-            total_records = total_records_result[0][0].value
-
-            # 2. Calculate total pages
-            total_pages = math.ceil(total_records / page_size) if page_size > 0 else 0
-            
-            # 3. Build the pagination query
-            # Order by document ID by default for stable pagination
-            order_key = firestore.Client.field_path('__name__') if order_by_field == 'id' else order_by_field
-            query = collection_ref.order_by(order_key)
-
-            if start_after_doc_id:
-                start_after_doc = collection_ref.document(start_after_doc_id).get()
-                if not start_after_doc.exists:
-                    # Return empty data but with correct totals if cursor is invalid
-                    return {
-                        'data': [], 'last_doc_id': None,
-                        'total_records': total_records, 'total_pages': total_pages
-                    }
-                query = query.start_after(start_after_doc)
-
-            docs_snapshot = query.limit(page_size).stream()
-
-            results = []
-            last_doc_id = None
-            for doc in docs_snapshot:
-                doc_data = doc.to_dict()
-                doc_data['id'] = doc.id
-                results.append(doc_data)
-                last_doc_id = doc.id
-
-            # 4. Return the enhanced dictionary
-            return {
-                'data': results, 
-                'last_doc_id': last_doc_id,
-                'total_records': total_records,
-                'total_pages': total_pages
-            }
+            order_by = [] if order_by_field == 'id' else [order_by_field]
+            page = paginate(db.collection(collection_name), order_by, page_size, cursor, direction)
+            page['last_doc_id'] = page['data'][-1]['id'] if page['data'] else None
+            return page
+        except ValueError:
+            raise
         except Exception as e:
             print(f"Error getting paginated documents from {collection_name}: {e}")
-            return {'data': [], 'last_doc_id': None, 'total_records': 0, 'total_pages': 0}
+            skip_cache()
+            return {'data': [], 'next_cursor': None, 'prev_cursor': None, 'last_doc_id': None}
+
+    @staticmethod
+    @cached(collection_dependencies, ttl=600, maxsize=256)
+    def count_documents(collection_name):
+        """Counts a collection with an aggregation query; cached per collection version."""
+        result = db.collection(collection_name).count().get()
+        return result[0][0].value
 
     @staticmethod
     @update_metadata_on_change    
@@ -101,6 +107,7 @@ class DocumentHandler:
             raise e
 
     @staticmethod
+    @update_metadata_on_change
     def delete_document_from_collection(collection_name, document_id):
         """Deletes a document."""
         try:
@@ -111,6 +118,7 @@ class DocumentHandler:
             return False
 
     @staticmethod
+    @update_metadata_on_change
     def update_document_in_collection(collection_name, original_doc_id, data_from_form):
         """Updates a document, handling ID changes as well."""
         try:
@@ -123,34 +131,29 @@ class DocumentHandler:
             raise e
     
     @staticmethod
+    @cached(collection_dependencies, ttl=120)
     def get_recent_documents_from_collection(collection_name, limit=10):
         """Fetches the most recent documents from a specified collection."""
         try:
             print(f"Getting recent documents from {collection_name}")
-            query = db.document(collection_name)
-            docs = query.get()           
-            if not docs.exists:
-                print(f"Document not found at path: {collection_name}")
-                return []
-            
-            results = docs.to_dict().get('records', [])
-            # sắp xếp theo một trường bất kỳ, ví dụ createdAt
-            sorted_records = sorted(results, key=lambda x: x.get("date"), reverse= True)
-
-            # lấy 5 bản ghi đầu tiên sau khi sort
-            top_record = sorted_records[:limit]
-            return top_record
+            # Records are read from whichever layout RECORD_STORAGE selects and sorted by date
+            return RecordStore.recent(db.document(collection_name), limit)
         except Exception as e:
             print(f"Error getting recent documents: {e}")
+            skip_cache()
             return []
 
 class ManagementTree:
     """Handles logic for fetching and manipulating data for the management tree."""
 
     @staticmethod
-    def get_data_tree():
-        """Fetches data from Firestore structured as Year -> Months."""
+    def get_data_tree(index=None):
+        """Fetches data structured as Year -> Months, from the tree index when it has been built."""
         try:
+            index = index if index is not None else TreeIndex.get()
+            if index is not None:
+                return TreeIndex.tree(index)
+
             tree = defaultdict(list)
             year_docs = db.collection('Year').stream()
             for year_doc in year_docs:
@@ -165,21 +168,35 @@ class ManagementTree:
             return {}
 
     @staticmethod
+    @cached(_month_dependency, ttl=300, maxsize=64)
     def get_items_for_month(year, month):
         """Fetches all type items for a specific month and year."""
         try:
-            items_ref = db.collection('Year').document(year).collection('Months').document(month).collection('Types')
-            docs = items_ref.stream()
+            type_docs, month_records = RecordStore.read_month(year, month)
             results = []
-            for doc in docs:
-                doc_data = doc.to_dict()
+            for doc in type_docs:
+                doc_data = doc.to_dict() or {}
+                doc_data['records'] = month_records[doc.id]
                 doc_data['id'] = doc.id
                 results.append(doc_data)
             return results
         except Exception as e:
             print(f"Error getting items for {year}-{month}: {e}")
+            skip_cache()
             return []
 
+    @staticmethod
+    def _bump_record_metadata(writer, paths):
+        """
+        Bumps the hierarchical versions in metadata/Year for (year, month, type)
+        paths and their ancestors in one write. Returns (version, names); pass
+        both to notify_metadata_change once the write has committed.
+        """
+        version = new_metadata_version()
+        fields, names = versioning.bump_fields(paths, version)
+        queue_metadata_bump(writer, 'Year', fields, new_version=version)
+        return version, names
+
     @staticmethod
     def add_item(year, month, item_type, data):
         """Adds a new record to a type document in Firestore, ensuring parent documents exist."""
@@ -189,67 +206,168 @@ class ManagementTree:
             month_ref = year_ref.collection('Months').document(month)
             type_ref = month_ref.collection('Types').document(item_type)
 
-            year_ref.set({}, merge=True)
-            month_ref.set({}, merge=True)
-            
-            type_ref.set({'records': firestore.ArrayUnion([sanitized_data])
-            }, merge=True)
+            # The record and its rollup deltas are committed as a single write.
+            batch = db.batch()
+            batch.set(year_ref, {}, merge=True)
+            batch.set(month_ref, {}, merge=True)
+            RecordStore.add(batch, type_ref, sanitized_data)
+            Rollup.apply_delta(batch, year, month, item_type, new_record=sanitized_data)
+            SavingsIndex.apply(batch, year, month, item_type, new_record=sanitized_data)
+            TreeIndex.apply(batch, {(year, month): 1})
+            version, names = ManagementTree._bump_record_metadata(batch, [(year, month, item_type)])
+            batch.commit()
+            notify_metadata_change('Year', version, names)
             
             return sanitized_data.get('id')
         except Exception as e:
             print(f"Error adding new item to Firestore: {e}")
             raise e
 
+    @staticmethod
+    def _commit_import_chunk(chunk, ensured_parents):
+        """Writes one chunk of add_items: records, parent docs, rollups, savings index and metadata."""
+        batch = db.batch()
+        month_totals = defaultdict(Rollup.empty_totals)
+        year_totals = defaultdict(Rollup.empty_totals)
+        deposits = []
+        written_parents = set()
+        for (year, month, item_type), records in chunk.items():
+            year_ref = db.collection('Year').document(year)
+            month_ref = year_ref.collection('Months').document(month)
+            for ref in (year_ref, month_ref):
+                if ref.path not in ensured_parents and ref.path not in written_parents:
+                    batch.set(ref, {}, merge=True)
+                    written_parents.add(ref.path)
+            RecordStore.add_many(batch, month_ref.collection('Types').document(item_type), records)
+            for record in records:
+                Rollup.add_record(month_totals[(year, month)], item_type, record)
+                Rollup.add_record(year_totals[year], item_type, record)
+            if item_type == SAVINGS_TYPE:
+                deposits.extend((year, month, record) for record in records)
+
+        for (year, month), totals in month_totals.items():
+            Rollup.queue_totals(batch, year, month, totals)
+        for year, totals in year_totals.items():
+            Rollup.queue_totals(batch, year, None, totals)
+        SavingsIndex.apply_many(batch, deposits)
+        month_counts = defaultdict(int)
+        for (year, month, _), records in chunk.items():
+            month_counts[(year, month)] += len(records)
+        TreeIndex.apply(batch, month_counts)
+        version, names = ManagementTree._bump_record_metadata(batch, list(chunk.keys()))
+        batch.commit()
+        notify_metadata_change('Year', version, names)
+        ensured_parents.update(written_parents)
+
+    @staticmethod
+    def add_items(items):
+        """
+        Adds many records with chunked batched writes. `items` is a list of
+        (year, month, type, record) tuples. Records are grouped by
+        year/month/type, each chunk stays under the 500-write batch limit and
+        carries its own rollup, savings-index and metadata updates, and each
+        parent document is written only once per import.
+        Returns one {'status', 'id'/'error'} result per item, in input order.
+        """
+        results = [None] * len(items)
+        order = sorted(range(len(items)), key=lambda i: items[i][:3])
+        ensured_parents = set()
+
+        chunk, chunk_indexes = defaultdict(list), []
+        chunk_months, chunk_years = set(), set()
+        # Reserved for the metadata bump, the savings summary and the tree index.
+        chunk_cost = 3
+
+        def flush():
+            try:
+                ManagementTree._commit_import_chunk(chunk, ensured_parents)
+                for i in chunk_indexes:
+                    results[i] = {'status': 'created', 'id': items[i][3].get('id')}
+            except Exception as e:
+                print(f"Error committing import chunk: {e}")
+                for i in chunk_indexes:
+                    results[i] = {'status': 'failed', 'error': str(e)}
+
+        def write_cost(year, month, item_type):
+            """Writes one more record of this type adds to the current chunk."""
+            count = len(chunk.get((year, month, item_type), ()))
+            cost = RecordStore.write_cost(count + 1) - (RecordStore.write_cost(count) if count else 0)
+            cost += 1 if item_type == SAVINGS_TYPE else 0
+            if (year, month) not in chunk_months:
+                cost += 2  # month rollup + month parent doc
+            if year not in chunk_years:
+                cost += 2  # year rollup + year parent doc
+            return cost
+
+        for i in order:
+            year, month, item_type, record = items[i]
+            cost = write_cost(year, month, item_type)
+            if chunk_indexes and chunk_cost + cost > BATCH_WRITE_LIMIT:
+                flush()
+                chunk, chunk_indexes = defaultdict(list), []
+                chunk_months, chunk_years = set(), set()
+                chunk_cost = 3
+                cost = write_cost(year, month, item_type)
+
+            chunk[(year, month, item_type)].append(sanitize_dict(record))
+            chunk_indexes.append(i)
+            chunk_months.add((year, month))
+            chunk_years.add(year)
+            chunk_cost += cost
+
+        if chunk_indexes:
+            flush()
+        return results
+
+    @staticmethod
+    @firestore.transactional
+    def _delete_record_in_transaction(transaction, type_ref, year, month, type_id, record_id):
+        deleted_record = RecordStore.delete_in_transaction(transaction, type_ref, record_id)
+
+        # Roll the deleted amount back out of the totals in the same transaction
+        Rollup.apply_delta(transaction, year, month, type_id, old_record=deleted_record)
+        SavingsIndex.apply(transaction, year, month, type_id, old_record=deleted_record)
+        if deleted_record is not None:
+            TreeIndex.apply(transaction, {(year, month): -1})
+        return ManagementTree._bump_record_metadata(transaction, [(year, month, type_id)])
+
     @staticmethod
     def delete_record(year, month, type_id, record_id):
-        """Deletes a record from the 'records' array within a type document."""
+        """Deletes a record from a type document (array entry or record document)."""
         try:
             type_ref = db.collection('Year').document(year).collection('Months').document(month).collection('Types').document(type_id)
-            doc = type_ref.get()
-            if not doc.exists:
-                raise Exception("Document not found")
-
-            records = doc.to_dict().get('records', [])
-            # Create a new list excluding the record to be deleted
-            updated_records = [record for record in records if record.get('id') != record_id]
-
-            # Update the document with the new array
-            type_ref.update({'records': updated_records})
+            version, names = ManagementTree._delete_record_in_transaction(db.transaction(), type_ref, year, month, type_id, record_id)
+            notify_metadata_change('Year', version, names)
             print(f"Successfully deleted record {record_id} from {type_id}")
 
         except Exception as e:
             print(f"Error deleting record {record_id}: {e}")
             raise e
 
+    @staticmethod
+    @firestore.transactional
+    def _update_record_in_transaction(transaction, type_ref, year, month, type_id, record_id, sanitized_new_data):
+        def merge_record(record):
+            # Sanitize existing record fields before updating
+            sanitized_record = sanitize_dict(record)
+            sanitized_record.update(sanitized_new_data)
+            return sanitized_record
+
+        old_record, new_record = RecordStore.update_in_transaction(transaction, type_ref, record_id, merge_record)
+
+        # The rollup delta commits together with the record change
+        Rollup.apply_delta(transaction, year, month, type_id, old_record=old_record, new_record=new_record)
+        SavingsIndex.apply(transaction, year, month, type_id, old_record=old_record, new_record=new_record)
+        return ManagementTree._bump_record_metadata(transaction, [(year, month, type_id)])
+
     @staticmethod
     def update_record(year, month, type_id, record_id, new_data):
-        """Updates a record within the 'records' array of a type document."""
+        """Updates a record of a type document (array entry or record document)."""
         try:
             sanitized_new_data = sanitize_dict(new_data)
             type_ref = db.collection('Year').document(year).collection('Months').document(month).collection('Types').document(type_id)
-            doc = type_ref.get()
-            if not doc.exists:
-                raise Exception("Document not found")
-
-            records = doc.to_dict().get('records', [])
-            record_found = False
-            updated_records = []
-
-            for record in records:
-                if record.get('id') == record_id:
-                    # Sanitize existing record fields before updating
-                    sanitized_record = sanitize_dict(record)
-                    sanitized_record.update(sanitized_new_data)
-                    updated_records.append(sanitized_record)
-                    record_found = True
-                else:
-                    updated_records.append(record)
-
-            if not record_found:
-                raise Exception("Record with specified ID not found in document")
-
-            # Write the entire modified array back to the document
-            type_ref.update({'records': updated_records})
+            version, names = ManagementTree._update_record_in_transaction(db.transaction(), type_ref, year, month, type_id, record_id, sanitized_new_data)
+            notify_metadata_change('Year', version, names)
             print(f"Successfully updated record {record_id} in {type_id}")
 
         except Exception as e:
@@ -258,66 +376,87 @@ class ManagementTree:
 
 class Dashboard:
     @staticmethod
+    @cached(_year_dependency, ttl=300)
     def get_total_income_and_expense_year(year):
             """
             Calculates total income and expense for a given year.
             """
             total_income = 0
             total_expense = 0            
-            try:                                
+            try:
+                if analytics.is_enabled():
+                    summary = analytics.engine.snapshot(verify=True).summary(year)
+                    return {"income": summary['income'], "expense": summary['expense']}
+
+                rollup = Rollup.get_year(year)
+                if rollup is not None:
+                    return {"income": rollup.get('income', 0), "expense": rollup.get('expense', 0)}
+
+                # No rollup yet (e.g. data written before rollups existed): scan the raw records.
+                # Only Thu/Chi contribute, so their refs for every month are resolved in one batch.
                 month_docs = db.collection('Year').document(str(year)).collection('Months').stream()
-                for month_doc in month_docs:
-                    type_docs = month_doc.reference.collection('Types').stream()
-                    for type_doc in type_docs:
-                        type_id = type_doc.id
-                        doc_data = type_doc.to_dict()
-                        if 'records' in doc_data and isinstance(doc_data['records'], list):
-                            for record in doc_data['records']:
-                                if isinstance(record, dict) and 'amount' in record:
-                                    try:
-                                        amount = float(record['amount'])
-                                        if type_id == 'Thu':
-                                            total_income += amount
-                                        elif type_id == 'Chi':
-                                            total_expense += amount
-                                    except (ValueError, TypeError):
-                                        print(f"Skipping record with invalid amount: {record}")
+                type_refs = [month_doc.reference.collection('Types').document(type_id)
+                             for month_doc in month_docs for type_id in ('Thu', 'Chi')]
+                for type_ref, records in RecordStore.read_many(type_refs, fields=('amount',)):
+                    type_id = type_ref.id
+                    for record in records:
+                        if 'amount' in record:
+                            try:
+                                amount = float(record['amount'])
+                                if type_id == 'Thu':
+                                    total_income += amount
+                                elif type_id == 'Chi':
+                                    total_expense += amount
+                            except (ValueError, TypeError):
+                                print(f"Skipping record with invalid amount: {record}")
                 return {"income": total_income, "expense": total_expense}
             except Exception as e:
                 print(f"Error calculating total income/expense for year: {e}")
+                skip_cache()
                 return {"income": 0, "expense": 0}
 
     @staticmethod
+    @cached(_month_dependency, ttl=300)
     def get_total_income_and_expense_month(year,month):
             """
             Calculates total income and expense for a given month.
             """
             total_income = 0
             total_expense = 0
-            try:                               
-                type_docs = db.collection('Year').document(year).collection('Months').document(month).collection('Types').stream()                
-                for type_doc in type_docs:
-                    type_id = type_doc.id
-                    doc_data = type_doc.to_dict()
-                    if 'records' in doc_data and isinstance(doc_data['records'], list):
-                        for record in doc_data['records']:
-                            if isinstance(record, dict) and 'amount' in record:
-                                try:
-                                    amount = float(record['amount'])
-                                    if type_id == 'Thu':
-                                        total_income += amount
-                                    elif type_id == 'Chi':
-                                        total_expense += amount
-                                except (ValueError, TypeError):
-                                    print(f"Skipping record with invalid amount: {record}")
+            try:
+                if analytics.is_enabled():
+                    summary = analytics.engine.snapshot(verify=True).summary(year, month)
+                    return {"income": summary['income'], "expense": summary['expense']}
+
+                rollup = Rollup.get_month(year, month)
+                if rollup is not None:
+                    return {"income": rollup.get('income', 0), "expense": rollup.get('expense', 0)}
+
+                _, month_records = RecordStore.read_month(year, month, fields=('amount',))
+                for type_id, records in month_records.items():
+                    for record in records:
+                        if 'amount' in record:
+                            try:
+                                amount = float(record['amount'])
+                                if type_id == 'Thu':
+                                    total_income += amount
+                                elif type_id == 'Chi':
+                                    total_expense += amount
+                            except (ValueError, TypeError):
+                                print(f"Skipping record with invalid amount: {record}")
                 return {"income": total_income, "expense": total_expense}
             except Exception as e:
                 print(f"Error calculating total income/expense for month: {e}")
+                skip_cache()
                 return {"income": 0, "expense": 0}
     
     @staticmethod
-    def get_year_list():
+    def get_year_list(index=None):
         try:
+            index = index if index is not None else TreeIndex.get()
+            if index is not None:
+                return TreeIndex.years(index)
+
             results = [] 
             year_docs = db.collection('Year').stream()       
             for year_doc in year_docs:                                 
@@ -328,24 +467,31 @@ class Dashboard:
                 return []
     
     @staticmethod
+    @cached(_year_dependency, ttl=300)
     def get_piechart_for_year(year):
         try:
+            if analytics.is_enabled():
+                expenses = analytics.engine.snapshot(verify=True).category_breakdown(year, type_id='Chi')
+                return {"labels": list(expenses.keys()), "data": list(expenses.values())}
+
+            rollup = Rollup.get_year(year)
+            if rollup is not None:
+                # Categories whose records were all deleted linger at zero; leave them out.
+                expenses = {name: value for name, value in rollup.get('categories', {}).get('Chi', {}).items() if value}
+                return {"labels": list(expenses.keys()), "data": list(expenses.values())}
+
             aggregated_data = defaultdict(float)
             month_docs = db.collection('Year').document(str(year)).collection('Months').stream()
-            for month_doc in month_docs:
-                chi_doc_ref = month_doc.reference.collection('Types').document('Chi')
-                chi_doc = chi_doc_ref.get()
-                if chi_doc.exists:
-                    doc_data = chi_doc.to_dict()
-                    if 'records' in doc_data and isinstance(doc_data['records'], list):
-                        for record in doc_data['records']:
-                            if isinstance(record, dict) and 'name' in record and 'amount' in record:
-                                try:
-                                    name = record['name']
-                                    amount = float(record['amount'])
-                                    aggregated_data[name] += amount
-                                except (ValueError, TypeError):
-                                    print(f"Skipping record with invalid amount: {record}")
+            chi_refs = [month_doc.reference.collection('Types').document('Chi') for month_doc in month_docs]
+            for _, records in RecordStore.read_many(chi_refs, fields=('name', 'amount')):
+                for record in records:
+                    if 'name' in record and 'amount' in record:
+                        try:
+                            name = record['name']
+                            amount = float(record['amount'])
+                            aggregated_data[name] += amount
+                        except (ValueError, TypeError):
+                            print(f"Skipping record with invalid amount: {record}")
             
             labels = list(aggregated_data.keys())
             data = list(aggregated_data.values())
@@ -353,55 +499,118 @@ class Dashboard:
             return {"labels": labels, "data": data}
         except Exception as e:
             print(f"Error getting pie chart data for year {year}: {e}")
+            skip_cache()
             return {"labels": [], "data": []}
 
     @staticmethod        
+    @cached(lambda year, month: [versioning.year_path(year, month, 'Chi')], ttl=300)
     def get_piechart_for_month(year,month):
         try:
+            if analytics.is_enabled():
+                expenses = analytics.engine.snapshot(verify=True).category_breakdown(year, month, type_id='Chi')
+                return [{'name': name, 'value': total_amount} for name, total_amount in expenses.items()]
+
+            rollup = Rollup.get_month(year, month)
+            if rollup is not None:
+                expenses = {name: value for name, value in rollup.get('categories', {}).get('Chi', {}).items() if value}
+                return [{'name': name, 'value': total_amount} for name, total_amount in expenses.items()]
+
             aggregated_data = defaultdict(float)
             chi_ref = db.collection('Year').document(year).collection('Months').document(month).collection('Types').document('Chi')
-            chi_doc = chi_ref.get()
-
-            if chi_doc.exists:
-                doc_data = chi_doc.to_dict()
-                if 'records' in doc_data and isinstance(doc_data['records'], list):
-                    for record in doc_data['records']:
-                        if isinstance(record, dict) and 'name' in record and 'amount' in record:
-                            try:
-                                name = record['name']
-                                amount = float(record['amount'])
-                                aggregated_data[name] += amount
-                            except (ValueError, TypeError):
-                                print(f"Skipping record with invalid amount: {record}")
+            for record in RecordStore.read_records(chi_ref, fields=('name', 'amount')):
+                if 'name' in record and 'amount' in record:
+                    try:
+                        name = record['name']
+                        amount = float(record['amount'])
+                        aggregated_data[name] += amount
+                    except (ValueError, TypeError):
+                        print(f"Skipping record with invalid amount: {record}")
 
             chart_data = [{'name': name, 'value': total_amount} for name, total_amount in aggregated_data.items()]
             return chart_data
         except Exception as e:
             print(f"Error getting pie chart data for month {year}-{month}: {e}")
+            skip_cache()
             return []
 
     @staticmethod
+    @cached(_month_dependency, ttl=300, maxsize=64)
+    def get_month_types(year, month):
+        """
+        Reads every Types doc of a month in one query and returns {type_id: records}.
+        Unlike the other Dashboard methods this raises on failure, so callers that
+        share the result can report the error themselves.
+        """
+        _, month_types = RecordStore.read_month(year, month)
+        return month_types
+
+    @staticmethod
+    def summarize_month_types(month_types):
+        """Builds income/expense totals and per-category totals from get_month_types() output."""
+        totals = Rollup.empty_totals()
+        for type_id, records in month_types.items():
+            for record in records:
+                Rollup.add_record(totals, type_id, record)
+        return totals
+
+    @staticmethod
+    def recent_from_month_types(month_types, type_id='Chi', limit=5):
+        """Returns the most recent records of a type, newest first."""
+        records = [record for record in month_types.get(type_id, []) if isinstance(record, dict)]
+        return sorted(records, key=lambda x: x.get("date") or '', reverse=True)[:limit]
+
+    @staticmethod
+    @cached(['Year'], ttl=300, maxsize=4)
     def get_total_saving():
         """Calculates the total amount from all 'Tiết kiệm' (Savings) records."""
         saving_data = []
         try:
-            year_docs = db.collection('Year').stream()
-            for year_doc in year_docs:
-                month_docs = year_doc.reference.collection('Months').stream()
-                for month_doc in month_docs:
-                    saving_doc_ref = month_doc.reference.collection('Types').document('Tiết kiệm')
-                    saving_doc = saving_doc_ref.get()
-                    if saving_doc.exists:
-                        doc_data = saving_doc.to_dict()
-                        if 'records' in doc_data and isinstance(doc_data['records'], list):
-                            saving_data.extend(doc_data['records'])
+            # One collection-group query lists every month of every year (ordered by path,
+            # i.e. year then month), then all savings docs are resolved in batches.
+            month_docs = db.collection_group('Months').stream()
+            saving_refs = [month_doc.reference.collection('Types').document('Tiết kiệm') for month_doc in month_docs]
+            for _, records in RecordStore.read_many(saving_refs):
+                saving_data.extend(records)
             return saving_data
         except Exception as e:
             print(f"Error getting total savings: {e}")
+            skip_cache()
             return []
 
+    @staticmethod
+    @cached(['Year'], ttl=300, maxsize=64)
+    def get_savings_overview(page_size=0, start_after_doc_id=None, include_deposits=True):
+        """
+        Returns the aggregated savings summary (total principal, count, breakdown by
+        term and rate) plus an optional page of raw deposits, served from the
+        savings index. Until the index has been built it falls back to scanning
+        every month with get_total_saving().
+        """
+        summary = SavingsIndex.get_summary()
+        if summary is not None:
+            overview = {'summary': summary, 'data': [], 'last_doc_id': None}
+            if include_deposits:
+                overview.update(SavingsIndex.get_deposits(page_size, start_after_doc_id))
+            return overview
+
+        records = [record for record in Dashboard.get_total_saving() if isinstance(record, dict)]
+        summary = SavingsIndex.empty_summary()
+        for record in records:
+            SavingsIndex.add_to_summary(summary, record)
+        overview = {'summary': summary, 'data': [], 'last_doc_id': None}
+        if include_deposits:
+            if start_after_doc_id:
+                ids = [record.get('id') for record in records]
+                records = records[ids.index(start_after_doc_id) + 1:] if start_after_doc_id in ids else []
+            if page_size > 0:
+                records = records[:page_size]
+            overview['data'] = records
+            overview['last_doc_id'] = records[-1].get('id') if records else None
+        return overview
+
 class Loan:
     @staticmethod
+    @cached(['Loan'], ttl=300, maxsize=4)
     def get_all_loans():
         """Fetches all documents from the 'Loan' collection."""
         try:
@@ -414,56 +623,83 @@ class Loan:
             return results
         except Exception as e:
             print(f"Error getting all loans: {e}")
+            skip_cache()
             return [] # Return empty list on error
 
     @staticmethod
-    def get_list_loan(page_size=5, start_after_doc_id=None):
-        """Fetches a paginated list of loans."""
+    @cached(['Loan'], ttl=300, maxsize=64)
+    def get_list_loan(page_size=5, cursor=None, direction='next'):
+        """
+        Fetches a page of loans ordered by start date, with opaque cursors
+        (see pagination). Raises ValueError for an invalid cursor.
+        """
         try:
-            # Sorting by a field is required for cursor-based pagination
-            query = db.collection('Loan').order_by('startDate')
-
-            if start_after_doc_id:
-                start_after_doc = db.collection('Loan').document(start_after_doc_id).get()
-                if not start_after_doc.exists:
-                    # Handle case where the cursor document might have been deleted
-                    return {'data': [], 'last_doc_id': None}
-                query = query.start_after(start_after_doc)
-            if page_size > 0 :
-                query = query.limit(page_size)
-            docs_snapshot = query.stream()
-
-            results = []
-            last_doc_id = None
-            for doc in docs_snapshot:
-                doc_data = doc.to_dict()
-                doc_data['id'] = doc.id
-                results.append(doc_data)
-                last_doc_id = doc.id  # Keep track of the last document
-
-            return {'data': results, 'last_doc_id': last_doc_id}
+            page = paginate(db.collection('Loan'), ['startDate'], page_size, cursor, direction)
+            page['last_doc_id'] = page['data'][-1]['id'] if page['data'] else None
+            return page
+        except ValueError:
+            raise
         except Exception as e:
             print(f"Error getting paginated loan list: {e}")
-            return {'data': [], 'last_doc_id': None}
+            skip_cache()
+            return {'data': [], 'next_cursor': None, 'prev_cursor': None, 'last_doc_id': None}
 
     @staticmethod
-    def get_loan_payments(loan_id):
-        """Fetches the payment history for a specific loan."""
+    @cached(['Loan'], ttl=300, maxsize=256)
+    def get_loan_payments(loan_id, page_size=None, cursor=None, direction='next', newest_first=None):
+        """
+        Fetches the payment history for a specific loan. Without page_size the
+        whole history is returned as a list, unordered as before unless
+        newest_first is given. With page_size, a page {'data', 'next_cursor',
+        'prev_cursor'} (see pagination) ordered by paidDate, newest first by
+        default. Ordered reads skip repayments without a paidDate. Raises
+        ValueError for an invalid cursor.
+        """
+        repayments = db.collection('Loan').document(loan_id).collection('repayments')
         try:
-            payments_ref = db.collection('Loan').document(loan_id).collection('repayments').stream()
-            payments = []
-            for payment in payments_ref:
-                payment_data = payment.to_dict()
-                payment_data['id'] = payment.id
-                payments.append(payment_data)
-            return payments
+            if page_size:
+                order = 'paidDate' if newest_first is False else '-paidDate'
+                return paginate(repayments, [order], page_size, cursor, direction)
+            if newest_first is None:
+                docs = repayments.stream()
+            else:
+                docs = repayments.order_by('paidDate', direction=firestore.Query.DESCENDING if newest_first
+                                           else firestore.Query.ASCENDING).stream()
+            return [{**payment.to_dict(), 'id': payment.id} for payment in docs]
+        except ValueError:
+            raise
         except Exception as e:
             print(f"Error getting loan payments: {e}")
-            return []
+            skip_cache()
+            return {'data': [], 'next_cursor': None, 'prev_cursor': None} if page_size else []
+
+    @staticmethod
+    @cached(['Loan'], ttl=300, maxsize=64)
+    def get_loan_summaries(loan_ids):
+        """
+        Fetches many loans with their payment totals in one batched read.
+        Returns {'data': [...], 'missing': [...]}, data in the order of loan_ids.
+        """
+        try:
+            refs = [db.collection('Loan').document(loan_id) for loan_id in loan_ids]
+            found = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+            for loan_id, loan_data in found.items():
+                if not loan_data.get('totalsComplete'):
+                    # Not backfilled yet: the stored totals may miss older payments.
+                    repayments = db.collection('Loan').document(loan_id).collection('repayments').stream()
+                    loan_data.update(_payment_totals(payment.to_dict() for payment in repayments))
+            return {
+                'data': [_loan_summary(loan_id, found[loan_id]) for loan_id in loan_ids if loan_id in found],
+                'missing': [loan_id for loan_id in loan_ids if loan_id not in found],
+            }
+        except Exception as e:
+            print(f"Error getting loan summaries: {e}")
+            skip_cache()
+            return {'data': [], 'missing': list(loan_ids)}
 
     @staticmethod
     @firestore.transactional
-    def add_payment(transaction, loan_id, paidDate, principalPaid, interestPaid):
+    def add_payment(transaction, loan_id, paidDate, principalPaid, interestPaid, metadata_version=None):
         """
         Adds a new payment record and updates the loan's outstanding balance within a transaction.
         Note: This method must be called within a transaction context.
@@ -478,7 +714,8 @@ class Loan:
             if not loan_snapshot.exists:
                 raise ValueError(f"Loan with ID {loan_id} not found.")
             
-            current_outstanding = loan_snapshot.get('outstanding')
+            loan_data = loan_snapshot.to_dict()
+            current_outstanding = loan_data.get('outstanding')
 
             # Ensure 'outstanding' is a number
             if not isinstance(current_outstanding, (int, float)):
@@ -504,18 +741,183 @@ class Loan:
             # 4. Set the new payment document in the transaction
             transaction.set(payment_ref, sanitized_payment_data)
             
-            # 5. Update the outstanding balance in the loan document
+            # 5. Update the outstanding balance and the running payment totals in the loan document
+            last_payment_date = _naive_utc(loan_data.get('lastPaymentDate'))
             transaction.update(loan_ref, {
-                'outstanding': new_outstanding
+                'outstanding': new_outstanding,
+                'totalPrincipalPaid': firestore.Increment(principalPaid),
+                'totalInterestPaid': firestore.Increment(interestPaid),
+                'paymentCount': firestore.Increment(1),
+                'lastPaymentDate': max(last_payment_date, payment_date) if last_payment_date else payment_date,
             })
+            queue_metadata_bump(transaction, 'Loan', new_version=metadata_version)
             
             return payment_id
         except Exception as e:
             print(f"Error during add_payment transaction for loan {loan_id}: {e}")
             raise  # Re-raise the exception to ensure the transaction is rolled back
 
+    @staticmethod
+    def record_payment(loan_id, paidDate, principalPaid, interestPaid):
+        """Runs add_payment in its own transaction and invalidates cached loan reads once it commits."""
+        version = new_metadata_version()
+        payment_id = Loan.add_payment(db.transaction(), loan_id, paidDate, principalPaid, interestPaid, metadata_version=version)
+        notify_metadata_change('Loan', version)
+        return payment_id
+
+    @staticmethod
+    def get_loan_schedule(loan_id, method=None, extra_payment=0.0, lump_sum=0.0, lump_period=None):
+        """
+        The remaining amortization schedule of a loan from next month on, and
+        with a prepayment (extra_payment every month and/or lump_sum in
+        lump_period) the same schedule with and without it. None if the loan
+        does not exist; raises ValueError for an unknown method.
+        """
+        return Loan._loan_schedule(loan_id, method, extra_payment, lump_sum, lump_period,
+                                   datetime.utcnow().strftime('%Y-%m'))
+
+    @staticmethod
+    @cached(['Loan'], ttl=300, maxsize=128)
+    def _loan_schedule(loan_id, method, extra_payment, lump_sum, lump_period, as_of_month):
+        doc = db.collection('Loan').document(loan_id).get()
+        if not doc.exists:
+            return None
+        loan = doc.to_dict()
+        terms = amortization.loan_terms(loan, datetime.strptime(as_of_month, '%Y-%m'), method)
+        # Row 0 is the contractual schedule, row 1 the prepayment scenario.
+        schedules = amortization.build_schedules(
+            [terms['balance']] * 2, [terms['annual_rate']] * 2, [terms['periods']] * 2, [terms['method']] * 2,
+            extra_payment=np.array([0.0, extra_payment]),
+            lump_sums={lump_period: np.array([0.0, lump_sum])} if lump_period and lump_sum else None,
+        )
+        scenario = 1 if extra_payment or lump_sum else 0
+        result = {
+            'id': loan_id,
+            'borrowerName': loan.get('borrowerName'),
+            'method': terms['method'],
+            'annualRate': terms['annual_rate'],
+            'balance': terms['balance'],
+            'periods': terms['periods'],
+            'payoffMonth': amortization.payoff_month(terms, schedules.payoff_period[scenario]),
+            'totalInterest': float(schedules.total_interest[scenario]),
+            'schedule': schedules.rows(scenario, terms['first_due']),
+        }
+        if scenario:
+            result['baseline'] = {
+                'payoffMonth': amortization.payoff_month(terms, schedules.payoff_period[0]),
+                'totalInterest': float(schedules.total_interest[0]),
+            }
+            result['interestSaved'] = float(schedules.total_interest[0] - schedules.total_interest[1])
+            result['monthsSaved'] = int(schedules.payoff_period[0] - schedules.payoff_period[1])
+        return result
+
+    @staticmethod
+    def get_portfolio_projection(extra_payment=0.0):
+        """
+        Projected monthly payments, interest and outstanding balance across
+        all loans, and each loan's payoff month, from one vectorized pass.
+        """
+        return Loan._portfolio_projection(extra_payment, datetime.utcnow().strftime('%Y-%m'))
+
+    @staticmethod
+    @cached(['Loan'], ttl=300, maxsize=16)
+    def _portfolio_projection(extra_payment, as_of_month):
+        as_of = datetime.strptime(as_of_month, '%Y-%m')
+        loans = [loan for loan in Loan.get_all_loans() if (loan.get('outstanding') or 0) > 0]
+        terms = [amortization.loan_terms(loan, as_of) for loan in loans]
+        schedules = amortization.build_schedules(
+            [t['balance'] for t in terms], [t['annual_rate'] for t in terms],
+            [t['periods'] for t in terms], [t['method'] for t in terms], extra_payment=extra_payment,
+        )
+        return {
+            'months': amortization.project_portfolio(schedules, [t['first_due'] for t in terms]),
+            'loans': [
+                {
+                    'id': loan['id'],
+                    'borrowerName': loan.get('borrowerName'),
+                    'balance': t['balance'],
+                    'payoffMonth': amortization.payoff_month(t, schedules.payoff_period[i]),
+                    'remainingInterest': float(schedules.total_interest[i]),
+                }
+                for i, (loan, t) in enumerate(zip(loans, terms))
+            ],
+            'totalOutstanding': float(sum(t['balance'] for t in terms)),
+            'totalInterest': float(schedules.total_interest.sum()),
+        }
+
+    @staticmethod
+    @firestore.transactional
+    def _backfill_loan_totals(transaction, loan_ref, apply):
+        """
+        Recomputes one loan's totals from its repayments, read in the
+        transaction so a payment committed meanwhile is not overwritten.
+        With apply, writes them and marks them complete. Returns the
+        differing fields as {field: (stored, actual)}.
+        """
+        stored = loan_ref.get(transaction=transaction).to_dict() or {}
+        repayments = loan_ref.collection('repayments').stream(transaction=transaction)
+        actual = _payment_totals(payment.to_dict() for payment in repayments)
+        changed = {field: (stored.get(field), value) for field, value in actual.items()
+                   if (_naive_utc(stored.get(field)) if field == 'lastPaymentDate' else stored.get(field)) != value}
+        if apply and (changed or not stored.get('totalsComplete')):
+            transaction.update(loan_ref, {**actual, 'totalsComplete': True})
+        return changed
+
+    @staticmethod
+    def backfill_payment_totals(apply=True):
+        """
+        Recomputes the payment totals of every loan from its repayments.
+        Returns a list of (loan_id, field, stored, actual) for every total that
+        differed; with apply, each loan is rewritten in its own transaction
+        and its totals are marked complete (see get_loan_summaries).
+        """
+        drift = []
+        for loan in db.collection('Loan').select([]).stream():
+            changed = Loan._backfill_loan_totals(db.transaction(), loan.reference, apply)
+            drift += [(loan.id, field, stored, actual) for field, (stored, actual) in changed.items()]
+
+        if apply:
+            batch = db.batch()
+            version = queue_metadata_bump(batch, 'Loan')
+            batch.commit()
+            notify_metadata_change('Loan', version)
+        return drift
+
+
+def _naive_utc(value):
+    """Firestore returns timestamps as aware UTC datetimes; the app writes naive UTC ones."""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _payment_totals(payments):
+    """The denormalized totals of a loan, computed from its repayment dicts."""
+    totals = {'totalPrincipalPaid': 0, 'totalInterestPaid': 0, 'paymentCount': 0, 'lastPaymentDate': None}
+    for payment in payments:
+        totals['totalPrincipalPaid'] += payment.get('principalPaid') or 0
+        totals['totalInterestPaid'] += payment.get('interestPaid') or 0
+        totals['paymentCount'] += 1
+        paid_date = _naive_utc(payment.get('paidDate'))
+        if paid_date and (totals['lastPaymentDate'] is None or paid_date > totals['lastPaymentDate']):
+            totals['lastPaymentDate'] = paid_date
+    return totals
+
+
+def _loan_summary(loan_id, loan_data):
+    """A loan with its denormalized payment totals (zero for loans without payments)."""
+    return {
+        **loan_data,
+        'id': loan_id,
+        'totalPrincipalPaid': loan_data.get('totalPrincipalPaid', 0),
+        'totalInterestPaid': loan_data.get('totalInterestPaid', 0),
+        'paymentCount': loan_data.get('paymentCount', 0),
+        'lastPaymentDate': loan_data.get('lastPaymentDate'),
+    }
+
 class BookStore:
     @staticmethod
+    @cached(['Books'], ttl=300, maxsize=4)
     def get_all_books():
         try:
             docs = db.collection('Books').stream()
@@ -527,4 +929,17 @@ class BookStore:
             return results
         except Exception as e:
             print(f"Error getting all books: {e}")
+            skip_cache()
             return []
+
+    @staticmethod
+    @cached(['books'], ttl=300, maxsize=4)
+    def count_books():
+        """Counts the documents in the 'books' collection with an aggregation query."""
+        result = db.collection('books').count().get()
+        return result[0][0].value
+
+    @staticmethod
+    def get_books_on_shelf(row_index, unit_index, comp_index):
+        """The books stored in one shelf compartment, from the shelf index."""
+        return [dict(book) for book in get_shelf_index().books_in(row_index, unit_index, comp_index)]
@@ -1,6 +1,6 @@
 from flask import jsonify, request
 from .firebase_config import db
-from .decorators import update_metadata_on_change, cached_query
+from .decorators import update_metadata_on_change, cached_query, cached
 import traceback
 import bleach
 
@@ -10,8 +10,16 @@ class CRUDApi:
     for any collection in Firestore.
     """
     def __init__(self, collection_name):
-        self.collection = db.collection(collection_name)
         self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        # Resolved per use, so module-level instances don't open Firestore at import time.
+        return db.collection(self.collection_name)
+
+    def __repr__(self):
+        # Used in cache keys, so it must identify the collection.
+        return f"CRUDApi({self.collection_name!r})"
     
     @cached_query
     def get_all(self):
@@ -51,13 +59,19 @@ class CRUDApi:
             traceback.print_exc() # Prints the full stack trace
             return jsonify({"error": str(e)}), 500
 
+    @cached(lambda self, doc_id: [self.collection_name], ttl=300, maxsize=512)
+    def fetch_one(self, doc_id):
+        """Returns a document as a dict with its ID, or None if it does not exist."""
+        doc = self.collection.document(doc_id).get()
+        return {**doc.to_dict(), 'id': doc.id} if doc.exists else None
+
     def get_one(self, doc_id):
         """Fetches a specific document by its ID."""
         try:
-            doc = self.collection.document(doc_id).get()
-            if not doc.exists:
+            document = self.fetch_one(doc_id)
+            if document is None:
                 return jsonify({"error": "Document not found"}), 404
-            return jsonify({**doc.to_dict(), 'id': doc.id}), 200
+            return jsonify(document), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,188 @@
+"""
+Per-process L1 cache that sits in front of Redis for versioned query results.
+
+Consistency contract:
+  - An entry is served without any network call for at most
+    L1_CACHE_CHECK_INTERVAL seconds after its version was last confirmed
+    against `metadata/{collection}`. That interval is the maximum staleness a
+    reader can observe for writes made by *other* processes (unless a version
+    is pushed earlier with `note_version`).
+  - Writes made through this process (update_metadata_on_change) invalidate
+    the collection's entries immediately, so the writing process always reads
+    its own writes. Versions pushed by other processes only mark entries
+    stale, so callers that opt in can serve them while they recompute.
+  - No entry lives longer than L1_CACHE_TTL seconds, confirmed or not.
+Memory is bounded by both an entry count and an approximate payload size;
+the least recently used entries are evicted first.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.api.metrics import register_source
+
+L1_CACHE_MAXSIZE = int(os.environ.get('L1_CACHE_MAXSIZE', '256'))
+L1_CACHE_MAX_BYTES = int(os.environ.get('L1_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+L1_CACHE_TTL = float(os.environ.get('L1_CACHE_TTL', '300'))
+L1_CACHE_CHECK_INTERVAL = float(os.environ.get('L1_CACHE_CHECK_INTERVAL', '2'))
+
+
+# checked_at of an entry whose versions are known to be outdated.
+STALE = float('-inf')
+
+
+def _same_versions(a, b):
+    return a.keys() == b.keys() and all(str(a[k]) == str(b[k]) for k in a)
+
+
+class CacheEntry:
+    __slots__ = ('value', 'versions', 'size', 'stored_at', 'checked_at')
+
+    def __init__(self, value, versions, size, now):
+        self.value = value
+        # {namespace: version} for every collection the value was read from.
+        self.versions = versions
+        self.size = size
+        self.stored_at = now
+        self.checked_at = now
+
+
+class LocalCache:
+    """A thread-safe LRU/TTL map of key -> (value, {namespace: version})."""
+
+    def __init__(self, maxsize=L1_CACHE_MAXSIZE, max_bytes=L1_CACHE_MAX_BYTES,
+                 ttl=L1_CACHE_TTL, check_interval=L1_CACHE_CHECK_INTERVAL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0,
+                       'expirations': 0, 'invalidations': 0}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def get(self, key):
+        """
+        Returns (entry, fresh). `fresh` is True when the entry's version was
+        confirmed within check_interval and can be served as is; otherwise
+        the caller should compare entry.versions with the current versions and
+        call `confirm` or `put`. Returns (None, False) on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, False
+            now = self._clock()
+            if now - entry.stored_at >= self.ttl:
+                self._drop(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = now - entry.checked_at < self.check_interval
+            if fresh:
+                self._stats['hits'] += 1
+            return entry, fresh
+
+    def confirm(self, key, versions):
+        """Marks an entry as checked now if `versions` are still its versions; returns whether they were."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not _same_versions(entry.versions, versions):
+                self._stats['misses'] += 1
+                return False
+            entry.checked_at = self._clock()
+            self._stats['revalidated'] += 1
+            return True
+
+    def put(self, key, value, versions, size=0):
+        with self._lock:
+            self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = CacheEntry(value, dict(versions), size, self._clock())
+            self._bytes += size
+            while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, namespace):
+        """Drops every entry of a namespace (e.g. a collection name)."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if namespace in entry.versions]:
+                self._drop(key)
+                self._stats['invalidations'] += 1
+
+    def note_version(self, namespace, version):
+        """
+        Applies a pushed version for a namespace: entries holding any other
+        version of it are marked stale (never served as fresh again, but kept
+        for stale-while-revalidate until replaced or evicted), and entries
+        that depend on that namespace alone count as freshly checked.
+        """
+        with self._lock:
+            now = self._clock()
+            for entry in self._entries.values():
+                if namespace not in entry.versions:
+                    continue
+                if str(entry.versions[namespace]) == str(version):
+                    if len(entry.versions) == 1 and entry.checked_at != STALE:
+                        entry.checked_at = now
+                elif entry.checked_at != STALE:
+                    entry.checked_at = STALE
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['revalidated'] + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxsize': self.maxsize,
+                'max_bytes': self.max_bytes,
+                'hit_ratio': round((self._stats['hits'] + self._stats['revalidated']) / lookups, 4) if lookups else None,
+            }
+
+
+# Shared instance used by decorators.cached_query.
+query_cache = LocalCache()
+register_source('l1_cache', query_cache.stats)
+
+# Every cache created through `create_cache`, so version pushes and
+# invalidations reach all of them.
+_caches = [query_cache]
+
+
+def create_cache(name, **kwargs):
+    """Creates a LocalCache that receives invalidations and reports as `l1_cache.{name}`."""
+    cache = LocalCache(**kwargs)
+    _caches.append(cache)
+    register_source(f'l1_cache.{name}', cache.stats)
+    return cache
+
+
+def invalidate_all(namespace):
+    for cache in _caches:
+        cache.invalidate(namespace)
+
+
+def note_version_all(namespace, version):
+    for cache in _caches:
+        cache.note_version(namespace, version)
@@ -0,0 +1,244 @@
+"""
+Keeps an in-memory copy of the `metadata` collection so caches can validate
+versions without a Firestore read per request.
+
+Each worker process runs:
+  - a Firestore on_snapshot listener on `metadata`, supervised and reconnected
+    with exponential backoff when the stream closes;
+  - a poller that reads the collection every METADATA_POLL_INTERVAL seconds,
+    but only while the listener is down;
+  - a Redis pub/sub subscriber, so a version bumped by a sibling worker
+    evicts this worker's L1 entries without waiting for Firestore.
+
+`current_version` returns None whenever the copy cannot be trusted (watcher
+disabled or not started, listener down and no recent poll); callers then
+read `metadata/{collection}` themselves, as before.
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from .firebase_config import db
+from .local_cache import note_version_all
+from . import versioning
+from src.api.redis_cache import get_redis_client, redis_enabled, create_pubsub
+from src.api.metrics import register_source
+
+METADATA_WATCHER = os.environ.get('METADATA_WATCHER', 'on')
+METADATA_POLL_INTERVAL = float(os.environ.get('METADATA_POLL_INTERVAL', '2'))
+RECONNECT_MAX_BACKOFF = 60.0
+INVALIDATION_CHANNEL = 'metadata:invalidate'
+
+
+def _is_newer(version, current):
+    if current is None:
+        return True
+    try:
+        return float(version) > float(current)
+    except (TypeError, ValueError):
+        return version != current
+
+
+class MetadataWatcher:
+    """Per-process mirror of `metadata/*`, fed by a listener, a poller and Redis pub/sub."""
+
+    def __init__(self, poll_interval=METADATA_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._documents = {}  # collection -> metadata dict
+        self._versions = {}   # collection -> current version (Firestore, or a newer pushed hint)
+        self._authoritative = {}  # collection -> last version read from Firestore
+        self._listeners = [note_version_all]
+        self._lock = threading.Lock()
+        self._watch = None
+        self._listening = False
+        self._polled_at = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._origin = uuid.uuid4().hex
+        self._stats = {'snapshots': 0, 'polls': 0, 'reconnects': 0, 'published': 0, 'received': 0, 'errors': 0}
+
+    # --- reads ---
+
+    def _trusted(self):
+        if self._pid != os.getpid():
+            return False
+        if self._listening:
+            return True
+        return self._polled_at is not None and time.monotonic() - self._polled_at < 2 * self.poll_interval
+
+    def current_version(self, collection):
+        """The collection's current version, or None if the caller must read it from Firestore."""
+        with self._lock:
+            if not self._trusted() or collection not in self._versions:
+                return None
+            return self._versions[collection]
+
+    def current(self, collection):
+        """The full metadata dict, or None if it is unknown or older than a pushed version."""
+        with self._lock:
+            if not self._trusted():
+                return None
+            document = self._documents.get(collection)
+            if document is None or document.get('version') != self._versions.get(collection):
+                return None
+            return dict(document)
+
+    def add_listener(self, callback):
+        """Registers callback(collection, version), called whenever a newer version is seen."""
+        self._listeners.append(callback)
+
+    # --- updates ---
+
+    def _apply(self, collection, version, document=None):
+        updates = {collection: version}
+        if document is not None and collection == versioning.ROOT:
+            # Each year/month/type level of metadata/Year is a dependency of its own.
+            updates.update({name: value for name, value in versioning.expand(document).items()
+                            if value is not None})
+        changed = []
+        with self._lock:
+            for name, value in updates.items():
+                if value is None:
+                    continue
+                if document is not None:
+                    # Firestore is authoritative: any version that differs from the last
+                    # one read is a change, whatever its timestamp (hosts' clocks differ).
+                    if value == self._authoritative.get(name):
+                        continue
+                    self._authoritative[name] = value
+                elif not _is_newer(value, self._authoritative.get(name)):
+                    # A pushed hint only counts while Firestore hasn't caught up with it.
+                    continue
+                if value != self._versions.get(name):
+                    self._versions[name] = value
+                    changed.append((name, value))
+            if document is not None:
+                self._documents[collection] = document
+        for name, value in changed:
+            for callback in self._listeners:
+                try:
+                    callback(name, value)
+                except Exception as e:
+                    print(f"Error in metadata listener: {e}")
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for doc in docs:
+            data = doc.to_dict() or {}
+            self._apply(doc.id, data.get('version'), data)
+        self._stats['snapshots'] += 1
+        self._listening = True
+
+    def _poll(self):
+        for doc in db.collection('metadata').stream():
+            data = doc.to_dict() or {}
+            self._apply(doc.id, data.get('version'), data)
+        self._polled_at = time.monotonic()
+        self._stats['polls'] += 1
+
+    def publish(self, collection, version, names=None):
+        """
+        Applies a version bump locally and tells sibling workers about it.
+        `names` are the hierarchical dependencies bumped with it, if any.
+        """
+        names = [name for name in (names or []) if name != collection]
+        for name in [collection] + names:
+            self._apply(name, version)
+        redis_client = get_redis_client()
+        if not redis_client:
+            return
+        try:
+            message = json.dumps({'collection': collection, 'version': version, 'names': names,
+                                  'origin': self._origin})
+            redis_client.publish(INVALIDATION_CHANNEL, message)
+            self._stats['published'] += 1
+        except Exception as e:
+            self._stats['errors'] += 1
+            print(f"Error publishing metadata invalidation: {e}")
+
+    # --- background threads ---
+
+    def _listener_alive(self):
+        return self._watch is not None and getattr(self._watch, 'is_active', True)
+
+    def _supervise(self):
+        backoff, next_attempt = 1.0, 0.0
+        while not self._stop.is_set():
+            if not self._listener_alive():
+                self._listening = False
+                if time.monotonic() >= next_attempt:
+                    try:
+                        if self._watch is not None:
+                            self._watch.unsubscribe()
+                            self._stats['reconnects'] += 1
+                        self._watch = db.collection('metadata').on_snapshot(self._on_snapshot)
+                        backoff = 1.0
+                    except Exception as e:
+                        self._watch = None
+                        self._stats['errors'] += 1
+                        next_attempt = time.monotonic() + backoff + random.uniform(0, backoff / 2)
+                        backoff = min(backoff * 2, RECONNECT_MAX_BACKOFF)
+                        print(f"Metadata listener unavailable, polling instead: {e}")
+            # Until the listener delivers its first snapshot (or while it is down) poll instead.
+            if not self._listening:
+                try:
+                    self._poll()
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    print(f"Error polling metadata: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _subscribe(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            if not redis_enabled():
+                return
+            pubsub = None
+            try:
+                pubsub = create_pubsub()
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                backoff = 1.0
+                for message in pubsub.listen():
+                    if self._stop.is_set():
+                        break
+                    data = json.loads(message['data'])
+                    if data.get('origin') != self._origin:
+                        self._stats['received'] += 1
+                        for name in [data['collection']] + data.get('names', []):
+                            self._apply(name, data['version'])
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"Metadata pub/sub disconnected, retrying in {backoff:.0f}s: {e}")
+                if pubsub is not None:
+                    pubsub.close()
+            self._stop.wait(backoff + random.uniform(0, backoff / 2))
+            backoff = min(backoff * 2, RECONNECT_MAX_BACKOFF)
+
+    def ensure_started(self):
+        """Starts the background threads once per process (again after a fork)."""
+        if METADATA_WATCHER == 'off' or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._watch, self._listening, self._polled_at = None, False, None
+            self._stop.clear()
+        threading.Thread(target=self._supervise, name='metadata-watcher', daemon=True).start()
+        threading.Thread(target=self._subscribe, name='metadata-pubsub', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+        self._listening = False
+
+    def stats(self):
+        return {**self._stats, 'listening': self._listening, 'trusted': self._trusted(),
+                'collections': len(self._versions)}
+
+
+watcher = MetadataWatcher()
+register_source('metadata_watcher', watcher.stats)
@@ -0,0 +1,136 @@
+"""
+Keyset pagination with opaque cursor tokens.
+
+A cursor carries the order-by values and the id of the document a page
+starts or ends at, so the adjacent page is one query with start_after /
+end_before, with no read of the cursor document and no count().
+
+Tokens are `base64url(json).signature`, signed with HMAC-SHA256 under
+CURSOR_SECRET (falling back to API_SECRET_KEY): clients cannot forge query
+positions, and a cursor made for another ordering is rejected. Without
+either, a public development key is used and a warning is printed at
+startup; such cursors can be forged.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+from datetime import datetime
+
+from google.cloud import firestore
+
+DEV_CURSOR_SECRET = 'dev-cursor-secret'
+CURSOR_SECRET = (os.environ.get('CURSOR_SECRET') or os.environ.get('API_SECRET_KEY') or DEV_CURSOR_SECRET).encode('utf-8')
+if CURSOR_SECRET == DEV_CURSOR_SECRET.encode('utf-8'):
+    # The fallback is public, so anyone can sign a cursor for any query position.
+    print("WARNING: Neither CURSOR_SECRET nor API_SECRET_KEY is set; pagination cursors are signed "
+          "with a public development key and can be forged. Set CURSOR_SECRET in production.")
+NAME_FIELD = '__name__'
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return {'$t': value.isoformat()}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict) and set(value) == {'$t'}:
+        return datetime.fromisoformat(value['$t'])
+    return value
+
+
+def _sign(body):
+    return _b64(hmac.new(CURSOR_SECRET, body.encode('ascii'), hashlib.sha256).digest()[:16])
+
+
+def encode_cursor(order_by, values, doc_id):
+    """Token for the position of a document in a query ordered by `order_by` fields."""
+    body = _b64(json.dumps({'o': order_by, 'v': [_to_json(v) for v in values], 'id': doc_id},
+                           separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+    return f"{body}.{_sign(body)}"
+
+
+def decode_cursor(token, order_by):
+    """Returns (values, doc_id); raises ValueError for a tampered, malformed or foreign token."""
+    try:
+        body, signature = token.split('.', 1)
+        if not hmac.compare_digest(signature, _sign(body)):
+            raise ValueError('bad signature')
+        data = json.loads(_unb64(body))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if data.get('o') != list(order_by) or not isinstance(data.get('id'), str):
+        raise ValueError('Cursor does not belong to this listing')
+    return [_from_json(v) for v in data['v']], data['id']
+
+
+def _field_value(snapshot, field):
+    try:
+        return snapshot.get(field)
+    except KeyError:
+        return None
+
+
+def _order(spec):
+    """'field' -> ('field', ASCENDING), '-field' -> ('field', DESCENDING)."""
+    if spec.startswith('-'):
+        return spec[1:], firestore.Query.DESCENDING
+    return spec, firestore.Query.ASCENDING
+
+
+def paginate(collection_ref, order_by=(), page_size=10, cursor=None, direction='next', fields=None):
+    """
+    One page of `collection_ref` ordered by the `order_by` fields (prefix a
+    field with '-' for descending) and then by document id, in the direction
+    of the last field. `cursor` is a token from a previous page; `direction`
+    is 'next' (documents after it) or 'prev' (documents before it). `fields`
+    projects the documents to those fields (plus the order-by fields).
+
+    Returns {'data', 'next_cursor', 'prev_cursor'}; a cursor is None when there
+    is no page in that direction. One extra document is fetched to tell
+    whether another page exists.
+    """
+    if direction not in ('next', 'prev'):
+        raise ValueError("direction must be 'next' or 'prev'")
+    order_by = list(order_by)
+    order_fields = [_order(spec)[0] for spec in order_by]
+    query = collection_ref
+    if fields:
+        query = query.select(list(dict.fromkeys([*fields, *order_fields])))
+    for spec in order_by:
+        query = query.order_by(*_order(spec))
+    name_direction = _order(order_by[-1])[1] if order_by else firestore.Query.ASCENDING
+    query = query.order_by(firestore.Client.field_path(NAME_FIELD), direction=name_direction)
+
+    if cursor:
+        values, doc_id = decode_cursor(cursor, order_by)
+        position = {**dict(zip(order_fields, values)), NAME_FIELD: doc_id}
+        query = query.start_after(position) if direction == 'next' else query.end_before(position)
+
+    if direction == 'prev':
+        docs = list(query.limit_to_last(page_size + 1).stream())
+        more_before, docs = len(docs) > page_size, docs[-page_size:]
+        more_after = bool(cursor)
+    else:
+        docs = list(query.limit(page_size + 1).stream())
+        more_after, docs = len(docs) > page_size, docs[:page_size]
+        more_before = bool(cursor)
+
+    def position_of(doc):
+        return encode_cursor(order_by, [_field_value(doc, field) for field in order_fields], doc.id)
+
+    return {
+        'data': [{**doc.to_dict(), 'id': doc.id} for doc in docs],
+        'next_cursor': position_of(docs[-1]) if docs and more_after else None,
+        'prev_cursor': position_of(docs[0]) if docs and more_before else None,
+    }
@@ -0,0 +1,346 @@
+"""
+Storage layouts for management records.
+
+Records historically live in a `records` array on each
+`Year/{year}/Months/{month}/Types/{type}` document. The document layout stores
+one document per record instead, at
+`Year/{year}/Months/{month}/Types/{type}/Records/{recordId}`, which makes edits
+and deletes single-document operations.
+
+RECORD_STORAGE selects the layout:
+  - 'array'     : legacy layout only (default).
+  - 'dual'      : cutover mode. New records are written as documents and reads
+                  merge both layouts (a record document wins over an array entry
+                  with the same id). Updating or deleting a record that is still
+                  in an array moves it out of the array.
+  - 'documents' : document layout only, once `flask records migrate` has finished.
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import firestore
+from .firebase_config import db
+
+RECORD_STORAGE = os.environ.get('RECORD_STORAGE', 'array')
+RECORDS_SUBCOLLECTION = 'Records'
+
+MIGRATION_REF_PATH = ('migrations', 'record_documents')
+# Firestore caps a transaction at 500 writes; one slot is kept for clearing the array.
+MIGRATION_BATCH_SIZE = 499
+
+# Bounded pool used to stream several Records subcollections concurrently.
+_read_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='record-store')
+
+# Upper bound on references resolved by a single batched get_all call.
+GET_ALL_CHUNK_SIZE = 100
+
+
+def get_all_in_order(refs):
+    """
+    Resolves many document references with batched get_all round trips instead of
+    one get() per document. get_all yields snapshots in arbitrary order, so they
+    are returned re-ordered to match `refs` (missing documents included).
+    """
+    snapshots = {}
+    for start in range(0, len(refs), GET_ALL_CHUNK_SIZE):
+        for snapshot in db.get_all(refs[start:start + GET_ALL_CHUNK_SIZE]):
+            snapshots[snapshot.reference.path] = snapshot
+    return [snapshots[ref.path] for ref in refs if ref.path in snapshots]
+
+
+def reads_arrays():
+    return RECORD_STORAGE in ('array', 'dual')
+
+
+def reads_documents():
+    return RECORD_STORAGE in ('dual', 'documents')
+
+
+def _array_records(type_snapshot):
+    if type_snapshot is None or not type_snapshot.exists:
+        return []
+    records = (type_snapshot.to_dict() or {}).get('records', [])
+    return [record for record in records if isinstance(record, dict)] if isinstance(records, list) else []
+
+
+def _merge(array_records, document_records):
+    """Combines both layouts; a record document replaces the array entry with the same id."""
+    document_ids = {record.get('id') for record in document_records}
+    return [record for record in array_records if record.get('id') not in document_ids] + document_records
+
+
+class RecordStore:
+    """Reads and writes management records in the layout selected by RECORD_STORAGE."""
+
+    @staticmethod
+    def records_ref(type_ref):
+        return type_ref.collection(RECORDS_SUBCOLLECTION)
+
+    # --- reads ---
+
+    @staticmethod
+    def _document_records(type_ref, fields=None, order_by=None, limit=None, transaction=None):
+        query = RecordStore.records_ref(type_ref)
+        if fields:
+            query = query.select(sorted(set(fields) | {'id'}))
+        if order_by:
+            query = query.order_by(order_by, direction=firestore.Query.DESCENDING)
+        if limit:
+            query = query.limit(limit)
+        return [{**doc.to_dict(), 'id': doc.id} for doc in query.stream(transaction=transaction)]
+
+    @staticmethod
+    def read_records(type_ref, type_snapshot=None, fields=None, transaction=None):
+        """
+        Returns the records of one Types doc. `type_snapshot` saves a read if
+        already fetched; with `transaction`, the reads are made in it.
+        """
+        array_records = []
+        if reads_arrays():
+            if type_snapshot is None:
+                type_snapshot = type_ref.get(transaction=transaction)
+            array_records = _array_records(type_snapshot)
+        document_records = (RecordStore._document_records(type_ref, fields, transaction=transaction)
+                            if reads_documents() else [])
+        return _merge(array_records, document_records)
+
+    @staticmethod
+    def read_many(type_refs, fields=None):
+        """
+        Returns [(type_ref, records)] for many Types docs, in the order of
+        `type_refs`. Array docs are resolved with batched get_all calls and
+        Records subcollections are streamed concurrently on a bounded pool.
+        """
+        array_records = {}
+        if reads_arrays():
+            for snapshot in get_all_in_order(type_refs):
+                array_records[snapshot.reference.path] = _array_records(snapshot)
+        document_records = {}
+        if reads_documents():
+            futures = {ref.path: _read_executor.submit(RecordStore._document_records, ref, fields) for ref in type_refs}
+            document_records = {path: future.result() for path, future in futures.items()}
+        return [
+            (ref, _merge(array_records.get(ref.path, []), document_records.get(ref.path, [])))
+            for ref in type_refs
+        ]
+
+    @staticmethod
+    def read_month(year, month, fields=None):
+        """Returns (type_snapshots, {type_id: records}) for every Types doc of a month."""
+        types_ref = db.collection('Year').document(year).collection('Months').document(month).collection('Types')
+        type_docs = list(types_ref.stream())
+        if reads_documents():
+            futures = [_read_executor.submit(RecordStore._document_records, doc.reference, fields) for doc in type_docs]
+            document_records = [future.result() for future in futures]
+        else:
+            document_records = [[] for _ in type_docs]
+        month_records = {}
+        for type_doc, doc_records in zip(type_docs, document_records):
+            array_records = _array_records(type_doc) if reads_arrays() else []
+            month_records[type_doc.id] = _merge(array_records, doc_records)
+        return type_docs, month_records
+
+    @staticmethod
+    def recent(type_ref, limit=10):
+        """Returns the newest records of a Types doc by `date`."""
+        array_records = _array_records(type_ref.get()) if reads_arrays() else []
+        document_records = RecordStore._document_records(type_ref, order_by='date', limit=limit) if reads_documents() else []
+        records = _merge(array_records, document_records)
+        return sorted(records, key=lambda x: x.get("date") or '', reverse=True)[:limit]
+
+    @staticmethod
+    def iter_all():
+        """Yields (year, month, type_id, record) for every record in the database."""
+        seen = set()
+        if reads_documents():
+            for record_doc in db.collection_group(RECORDS_SUBCOLLECTION).stream():
+                # Year/{year}/Months/{month}/Types/{type}/Records/{id}
+                type_ref = record_doc.reference.parent.parent
+                month_ref = type_ref.parent.parent
+                seen.add((type_ref.path, record_doc.id))
+                yield month_ref.parent.parent.id, month_ref.id, type_ref.id, {**record_doc.to_dict(), 'id': record_doc.id}
+        if reads_arrays():
+            for type_doc in db.collection_group('Types').stream():
+                # Year/{year}/Months/{month}/Types/{type}
+                month_ref = type_doc.reference.parent.parent
+                for record in _array_records(type_doc):
+                    if (type_doc.reference.path, record.get('id')) not in seen:
+                        yield month_ref.parent.parent.id, month_ref.id, type_doc.id, record
+
+    # --- writes ---
+
+    @staticmethod
+    def add(writer, type_ref, record):
+        """Queues the write of a new record on a WriteBatch or Transaction."""
+        if RECORD_STORAGE == 'array':
+            writer.set(type_ref, {'records': firestore.ArrayUnion([record])}, merge=True)
+        else:
+            # Keep the Types doc itself so the month's Types can still be listed.
+            writer.set(type_ref, {}, merge=True)
+            writer.set(RecordStore.records_ref(type_ref).document(record['id']), record)
+
+    @staticmethod
+    def add_many(writer, type_ref, records):
+        """Queues the writes for several new records of one Types doc. Returns the number of writes."""
+        if RECORD_STORAGE == 'array':
+            writer.set(type_ref, {'records': firestore.ArrayUnion(list(records))}, merge=True)
+            return 1
+        writer.set(type_ref, {}, merge=True)
+        for record in records:
+            writer.set(RecordStore.records_ref(type_ref).document(record['id']), record)
+        return 1 + len(records)
+
+    @staticmethod
+    def write_cost(record_count):
+        """Number of batch writes add_many needs for `record_count` records."""
+        return 1 if RECORD_STORAGE == 'array' else 1 + record_count
+
+    @staticmethod
+    def _find_in_array(transaction, type_ref, record_id, required):
+        doc = type_ref.get(transaction=transaction)
+        if not doc.exists:
+            if required:
+                raise Exception("Document not found")
+            return [], None
+        records = doc.to_dict().get('records', [])
+        return records, next((record for record in records if record.get('id') == record_id), None)
+
+    @staticmethod
+    def update_in_transaction(transaction, type_ref, record_id, merge_record):
+        """
+        Applies `merge_record(old_record) -> new_record` to one record inside a
+        transaction and returns (old_record, new_record).
+        """
+        if RECORD_STORAGE != 'array':
+            record_ref = RecordStore.records_ref(type_ref).document(record_id)
+            snapshot = record_ref.get(transaction=transaction)
+            if snapshot.exists:
+                old_record = {**snapshot.to_dict(), 'id': record_id}
+                new_record = merge_record(old_record)
+                transaction.set(record_ref, new_record)
+                return old_record, new_record
+            if RECORD_STORAGE == 'documents':
+                raise Exception("Record with specified ID not found in document")
+
+        records, old_record = RecordStore._find_in_array(transaction, type_ref, record_id, required=True)
+        if old_record is None:
+            raise Exception("Record with specified ID not found in document")
+        new_record = merge_record(old_record)
+        if RECORD_STORAGE == 'array':
+            # Write the entire modified array back to the document
+            updated_records = [new_record if record.get('id') == record_id else record for record in records]
+            transaction.update(type_ref, {'records': updated_records})
+        else:
+            # Dual mode: the edited record moves out of the array into its own document.
+            transaction.update(type_ref, {'records': [record for record in records if record.get('id') != record_id]})
+            transaction.set(RecordStore.records_ref(type_ref).document(record_id), new_record)
+        return old_record, new_record
+
+    @staticmethod
+    def delete_in_transaction(transaction, type_ref, record_id):
+        """Deletes one record inside a transaction and returns it (None if it did not exist)."""
+        old_record = None
+        record_ref = RecordStore.records_ref(type_ref).document(record_id)
+        if RECORD_STORAGE != 'array':
+            snapshot = record_ref.get(transaction=transaction)
+            if snapshot.exists:
+                old_record = {**snapshot.to_dict(), 'id': record_id}
+
+        if RECORD_STORAGE == 'documents':
+            if old_record is not None:
+                transaction.delete(record_ref)
+            return old_record
+
+        records, array_record = RecordStore._find_in_array(
+            transaction, type_ref, record_id, required=RECORD_STORAGE == 'array')
+        if old_record is not None:
+            transaction.delete(record_ref)
+        if array_record is not None or RECORD_STORAGE == 'array':
+            # Create a new list excluding the record to be deleted
+            transaction.update(type_ref, {'records': [record for record in records if record.get('id') != record_id]})
+        return old_record or array_record
+
+    # --- migration ---
+
+    @staticmethod
+    def migration_ref():
+        return db.collection(MIGRATION_REF_PATH[0]).document(MIGRATION_REF_PATH[1])
+
+    @staticmethod
+    def migration_status():
+        doc = RecordStore.migration_ref().get()
+        return doc.to_dict() if doc.exists else {}
+
+    @staticmethod
+    @firestore.transactional
+    def _migrate_chunk(transaction, type_ref):
+        """
+        Moves up to MIGRATION_BATCH_SIZE array records of one Types doc into
+        documents, re-reading the array and the record documents in the
+        transaction so a concurrent dual-mode edit or append is never lost.
+        Returns (records moved, whether the array is now cleared).
+        """
+        snapshot = type_ref.get(transaction=transaction)
+        records = _array_records(snapshot)
+        if not records:
+            return 0, True
+        if any(not record.get('id') for record in records):
+            # Legacy records without an id get one first, so every record can
+            # be given its own document and the array can be cleared safely.
+            transaction.update(type_ref, {'records': [
+                record if record.get('id') else {**record, 'id': str(uuid.uuid4())} for record in records
+            ]})
+            return 0, False
+        refs = [RecordStore.records_ref(type_ref).document(record['id']) for record in records]
+        existing = {doc.id for doc in transaction.get_all(refs) if doc.exists}
+        pending = [record for record in records if record['id'] not in existing]
+        for record in pending[:MIGRATION_BATCH_SIZE]:
+            transaction.set(RecordStore.records_ref(type_ref).document(record['id']), record)
+        cleared = len(pending) <= MIGRATION_BATCH_SIZE
+        if cleared:
+            # The array is cleared only once every record has its own document.
+            transaction.update(type_ref, {'records': firestore.DELETE_FIELD})
+        return min(len(pending), MIGRATION_BATCH_SIZE), cleared
+
+    @staticmethod
+    def migrate(restart=False, log=print):
+        """
+        Moves every `records` array into per-record documents, one Types doc at
+        a time, in document-path order. Progress is checkpointed after each
+        Types doc, so an interrupted run resumes where it stopped. Records that
+        already have a document (e.g. edited in dual mode) are left untouched,
+        and records without an id are given one.
+        """
+        if RECORD_STORAGE == 'array':
+            raise RuntimeError("Set RECORD_STORAGE=dual on every worker before migrating, or reads will miss migrated records.")
+
+        status = {} if restart else RecordStore.migration_status()
+        query = db.collection_group('Types').order_by('__name__')
+        if status.get('last_path') and not status.get('done'):
+            query = query.start_after(db.document(status['last_path']).get())
+        elif status.get('done'):
+            log("Migration already completed.")
+            return status
+
+        migrated_types = status.get('migrated_types', 0)
+        migrated_records = status.get('migrated_records', 0)
+        for type_doc in query.stream():
+            if _array_records(type_doc):
+                moved, cleared = 0, False
+                while not cleared:
+                    chunk, cleared = RecordStore._migrate_chunk(db.transaction(), type_doc.reference)
+                    moved += chunk
+                migrated_records += moved
+                migrated_types += 1
+                log(f"Migrated {moved} records from {type_doc.reference.path}")
+
+            RecordStore.migration_ref().set({
+                'last_path': type_doc.reference.path,
+                'migrated_types': migrated_types,
+                'migrated_records': migrated_records,
+                'done': False,
+            })
+
+        status = {'migrated_types': migrated_types, 'migrated_records': migrated_records, 'done': True}
+        RecordStore.migration_ref().set(status)
+        return status
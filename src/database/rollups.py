@@ -0,0 +1,220 @@
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from .firebase_config import db
+from .record_store import RecordStore
+
+# Rollup documents live in their own collection so a dashboard read is a single
+# point lookup:
+#   rollups/{year}          -> totals for the whole year
+#   rollups/{year}-{month}  -> totals for one month
+# The first record write after deploy creates these documents with only its
+# own delta, so they are trusted only once `rebuild` has marked the year
+# document `complete`; until then readers fall back to scanning the records.
+ROLLUP_COLLECTION = 'rollups'
+
+# Maps a Types document id to the rollup field it contributes to.
+TYPE_FIELDS = {
+    'Thu': 'income',
+    'Chi': 'expense',
+    'Tiết kiệm': 'savings',
+}
+
+TOTAL_FIELDS = tuple(TYPE_FIELDS.values())
+
+# Tolerance used when comparing stored rollups with recomputed ones.
+DRIFT_TOLERANCE = 1e-6
+
+
+def record_amount(record):
+    """Returns the record amount as a float, or None if it is missing or invalid."""
+    if not isinstance(record, dict) or 'amount' not in record:
+        return None
+    try:
+        return float(record['amount'])
+    except (ValueError, TypeError):
+        return None
+
+
+class Rollup:
+    """Maintains and reads the per-month and per-year summary documents."""
+
+    @staticmethod
+    def month_ref(year, month):
+        return db.collection(ROLLUP_COLLECTION).document(f"{year}-{month}")
+
+    @staticmethod
+    def year_ref(year):
+        return db.collection(ROLLUP_COLLECTION).document(str(year))
+
+    @staticmethod
+    def empty_totals():
+        totals = {field: 0 for field in TOTAL_FIELDS}
+        totals['categories'] = {}
+        return totals
+
+    @staticmethod
+    def add_record(totals, type_id, record, sign=1):
+        """Adds (sign=1) or subtracts (sign=-1) a record's amount into a totals dict."""
+        amount = record_amount(record)
+        if amount is None:
+            return totals
+        field = TYPE_FIELDS.get(type_id)
+        if field:
+            totals[field] = totals.get(field, 0) + sign * amount
+        name = record.get('name')
+        if name:
+            categories = totals.setdefault('categories', {}).setdefault(type_id, {})
+            categories[name] = categories.get(name, 0) + sign * amount
+        return totals
+
+    @staticmethod
+    def apply_delta(writer, year, month, type_id, old_record=None, new_record=None):
+        """
+        Queues Increment writes that move the month and year rollups from
+        old_record to new_record. `writer` is a WriteBatch or Transaction, so the
+        rollup change commits together with the record change itself.
+        """
+        delta = Rollup.empty_totals()
+        if old_record:
+            Rollup.add_record(delta, type_id, old_record, sign=-1)
+        if new_record:
+            Rollup.add_record(delta, type_id, new_record)
+        if Rollup.queue_totals(writer, year, month, delta):
+            Rollup.queue_totals(writer, year, None, delta)
+
+    @staticmethod
+    def queue_totals(writer, year, month, delta):
+        """
+        Queues one Increment write of a totals delta onto the month rollup, or
+        onto the year rollup when `month` is None. Returns False if the delta is empty.
+        """
+        payload = {field: firestore.Increment(delta[field]) for field in TOTAL_FIELDS if delta.get(field)}
+        categories = {
+            t_id: {name: firestore.Increment(value) for name, value in names.items() if value}
+            for t_id, names in delta.get('categories', {}).items()
+        }
+        categories = {t_id: names for t_id, names in categories.items() if names}
+        if categories:
+            payload['categories'] = categories
+        if not payload:
+            return False
+
+        if month is None:
+            writer.set(Rollup.year_ref(year), {**payload, 'year': str(year)}, merge=True)
+        else:
+            writer.set(Rollup.month_ref(year, month), {**payload, 'year': str(year), 'month': str(month)}, merge=True)
+        return True
+
+    @staticmethod
+    def get_month(year, month):
+        """Returns the rollup dict for a month, or None if its year has not been rebuilt."""
+        month_doc, year_doc = db.get_all([Rollup.month_ref(year, month), Rollup.year_ref(year)])
+        if not (month_doc.exists and year_doc.exists and (year_doc.to_dict() or {}).get('complete')):
+            return None
+        return month_doc.to_dict()
+
+    @staticmethod
+    def get_year(year):
+        """Returns the rollup dict for a year, or None if it has not been rebuilt."""
+        doc = Rollup.year_ref(year).get()
+        data = doc.to_dict() if doc.exists else None
+        return data if data and data.get('complete') else None
+
+    @staticmethod
+    def compute_year(year):
+        """Recomputes the rollups of a year from its raw records."""
+        year_totals = Rollup.empty_totals()
+        month_totals = {}
+        month_docs = db.collection('Year').document(str(year)).collection('Months').stream()
+        for month_doc in month_docs:
+            totals = Rollup.empty_totals()
+            _, month_records = RecordStore.read_month(str(year), month_doc.id, fields=('name', 'amount'))
+            for type_id, records in month_records.items():
+                for record in records:
+                    Rollup.add_record(totals, type_id, record)
+                    Rollup.add_record(year_totals, type_id, record)
+            month_totals[month_doc.id] = totals
+        return year_totals, month_totals
+
+    @staticmethod
+    def diff(stored, computed):
+        """Lists the fields where a stored rollup differs from the recomputed one."""
+        stored = stored or Rollup.empty_totals()
+        drift = []
+        for field in TOTAL_FIELDS:
+            expected, actual = computed.get(field, 0), stored.get(field, 0)
+            if abs(expected - actual) > DRIFT_TOLERANCE:
+                drift.append({'field': field, 'stored': actual, 'expected': expected})
+
+        stored_categories = stored.get('categories', {})
+        computed_categories = computed.get('categories', {})
+        for type_id in set(stored_categories) | set(computed_categories):
+            stored_names = stored_categories.get(type_id, {})
+            computed_names = computed_categories.get(type_id, {})
+            for name in set(stored_names) | set(computed_names):
+                expected, actual = computed_names.get(name, 0), stored_names.get(name, 0)
+                if abs(expected - actual) > DRIFT_TOLERANCE:
+                    drift.append({'field': f"categories.{type_id}.{name}", 'stored': actual, 'expected': expected})
+        return drift
+
+    @staticmethod
+    @firestore.transactional
+    def _rebuild_year(transaction, year, apply):
+        """
+        Recomputes one year's rollups and reports their drift; with apply,
+        overwrites them and marks the year complete. Every record write
+        increments the year rollup in the same commit, so reading the stored
+        rollups in the transaction before the records means a record written
+        meanwhile is either counted here or incremented on top of the result
+        (a conflicting write makes the transaction retry).
+        Returns {rollup document id: drifted fields}.
+        """
+        stored_docs = {doc.id: doc for doc in transaction.get_all([Rollup.year_ref(year)]) if doc.exists}
+        stored_docs.update((doc.id, doc) for doc in db.collection(ROLLUP_COLLECTION)
+                           .where(filter=FieldFilter('year', '==', year)).stream(transaction=transaction))
+        year_totals, month_totals = Rollup.compute_year(year)
+        targets = [(Rollup.year_ref(year), {**year_totals, 'year': year, 'complete': True})]
+        targets += [
+            (Rollup.month_ref(year, month), {**totals, 'year': year, 'month': month})
+            for month, totals in month_totals.items()
+        ]
+        target_ids = {ref.id for ref, _ in targets}
+        stale = [doc for doc_id, doc in stored_docs.items() if doc_id not in target_ids]
+
+        report = {}
+        for ref, computed in targets:
+            stored = stored_docs.get(ref.id)
+            drift = Rollup.diff(stored.to_dict() if stored is not None else None, computed)
+            if drift:
+                report[ref.id] = drift
+            if apply:
+                transaction.set(ref, computed)
+        for doc in stale:
+            # A month whose records are all gone: its totals should be zero.
+            drift = Rollup.diff(doc.to_dict(), Rollup.empty_totals())
+            if drift:
+                report[doc.id] = drift
+            if apply:
+                transaction.delete(doc.reference)
+        return report
+
+    @staticmethod
+    def rebuild(years=None, apply=False):
+        """
+        Recomputes rollups from raw records and reports drift against the stored
+        documents, including month (and year) documents left over for months
+        that no longer have records. Stored documents are only overwritten,
+        and the years marked complete, when `apply` is True; each year is
+        rebuilt in its own transaction, so record writes need not be paused.
+        Returns a dict mapping rollup document ids to their list of drifted fields.
+        """
+        if not years:
+            years = {year_doc.id for year_doc in db.collection('Year').stream()}
+            years |= {str(doc.get('year')) for doc in db.collection(ROLLUP_COLLECTION).select(['year']).stream()
+                      if doc.get('year') is not None}
+            years = sorted(years)
+
+        report = {}
+        for year in years:
+            report.update(Rollup._rebuild_year(db.transaction(), str(year), apply))
+        return report
@@ -0,0 +1,219 @@
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from .firebase_config import db
+from .rollups import record_amount
+from .record_store import RecordStore
+
+SAVINGS_TYPE = 'Tiết kiệm'
+
+# One document per deposit, keyed by the record id, plus a single aggregate
+# document so the savings overview never has to visit every Year/Month.
+# Writes before the first rebuild create the aggregate with partial totals,
+# so it is only served once `rebuild` has set its `built` marker. Every
+# deposit write updates its index entry and the aggregate in one commit, and
+# `rebuild` reconciles them in transactions, so it can run while the app writes.
+INDEX_COLLECTION = 'savings'
+SUMMARY_COLLECTION = 'savings_summary'
+SUMMARY_DOC = 'all'
+
+DEPOSIT_FIELDS = ('name', 'amount', 'rate', 'term', 'date', 'note')
+
+
+def _bucket_key(value):
+    """Map key used for the by-term / by-rate breakdowns ('6', '5.5', ...)."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value if value not in (None, '') else 0)
+
+
+class SavingsIndex:
+    """Maintains the savings ledger index and its aggregate document."""
+
+    @staticmethod
+    def deposit_ref(record_id):
+        return db.collection(INDEX_COLLECTION).document(record_id)
+
+    @staticmethod
+    def summary_ref():
+        return db.collection(SUMMARY_COLLECTION).document(SUMMARY_DOC)
+
+    @staticmethod
+    def empty_summary():
+        return {'total_principal': 0, 'count': 0, 'by_term': {}, 'by_rate': {}}
+
+    @staticmethod
+    def add_to_summary(summary, record, sign=1):
+        """Adds (sign=1) or subtracts (sign=-1) one deposit into a summary dict."""
+        amount = record_amount(record)
+        if amount is None:
+            return summary
+        summary['total_principal'] = summary.get('total_principal', 0) + sign * amount
+        summary['count'] = summary.get('count', 0) + sign
+        for field, breakdown in (('term', 'by_term'), ('rate', 'by_rate')):
+            bucket = summary.setdefault(breakdown, {}).setdefault(_bucket_key(record.get(field)), {'amount': 0, 'count': 0})
+            bucket['amount'] += sign * amount
+            bucket['count'] += sign
+        return summary
+
+    @staticmethod
+    def deposit_entry(year, month, record):
+        entry = {field: record.get(field) for field in DEPOSIT_FIELDS if field in record}
+        entry.update({'year': str(year), 'month': str(month)})
+        return entry
+
+    @staticmethod
+    def apply(writer, year, month, type_id, old_record=None, new_record=None):
+        """
+        Queues the index writes for a savings record change on a WriteBatch or
+        Transaction. Records of other types are ignored.
+        """
+        if type_id != SAVINGS_TYPE:
+            return
+
+        if new_record and new_record.get('id'):
+            writer.set(SavingsIndex.deposit_ref(new_record['id']), SavingsIndex.deposit_entry(year, month, new_record))
+        elif old_record and old_record.get('id'):
+            writer.delete(SavingsIndex.deposit_ref(old_record['id']))
+
+        delta = SavingsIndex.empty_summary()
+        if old_record:
+            SavingsIndex.add_to_summary(delta, old_record, sign=-1)
+        if new_record:
+            SavingsIndex.add_to_summary(delta, new_record)
+        SavingsIndex.queue_summary(writer, delta)
+
+    @staticmethod
+    def apply_many(writer, deposits):
+        """
+        Queues the index writes for many new savings records, given as
+        (year, month, record) tuples, with a single aggregate update.
+        Returns the number of writes queued.
+        """
+        delta = SavingsIndex.empty_summary()
+        writes = 0
+        for year, month, record in deposits:
+            if record.get('id'):
+                writer.set(SavingsIndex.deposit_ref(record['id']), SavingsIndex.deposit_entry(year, month, record))
+                writes += 1
+            SavingsIndex.add_to_summary(delta, record)
+        return writes + int(SavingsIndex.queue_summary(writer, delta))
+
+    @staticmethod
+    def queue_summary(writer, delta):
+        """Queues one Increment write of a summary delta. Returns False if the delta is empty."""
+        payload = {field: firestore.Increment(delta[field]) for field in ('total_principal', 'count') if delta[field]}
+        for breakdown in ('by_term', 'by_rate'):
+            buckets = {
+                key: {name: firestore.Increment(value) for name, value in bucket.items() if value}
+                for key, bucket in delta[breakdown].items()
+            }
+            buckets = {key: bucket for key, bucket in buckets.items() if bucket}
+            if buckets:
+                payload[breakdown] = buckets
+        if not payload:
+            return False
+        writer.set(SavingsIndex.summary_ref(), payload, merge=True)
+        return True
+
+    @staticmethod
+    def get_summary():
+        """Returns the aggregate savings document, or None if the index has not been built."""
+        doc = SavingsIndex.summary_ref().get()
+        summary = doc.to_dict() if doc.exists else None
+        if not summary or not summary.pop('built', False):
+            return None
+        return summary
+
+    @staticmethod
+    def get_deposits(page_size=0, start_after_doc_id=None):
+        """Fetches deposits ordered by date; page_size <= 0 returns all of them."""
+        collection_ref = db.collection(INDEX_COLLECTION)
+        query = collection_ref.order_by('date')
+        if start_after_doc_id:
+            start_after_doc = collection_ref.document(start_after_doc_id).get()
+            if not start_after_doc.exists:
+                return {'data': [], 'last_doc_id': None}
+            query = query.start_after(start_after_doc)
+        if page_size > 0:
+            query = query.limit(page_size)
+
+        results = []
+        last_doc_id = None
+        for doc in query.stream():
+            results.append({**doc.to_dict(), 'id': doc.id})
+            last_doc_id = doc.id
+        return {'data': results, 'last_doc_id': last_doc_id}
+
+    @staticmethod
+    @firestore.transactional
+    def _rebuild_month(transaction, saving_ref):
+        """
+        Makes the index entries of one month match its savings records, both
+        read in the transaction. Returns the number of deposits indexed.
+        """
+        # Year/{year}/Months/{month}/Types/Tiết kiệm
+        month_ref = saving_ref.parent.parent
+        year, month = month_ref.parent.parent.id, month_ref.id
+        stored = {doc.id: doc.to_dict() for doc in db.collection(INDEX_COLLECTION)
+                  .where(filter=FieldFilter('year', '==', year))
+                  .where(filter=FieldFilter('month', '==', month)).stream(transaction=transaction)}
+        entries = {record['id']: SavingsIndex.deposit_entry(year, month, record)
+                   for record in RecordStore.read_records(saving_ref, transaction=transaction) if record.get('id')}
+        for record_id in stored.keys() - entries.keys():
+            transaction.delete(SavingsIndex.deposit_ref(record_id))
+        for record_id, entry in entries.items():
+            if stored.get(record_id) != entry:
+                transaction.set(SavingsIndex.deposit_ref(record_id), entry)
+        return len(entries)
+
+    @staticmethod
+    @firestore.transactional
+    def _rebuild_summary(transaction, months):
+        """
+        Recomputes the aggregate from the index entries, read in the
+        transaction, and marks it built. Entries of months not in `months`
+        (e.g. created since the rebuild started) are checked against their
+        records and deleted if the deposit is gone.
+        """
+        summary = SavingsIndex.empty_summary()
+        others = {}
+        for doc in db.collection(INDEX_COLLECTION).stream(transaction=transaction):
+            entry = doc.to_dict()
+            key = (entry.get('year'), entry.get('month'))
+            if key in months:
+                SavingsIndex.add_to_summary(summary, entry)
+            else:
+                others.setdefault(key, []).append((doc.id, entry))
+
+        stale = []
+        for (year, month), docs in others.items():
+            record_ids = set()
+            if year and month:
+                saving_ref = (db.collection('Year').document(year).collection('Months').document(month)
+                              .collection('Types').document(SAVINGS_TYPE))
+                record_ids = {record.get('id') for record in RecordStore.read_records(saving_ref, transaction=transaction)}
+            for record_id, entry in docs:
+                if record_id in record_ids:
+                    SavingsIndex.add_to_summary(summary, entry)
+                else:
+                    stale.append(record_id)
+
+        for record_id in stale:
+            transaction.delete(SavingsIndex.deposit_ref(record_id))
+        transaction.set(SavingsIndex.summary_ref(), {**summary, 'built': True})
+
+    @staticmethod
+    def rebuild():
+        """
+        Rebuilds the index from the raw savings records, one transaction per
+        month, then the aggregate document from the index. Returns the number
+        of deposits indexed.
+        """
+        months, count = set(), 0
+        for month_doc in db.collection_group('Months').stream():
+            saving_ref = month_doc.reference.collection('Types').document(SAVINGS_TYPE)
+            months.add((month_doc.reference.parent.parent.id, month_doc.id))
+            count += SavingsIndex._rebuild_month(db.transaction(), saving_ref)
+        # Last, so the marker only appears once every month is indexed.
+        SavingsIndex._rebuild_summary(db.transaction(), months)
+        return count
@@ -0,0 +1,123 @@
+"""
+In-memory index of the bookstore shelves.
+
+One snapshot of `books` and `shelves` is read and mapped
+(rowIndex, unitIndex, compIndex) -> book ids. The index is kept per process
+and rebuilt when the books or shelves metadata version changes (checked like
+the L1 caches, see local_cache). The shelf layout, compartment listings and
+the occupancy summary are then served without a Firestore query.
+Shelves are edited outside the app and may have no metadata version;
+SHELF_INDEX_TTL bounds how long such edits go unseen.
+"""
+import os
+import time
+
+from .firebase_config import db
+from .decorators import current_versions, note_unverified
+from .local_cache import create_cache
+from .single_flight import single_flight
+
+SHELF_INDEX_TTL = float(os.environ.get('SHELF_INDEX_TTL', '300'))
+DEPENDENCIES = ['books', 'shelves']
+# Served when the shelves collection is empty, as /api/shelves always did.
+DEFAULT_LAYOUT = [
+    {'units': [{'type': 'vertical', 'compartments': 5}]},
+    {'units': [{'type': 'horizontal', 'compartments': 5}]},
+]
+
+_cache = create_cache('shelf_index', maxsize=1, ttl=SHELF_INDEX_TTL)
+_KEY = 'index'
+
+
+def _position(book):
+    try:
+        return int(book['rowIndex']), int(book['unitIndex']), int(book['compIndex'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _layout(shelf_docs):
+    rows = {}
+    for shelf_doc in shelf_docs:
+        shelf_data = shelf_doc.to_dict()
+        rows.setdefault(shelf_data.get('row', 1), []).append({
+            'type': shelf_data.get('orientation', 'vertical'),
+            'compartments': shelf_data.get('compartments', 1)
+        })
+    return [{'units': rows[row_num]} for row_num in sorted(rows.keys())] or DEFAULT_LAYOUT
+
+
+class ShelfIndex:
+    """A read-only snapshot; build a new one instead of changing it."""
+
+    def __init__(self, layout, books, versions):
+        self.layout = layout
+        self.versions = versions
+        self.built_at = time.time()
+        self.books = {}          # id -> book dict (with 'id')
+        self.compartments = {}   # (row, unit, comp) -> [book ids], in document id order
+        self.unplaced = []       # ids of books without a valid position
+        for book in books:
+            self.books[book['id']] = book
+            position = _position(book)
+            if position is None:
+                self.unplaced.append(book['id'])
+            else:
+                self.compartments.setdefault(position, []).append(book['id'])
+
+    @classmethod
+    def build(cls, versions):
+        shelves = db.collection('shelves').order_by('row').order_by('order').stream()
+        layout = _layout(shelves)
+        books = [{**doc.to_dict(), 'id': doc.id} for doc in db.collection('books').stream()]
+        return cls(layout, books, versions)
+
+    def books_in(self, row_index, unit_index, comp_index):
+        """The books in one compartment (shared dicts: do not modify them)."""
+        return [self.books[book_id] for book_id in self.compartments.get((row_index, unit_index, comp_index), [])]
+
+    def occupancy(self):
+        """Book counts per compartment of the layout, and library-wide totals."""
+        rows, total_compartments, occupied, placed = [], 0, 0, 0
+        for row_index, row in enumerate(self.layout):
+            units = []
+            for unit_index, unit in enumerate(row['units']):
+                counts = [len(self.compartments.get((row_index, unit_index, comp_index), []))
+                          for comp_index in range(unit['compartments'])]
+                units.append({**unit, 'counts': counts, 'books': sum(counts)})
+                total_compartments += len(counts)
+                occupied += sum(1 for count in counts if count)
+                placed += sum(counts)
+            rows.append({'units': units, 'books': sum(unit['books'] for unit in units)})
+        return {
+            'totalBooks': len(self.books),
+            'placedBooks': placed,
+            # Unplaced: no position, or a position outside the current layout.
+            'unplacedBooks': len(self.books) - placed,
+            'compartments': total_compartments,
+            'occupiedCompartments': occupied,
+            'emptyCompartments': total_compartments - occupied,
+            'occupancyRate': round(occupied / total_compartments, 4) if total_compartments else None,
+            'rows': rows,
+        }
+
+
+def get_shelf_index():
+    """The current ShelfIndex, rebuilt when the books or shelves version changed."""
+    entry, fresh = _cache.get(_KEY)
+    if entry is not None and fresh:
+        # Not checked against Firestore: conditional_get must not tag it with the current versions.
+        note_unverified(entry.versions)
+        return entry.value
+    versions = current_versions(DEPENDENCIES)
+    if entry is not None and _cache.confirm(_KEY, versions):
+        return entry.value
+
+    def build():
+        index = ShelfIndex.build(versions)
+        _cache.put(_KEY, index, versions)
+        return index
+
+    # Requests arriving during a rebuild share it.
+    index, _ = single_flight.do(f"shelf_index:{sorted(versions.items(), key=str)!r}", build)
+    return index
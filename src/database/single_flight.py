@@ -0,0 +1,121 @@
+"""
+Request coalescing for cache misses.
+
+When a version changes, every concurrent reader of the same key misses at
+once. `SingleFlight.do` lets the first caller for a key compute the value
+while the others wait for (and share) its result. Across worker processes
+the leader additionally takes a short Redis lock (see `redis_lock`), so
+only one worker recomputes and the others pick the fresh value up from
+Redis.
+"""
+import threading
+import time
+
+import redis
+
+from src.api.metrics import register_source
+
+# Seconds between reads while waiting for the lock holder's value (see wait_for).
+LOCK_WAIT_POLL = 0.05
+# Returned by redis_lock when Redis itself failed: nobody is known to hold the
+# lock, so the caller computes the value instead of waiting on a broken Redis.
+LOCK_FAILED = object()
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time within this process."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'followers': 0, 'stale_served': 0,
+                       'lock_acquired': 0, 'lock_waits': 0, 'lock_timeouts': 0, 'lock_errors': 0}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+    def do(self, key, fn):
+        """
+        Returns (result, leader). The leader runs fn(); followers block until
+        it finishes and get the same result, or the same exception.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            self._stats['leaders' if leader else 'followers'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, False
+
+        try:
+            flight.result = fn()
+            return flight.result, True
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._flights)}
+
+
+def redis_lock(redis_client, name, timeout):
+    """
+    Tries once to take a Redis lock that expires after `timeout` seconds.
+    Returns the acquired lock, None if another worker holds it, or
+    LOCK_FAILED if Redis raised.
+    """
+    try:
+        lock = redis_client.lock(f"lock:{name}", timeout=timeout, blocking=False)
+        return lock if lock.acquire() else None
+    except Exception as e:
+        print(f"Error acquiring redis lock {name}: {e}")
+        return LOCK_FAILED
+
+
+def release(lock):
+    try:
+        lock.release()
+    except redis.exceptions.LockError:
+        # It expired while the value was computed; another worker may hold it now.
+        pass
+    except Exception as e:
+        print(f"Error releasing redis lock: {e}")
+
+
+def wait_for(read, timeout):
+    """Polls read() until it returns something other than None, for up to `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = read()
+        if value is not None:
+            return value
+        time.sleep(LOCK_WAIT_POLL)
+    return None
+
+
+single_flight = SingleFlight()
+register_source('single_flight', single_flight.stats)
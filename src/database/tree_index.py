@@ -0,0 +1,119 @@
+from google.cloud import firestore
+from .firebase_config import db
+from .decorators import new_metadata_version
+from .record_store import RecordStore
+
+# A single document mirrors the Year -> Months hierarchy so the management
+# sidebar and the year picker are served by one point read:
+#   indexes/year_tree -> {'years': {year: {month: record_count}}, 'version': ms}
+INDEX_COLLECTION = 'indexes'
+INDEX_DOC = 'year_tree'
+
+
+class TreeIndex:
+    """Maintains and reads the materialized Year -> Month index document."""
+
+    @staticmethod
+    def ref():
+        return db.collection(INDEX_COLLECTION).document(INDEX_DOC)
+
+    @staticmethod
+    def apply(writer, month_deltas):
+        """
+        Queues the index update for record count changes, given as
+        {(year, month): delta}, on a WriteBatch or Transaction. The month is
+        listed even when its delta is 0, since its document now exists.
+        """
+        years = {}
+        for (year, month), delta in month_deltas.items():
+            years.setdefault(str(year), {})[str(month)] = firestore.Increment(delta)
+        if years:
+            writer.set(TreeIndex.ref(), {
+                'years': years,
+                'version': new_metadata_version(),
+                # Two writes in the same millisecond share a version; the counter still moves.
+                'generation': firestore.Increment(1),
+            }, merge=True)
+
+    @staticmethod
+    def get():
+        """
+        Returns the index dict, or None if it has not been built. Writes made
+        before the first repair only hold partial counts, so the index is
+        served only once `flask tree repair` has marked it complete.
+        """
+        doc = TreeIndex.ref().get()
+        data = doc.to_dict() if doc.exists else None
+        return data if data and data.get('complete') else None
+
+    @staticmethod
+    def etag_version(index):
+        """Opaque version of the index content, for HTTP ETags."""
+        return f"{index.get('version')}.{index.get('generation', 0)}" if index else None
+
+    @staticmethod
+    def tree(index, counts=False):
+        """{year: [months]} like ManagementTree.get_data_tree, or {year: {month: count}} with counts."""
+        tree = {}
+        for year, months in (index or {}).get('years', {}).items():
+            if not months:
+                continue
+            ordered = sorted(months, key=int)
+            tree[year] = {month: months[month] for month in ordered} if counts else ordered
+        return tree
+
+    @staticmethod
+    def years(index):
+        """Years in descending order, like Dashboard.get_year_list."""
+        return sorted((index or {}).get('years', {}).keys(), reverse=True)
+
+    @staticmethod
+    def compute():
+        """Recomputes the index content from the real Year/Months hierarchy."""
+        years = {}
+        for year_doc in db.collection('Year').stream():
+            months = years.setdefault(year_doc.id, {})
+            for month_doc in year_doc.reference.collection('Months').stream():
+                _, month_records = RecordStore.read_month(year_doc.id, month_doc.id, fields=('id',))
+                months[month_doc.id] = sum(len(records) for records in month_records.values())
+        return years
+
+    @staticmethod
+    @firestore.transactional
+    def _repair(transaction, apply):
+        """
+        Every record add or delete increments the index in the same commit,
+        so reading the index in the transaction before the hierarchy means a
+        write made meanwhile is either counted here or applied on top of the
+        result (a conflicting write makes the transaction retry).
+        """
+        doc = TreeIndex.ref().get(transaction=transaction)
+        stored_index = doc.to_dict() if doc.exists else {}
+        stored = stored_index.get('years', {})
+        actual = TreeIndex.compute()
+        drift = []
+        for year in sorted(set(stored) | set(actual)):
+            stored_months, actual_months = stored.get(year), actual.get(year)
+            if stored_months is None or actual_months is None:
+                drift.append((year, None, stored_months, actual_months))
+                continue
+            for month in sorted(set(stored_months) | set(actual_months), key=int):
+                if stored_months.get(month) != actual_months.get(month):
+                    drift.append((year, month, stored_months.get(month), actual_months.get(month)))
+        if apply:
+            transaction.set(TreeIndex.ref(), {
+                'years': actual,
+                'version': new_metadata_version(),
+                'generation': stored_index.get('generation', 0) + 1,
+                'complete': True,
+            })
+        return drift
+
+    @staticmethod
+    def repair(apply=True):
+        """
+        Rebuilds the index from the hierarchy, in a transaction on the index
+        document. Returns a list of (year, month, stored_count, actual_count)
+        for every entry that differed.
+        """
+        return TreeIndex._repair(db.transaction(), apply)
@@ -0,0 +1,96 @@
+"""
+Hierarchical versions for the Year/Month/Type data.
+
+metadata/Year holds one version per level, all bumped by the same write:
+    version                    -> global (any management record changed)
+    years.{year}               -> anything in that year changed
+    months.{year}-{month}      -> anything in that month changed
+    types.{year}-{month}.{type} -> that Types document changed
+A write bumps only its own path and its ancestors, so results cached for
+other years or months keep their versions.
+
+Cache dependencies name a level with a path: 'Year', 'Year/2026',
+'Year/2026/10' or 'Year/2026/10/Chi'.
+"""
+
+ROOT = 'Year'
+
+
+def month_key(year, month):
+    """Key of a month in the `months` / `types` maps."""
+    return f"{year}-{month}"
+
+
+def year_path(year=None, month=None, type_id=None):
+    """The dependency name of a level of the hierarchy."""
+    parts = [ROOT] + [str(part) for part in (year, month, type_id) if part is not None]
+    return '/'.join(parts)
+
+
+def is_hierarchical(name):
+    return name == ROOT or name.startswith(ROOT + '/')
+
+
+def collection_path(collection_name):
+    """
+    The (year, month, type_id) a Firestore path under Year points into,
+    e.g. 'Year/2026/Months/10' -> ('2026', '10', None), or None for other paths.
+    """
+    parts = collection_name.split('/')
+    if parts[0] != ROOT or len(parts) < 2:
+        return None
+    levels = parts[1::2][:3]
+    return tuple(levels + [None] * (3 - len(levels)))
+
+
+def nested_version(document, name):
+    """Reads the version of a hierarchical dependency from the metadata/Year dict."""
+    document = document or {}
+    parts = name.split('/')[1:]
+    if not parts:
+        return document.get('version')
+    if len(parts) == 1:
+        return document.get('years', {}).get(parts[0])
+    key = month_key(parts[0], parts[1])
+    if len(parts) == 2:
+        return document.get('months', {}).get(key)
+    return document.get('types', {}).get(key, {}).get(parts[2])
+
+
+def expand(document):
+    """Flattens the metadata/Year dict into {dependency name: version} for every level."""
+    document = document or {}
+    versions = {ROOT: document.get('version')}
+    for year, version in document.get('years', {}).items():
+        versions[year_path(year)] = version
+    for key, version in document.get('months', {}).items():
+        year, month = key.split('-', 1)
+        versions[year_path(year, month)] = version
+    for key, types in document.get('types', {}).items():
+        year, month = key.split('-', 1)
+        for type_id, version in types.items():
+            versions[year_path(year, month, type_id)] = version
+    return versions
+
+
+def bump_fields(paths, version):
+    """
+    metadata/Year fields (for a merge write) that bump the given
+    (year, month, type_id) paths and all their ancestors to `version`
+    (month and type_id may be None to stop at a higher level).
+    Returns (fields, dependency names bumped).
+    """
+    fields = {'years': {}, 'months': {}, 'types': {}}
+    names = {ROOT}
+    for year, month, type_id in paths:
+        year, key = str(year), month_key(year, month)
+        fields['years'][year] = version
+        names.add(year_path(year))
+        if month is None:
+            continue
+        fields['months'][key] = version
+        names.add(year_path(year, month))
+        if type_id is not None:
+            fields['types'].setdefault(key, {})[type_id] = version
+            names.add(year_path(year, month, type_id))
+    return {key: value for key, value in fields.items() if value}, sorted(names)
@@ -0,0 +1,234 @@
+"""
+Write-behind queue for writes the client does not wait for.
+
+`write_behind.set(ref, data, merge)` queues a Firestore set and returns at
+once; a background thread commits the queue in WriteBatches of up to
+WRITE_BEHIND_BATCH_SIZE writes, WRITE_BEHIND_WINDOW seconds after the first
+queued write. Sets queued with `coalesce=True` (metadata version bumps)
+merge into the pending write for the same document, so a burst of changes
+to one collection costs a single write.
+
+The queue holds at most WRITE_BEHIND_CAPACITY writes. A full queue blocks
+the caller for up to WRITE_BEHIND_PUT_TIMEOUT seconds, then the caller
+writes synchronously, so nothing is dropped under load. The queue is
+flushed when the process exits (atexit, and gunicorn's worker_exit hook).
+WRITE_BEHIND=off writes synchronously, as before.
+
+A batch that still fails after WRITE_BEHIND_RETRIES attempts drops its plain
+writes (counted). Coalesced writes are never dropped: each is set on its
+own, and one that fails again goes back into the queue for the next flush,
+merged under any newer pending write to the same document. A process that
+is killed before flushing loses its queue; cached_query's Redis entries
+expire (QUERY_CACHE_REDIS_TTL) so a lost version bump is not served forever.
+
+Only use it for writes whose readers tolerate a delay of about one window:
+caches are invalidated right away by notify_metadata_change, and the
+metadata document itself follows within the window.
+"""
+import atexit
+import itertools
+import os
+import threading
+import time
+
+from .firebase_config import db
+from src.api.metrics import register_source
+
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'on')
+WRITE_BEHIND_WINDOW = float(os.environ.get('WRITE_BEHIND_WINDOW', '0.25'))
+WRITE_BEHIND_CAPACITY = int(os.environ.get('WRITE_BEHIND_CAPACITY', '5000'))
+WRITE_BEHIND_PUT_TIMEOUT = float(os.environ.get('WRITE_BEHIND_PUT_TIMEOUT', '2'))
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(os.environ.get('WRITE_BEHIND_SHUTDOWN_TIMEOUT', '10'))
+# Firestore's limit on writes per batch.
+WRITE_BEHIND_BATCH_SIZE = 500
+# Commit attempts per batch before its plain writes are dropped (and counted).
+WRITE_BEHIND_RETRIES = 3
+
+
+def _merge(current, update):
+    """Deep-merges `update` into a copy of `current`, like a merge=True set."""
+    merged = dict(current)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class WriteBehindQueue:
+    """A bounded queue of Firestore sets committed in batches by a background thread."""
+
+    def __init__(self, window=WRITE_BEHIND_WINDOW, capacity=WRITE_BEHIND_CAPACITY):
+        self.window = window
+        self.capacity = capacity
+        self._ops = {}  # key -> [ref, data, merge], in queue order
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._stopping = False
+        self._thread = None
+        self._stats = {'queued': 0, 'coalesced': 0, 'written': 0, 'batches': 0, 'sync_writes': 0,
+                       'retries': 0, 'dropped': 0, 'sync_fallbacks': 0, 'requeued': 0, 'max_depth': 0, 'flush_ms_last': None,
+                       'flush_ms_max': 0.0, 'flush_ms_total': 0.0}
+
+    def _ensure_started(self):
+        """Starts the flusher once per process (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._ops, self._stopping = {}, False
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def set(self, ref, data, merge=False, coalesce=False):
+        """
+        Queues `ref.set(data, merge=merge)`. With `coalesce`, the write is
+        merged into a pending coalesced write to the same document.
+        """
+        if WRITE_BEHIND == 'off' or self._stopping:
+            ref.set(data, merge=merge)
+            return
+        self._ensure_started()
+        key = ('coalesce', ref.path) if coalesce else next(self._ids)
+        with self._cond:
+            pending = self._ops.get(key)
+            if pending is not None:
+                pending[1] = _merge(pending[1], data)
+                pending[2] = pending[2] and merge
+                self._stats['coalesced'] += 1
+                return
+            deadline = time.monotonic() + WRITE_BEHIND_PUT_TIMEOUT
+            while len(self._ops) >= self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            else:
+                self._ops[key] = [ref, data, merge]
+                self._stats['queued'] += 1
+                self._stats['max_depth'] = max(self._stats['max_depth'], len(self._ops))
+                self._cond.notify_all()
+                return
+        # Still full after the timeout: write in the caller rather than drop it.
+        self._stats['sync_writes'] += 1
+        ref.set(data, merge=merge)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ops and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+            # Let writes (and repeated version bumps) gather for one window.
+            time.sleep(self.window)
+            self.flush()
+
+    def _take(self):
+        with self._cond:
+            keys = list(itertools.islice(self._ops, WRITE_BEHIND_BATCH_SIZE))
+            ops = [(key, self._ops.pop(key)) for key in keys]
+            self._cond.notify_all()
+        return ops
+
+    def _requeue(self, key, op):
+        """Puts a coalesced write back, under any newer write queued for the document since."""
+        with self._cond:
+            pending = self._ops.get(key)
+            if pending is not None:
+                pending[1] = _merge(op[1], pending[1])
+                pending[2] = pending[2] and op[2]
+            else:
+                self._ops[key] = op
+            self._stats['requeued'] += 1
+            self._cond.notify_all()
+
+    def _commit(self, ops):
+        """
+        Commits `ops` as one batch; returns (written, requeued). When the batch
+        keeps failing, coalesced writes are set one by one and requeued if that
+        fails too; the other writes are dropped.
+        """
+        for attempt in range(WRITE_BEHIND_RETRIES):
+            try:
+                batch = db.batch()
+                for _, (ref, data, merge) in ops:
+                    batch.set(ref, data, merge=merge)
+                batch.commit()
+                return len(ops), 0
+            except Exception as e:
+                print(f"Error committing {len(ops)} queued writes (attempt {attempt + 1}): {e}")
+                if attempt + 1 < WRITE_BEHIND_RETRIES:
+                    self._stats['retries'] += 1
+                    time.sleep(0.2 * 2 ** attempt)
+        written, requeued = 0, 0
+        for key, op in ops:
+            if not (isinstance(key, tuple) and key[0] == 'coalesce'):
+                self._stats['dropped'] += 1
+                continue
+            ref, data, merge = op
+            try:
+                ref.set(data, merge=merge)
+                self._stats['sync_fallbacks'] += 1
+                written += 1
+            except Exception as e:
+                print(f"Error writing {ref.path}, requeued: {e}")
+                self._requeue(key, op)
+                requeued += 1
+        return written, requeued
+
+    def flush(self):
+        """Commits everything queued so far; returns the number of writes committed."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                ops = self._take()
+                if not ops:
+                    return written
+                start = time.perf_counter()
+                committed, requeued = self._commit(ops)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with self._cond:
+                    self._stats['batches'] += 1
+                    self._stats['flush_ms_last'] = round(elapsed_ms, 1)
+                    self._stats['flush_ms_max'] = max(self._stats['flush_ms_max'], elapsed_ms)
+                    self._stats['flush_ms_total'] += elapsed_ms
+                    self._stats['written'] += committed
+                    written += committed
+                if requeued:
+                    # Firestore is failing: leave the rest for the next flush.
+                    return written
+
+    def stop(self, timeout=WRITE_BEHIND_SHUTDOWN_TIMEOUT):
+        """Stops the flusher and commits what is left. Later sets are written synchronously."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            depth = len(self._ops)
+        return {
+            **stats,
+            'enabled': WRITE_BEHIND != 'off',
+            'depth': depth,
+            'capacity': self.capacity,
+            'flush_ms_max': round(stats['flush_ms_max'], 1),
+            'flush_ms_avg': round(stats['flush_ms_total'] / stats['batches'], 1) if stats['batches'] else None,
+            'flush_ms_total': round(stats['flush_ms_total'], 1),
+        }
+
+
+write_behind = WriteBehindQueue()
+atexit.register(write_behind.stop)
+register_source('write_behind', write_behind.stats)
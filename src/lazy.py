@@ -0,0 +1,117 @@
+"""
+Lazy, thread-safe service clients.
+
+`LazyClient(name, factory)` stands in for a client object: the factory runs
+on first attribute access (or truth test), once per process even when many
+threads race for it, and every later access goes straight to the instance.
+Modules keep importing `db` or `client` as before, but importing the app no
+longer connects to anything, so workers boot without network round trips.
+
+`start_warmup()` initializes the registered clients on a background thread
+once the worker is ready (WARMUP=1), so the first request does not pay for it.
+"""
+import os
+import threading
+import time
+
+from src.api.metrics import register_source
+
+WARMUP = os.environ.get('WARMUP', '0') == '1'
+
+_registry = {}
+_warmups = {}
+# Boot is timed from the import of this module, which main.py imports first.
+_boot_start = time.monotonic()
+_startup = {'app_ready_s': None, 'first_response_s': None, 'warmup_s': None}
+
+
+class LazyClient:
+    """A proxy that builds its client with `factory()` on first use."""
+
+    def __init__(self, name, factory):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_lock', threading.Lock())
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_ready', False)
+        object.__setattr__(self, '_init_ms', None)
+        _registry[name] = self
+
+    def get(self):
+        """The client instance (which may be None if the factory returned None)."""
+        if self._ready:
+            return self._instance
+        with self._lock:
+            if not self._ready:
+                start = time.perf_counter()
+                instance = self._factory()
+                object.__setattr__(self, '_instance', instance)
+                object.__setattr__(self, '_init_ms', round((time.perf_counter() - start) * 1000, 1))
+                object.__setattr__(self, '_ready', True)
+        return self._instance
+
+    @property
+    def initialized(self):
+        return self._ready
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.get(), attr, value)
+
+    def __bool__(self):
+        return bool(self.get())
+
+    def __repr__(self):
+        state = repr(self._instance) if self._ready else 'not initialized'
+        return f"<LazyClient {self._name}: {state}>"
+
+
+def on_warmup(name, fn):
+    """Registers an extra warm-up step, e.g. opening a pooled connection."""
+    _warmups[name] = fn
+
+
+def warm_up(names=None):
+    """
+    Initializes the registered clients, then runs the on_warmup steps (all of
+    them by default); errors are logged, not raised.
+    """
+    start = time.perf_counter()
+    steps = [(name, lazy.get) for name, lazy in _registry.items()] + list(_warmups.items())
+    for name, step in steps:
+        if names is not None and name not in names:
+            continue
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+    _startup['warmup_s'] = round(time.perf_counter() - start, 3)
+
+
+def start_warmup():
+    """Runs warm_up() on a daemon thread when WARMUP=1. Call once the worker is ready."""
+    if WARMUP:
+        threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+
+
+def mark_app_ready():
+    if _startup['app_ready_s'] is None:
+        _startup['app_ready_s'] = round(time.monotonic() - _boot_start, 3)
+
+
+def mark_first_response():
+    if _startup['first_response_s'] is None:
+        _startup['first_response_s'] = round(time.monotonic() - _boot_start, 3)
+
+
+def stats():
+    return {
+        **_startup,
+        'clients': {name: {'initialized': lazy.initialized, 'init_ms': lazy._init_ms}
+                    for name, lazy in _registry.items()},
+    }
+
+
+register_source('startup', stats)
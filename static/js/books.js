@@ -1,4 +1,4 @@
-import { authenticatedFetch } from './utils.js';
+import { authenticatedFetch, streamChat } from './utils.js';
 import { renderStars, createStarRatingInput } from './components/uiStars.js';
 
 let currentLibraryData = { layout: [], books: [] };
@@ -123,6 +123,13 @@ function renderBookshelf() {
     const { layout, books } = currentLibraryData;
     if (!layout || layout.length === 0) return;
     const MAX_BOOKS_BEFORE_COUNTING = 10;
+    // Group the books by compartment once instead of filtering the whole list per compartment.
+    const booksByCompartment = new Map();
+    books.forEach(book => {
+        const key = `${book.rowIndex}/${book.unitIndex}/${book.compIndex}`;
+        if (!booksByCompartment.has(key)) booksByCompartment.set(key, []);
+        booksByCompartment.get(key).push(book);
+    });
     layout.forEach((row, rowIndex) => {
         const rowEl = document.createElement('div');
         rowEl.className = 'library-row';
@@ -133,11 +140,7 @@ function renderBookshelf() {
             for (let compIndex = 0; compIndex < unit.compartments; compIndex++) {
                 const compEl = document.createElement('div');
                 compEl.className = 'compartment';
-                const booksInCompartment = books.filter(book => 
-                    book.rowIndex === rowIndex && 
-                    book.unitIndex === unitIndex && 
-                    book.compIndex === compIndex
-                );
+                const booksInCompartment = booksByCompartment.get(`${rowIndex}/${unitIndex}/${compIndex}`) || [];
                 if (booksInCompartment.length > 0) {
                     const displayLimit = booksInCompartment.length > MAX_BOOKS_BEFORE_COUNTING ? MAX_BOOKS_BEFORE_COUNTING : booksInCompartment.length;
                     for (let i = 0; i < displayLimit; i++) {
@@ -280,16 +283,13 @@ async function generateDescription(titleFieldId, authorFieldId, descriptionField
     const message = `Bạn là chuyên gia phân tích văn học. Bạn tóm tắt giúp tôi tác phẩm ${titleField.value} của tác giả ${authorField.value} trong 100 từ`;
     
     try {
-        const response = await authenticatedFetch('/api/chatbot', {
-            method: 'POST',            
-            body: JSON.stringify({ 
-                message,
-                saveHistory: false
-            }),
+        // Show the description as it is generated instead of after the whole reply.
+        const reply = await streamChat(message, {
+            saveHistory: false,
+            onDelta: (delta, replySoFar) => { descriptionField.value = replySoFar; }
         });
-        const data = await response.json();
-        if (data.reply) {
-            descriptionField.value = data.reply;
+        if (reply) {
+            descriptionField.value = reply;
         }
     } catch (error) {
         console.error('Error generating description:', error);
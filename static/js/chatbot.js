@@ -1,4 +1,4 @@
-import { showAlert, authenticatedFetch } from './utils.js';
+import { showAlert, streamChat } from './utils.js';
 
 // This single function will initialize the entire chatbot widget logic.
 export function initializeChatbotWidget() {
@@ -13,6 +13,7 @@ export function initializeChatbotWidget() {
     const sendButton = document.getElementById('chatbot-send-btn');
 
     let historyLoaded = false;
+    const HISTORY_PAGE_SIZE = 20; // Conversations per page, newest first
 
     // --- FUNCTIONS ---
 
@@ -31,21 +32,7 @@ export function initializeChatbotWidget() {
     }
 
     function appendMessage(text, sender) {
-        const messageElement = document.createElement('div');
-        const bubble = document.createElement('div');
-        messageElement.classList.add('flex', 'mb-4');
-        bubble.classList.add('py-2', 'px-4', 'rounded-lg', 'shadow-md', 'max-w-lg');
-
-        if (sender === 'user') {
-            messageElement.classList.add('justify-end');
-            bubble.classList.add('bg-green-500', 'text-white');
-        } else {
-            messageElement.classList.add('justify-start');
-            bubble.classList.add('bg-white', 'text-gray-800');
-        }
-        bubble.innerText = text;
-        messageElement.appendChild(bubble);
-        chatHistory.appendChild(messageElement);
+        chatHistory.appendChild(createMessage(text, sender));
         chatHistory.scrollTop = chatHistory.scrollHeight;
     }
 
@@ -58,17 +45,23 @@ export function initializeChatbotWidget() {
         sendButton.disabled = true;
         chatInput.disabled = true;
 
+        // Bong bóng trả lời được điền dần theo từng đoạn văn bản nhận được.
+        const botMessage = createMessage('', 'bot');
+        const botBubble = botMessage.firstChild;
         try {
-           
-            const response = await authenticatedFetch('/api/chatbot', {
-                method: 'POST',
-                body: JSON.stringify({ message: message })
+            const reply = await streamChat(message, {
+                onDelta: (delta, replySoFar) => {
+                    if (!botMessage.isConnected) chatHistory.appendChild(botMessage);
+                    botBubble.innerText = replySoFar;
+                    chatHistory.scrollTop = chatHistory.scrollHeight;
+                }
             });
-            const data = await response.json();
-            if (!response.ok) throw new Error(data.error || 'Network response was not ok');
-            appendMessage(data.reply, 'bot');
+            if (!botMessage.isConnected) chatHistory.appendChild(botMessage);
+            botBubble.innerText = reply;
+            chatHistory.scrollTop = chatHistory.scrollHeight;
         } catch (error) {
             console.error('Error sending message:', error);
+            botMessage.remove();
             appendMessage(`Lỗi: ${error.message}`, 'bot');
         } finally {
             sendButton.disabled = false;
@@ -77,21 +70,70 @@ export function initializeChatbotWidget() {
         }
     }
 
+    function createMessage(text, sender) {
+        const messageElement = document.createElement('div');
+        const bubble = document.createElement('div');
+        messageElement.classList.add('flex', 'mb-4');
+        bubble.classList.add('py-2', 'px-4', 'rounded-lg', 'shadow-md', 'max-w-lg');
+
+        if (sender === 'user') {
+            messageElement.classList.add('justify-end');
+            bubble.classList.add('bg-green-500', 'text-white');
+        } else {
+            messageElement.classList.add('justify-start');
+            bubble.classList.add('bg-white', 'text-gray-800');
+        }
+        bubble.innerText = text;
+        messageElement.appendChild(bubble);
+        return messageElement;
+    }
+
+    // Tải lịch sử theo trang (mới nhất trước); các trang cũ hơn được chèn lên đầu.
+    async function loadHistoryPage(cursor) {
+        const url = `/api/chatbot/history?pageSize=${HISTORY_PAGE_SIZE}&fields=message,reply`
+            + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('Failed to load chat history');
+        const page = await response.json();
+
+        if (!cursor) chatHistory.innerHTML = ''; // Clear loading message
+        chatHistory.querySelector('.load-older-history')?.remove();
+        const fragment = document.createDocumentFragment();
+        if (page.next_cursor) {
+            const olderButton = document.createElement('button');
+            olderButton.className = 'load-older-history block mx-auto mb-4 text-sm text-green-600 hover:underline';
+            olderButton.innerText = 'Tải tin nhắn cũ hơn';
+            olderButton.addEventListener('click', async () => {
+                olderButton.disabled = true;
+                try {
+                    await loadHistoryPage(page.next_cursor);
+                } catch (error) {
+                    console.error('Error loading history:', error);
+                    olderButton.disabled = false;
+                    showAlert('error', 'Không thể tải lịch sử trò chuyện.');
+                }
+            });
+            fragment.appendChild(olderButton);
+        }
+        // Trang trả về mới nhất trước; hiển thị theo thứ tự thời gian.
+        [...page.data].reverse().forEach(item => {
+            if (item.message) fragment.appendChild(createMessage(item.message, 'user'));
+            if (item.reply) fragment.appendChild(createMessage(item.reply, 'bot'));
+        });
+
+        // Giữ nguyên vị trí cuộn khi chèn tin nhắn cũ lên trên.
+        const previousHeight = chatHistory.scrollHeight;
+        chatHistory.insertBefore(fragment, chatHistory.firstChild);
+        chatHistory.scrollTop = cursor ? chatHistory.scrollHeight - previousHeight : chatHistory.scrollHeight;
+        return page.data.length;
+    }
+
     async function loadHistory() {
         chatHistory.innerHTML = '<p class="text-center text-gray-500">Đang tải lịch sử...</p>';
         try {
-            const response = await fetch('/api/chatbot/history');
-            if (!response.ok) throw new Error('Failed to load chat history');
-            const history = await response.json();
-            chatHistory.innerHTML = ''; // Clear loading message
-
-            if (history.length === 0) {
+            const count = await loadHistoryPage(null);
+            if (count === 0) {
                 appendMessage('Xin chào! Bạn cần hỗ trợ gì về tài chính hôm nay?', 'bot');
-            } else {
-                history.forEach(item => {
-                    if (item.message) appendMessage(item.message, 'user');
-                    if (item.reply) appendMessage(item.reply, 'bot');
-                });
             }
         } catch (error) {
             console.error('Error loading history:', error);
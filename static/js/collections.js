@@ -7,15 +7,21 @@ import { createTable, createDynamicModal, authenticatedFetch, showAlert } from '
 // --- QUẢN LÝ TRẠNG THÁI ---
 let currentPage = 1;
 let totalPages = 1;
-let lastDocIds = [null]; // Lưu trữ ID tài liệu cuối cùng của mỗi trang để phân trang Firestore
+// Cursor (token mờ do server ký) của trang kề trước/sau trang hiện tại; null nếu không có.
+let nextCursor = null;
+let prevCursor = null;
+let currentCursor = null; // Cursor và hướng đã dùng để tải trang hiện tại, để tải lại đúng trang đó.
+let currentDirection = 'next';
 
 // --- LẤY VÀ HIỂN THỊ DỮ LIỆU ---
 
 /**
  * Lấy danh sách tài liệu đã phân trang từ collection được chỉ định.
- * @param {number} page - Số trang cần lấy.
+ * @param {number} page - Số trang cần lấy (chỉ để hiển thị).
+ * @param {string|null} cursor - Cursor của trang kề, null cho trang đầu.
+ * @param {'next' | 'prev'} direction - Lấy các tài liệu sau hay trước cursor.
  */
-async function fetchCollectionData(page = 1) {
+async function fetchCollectionData(page = 1, cursor = null, direction = 'next') {
     try {
         const contentDiv = document.getElementById('collections-content');
         const collection = contentDiv.dataset.collection;
@@ -24,10 +30,9 @@ async function fetchCollectionData(page = 1) {
         }
 
         const pageSize = 10;
-        const startAfter = lastDocIds[page - 1] || null;
-        let url = `/api/collections/${collection}/documents?pageSize=${pageSize}`;
-        if (startAfter) {
-            url += `&startAfter=${startAfter}`;
+        let url = `/api/collections/${collection}/documents?pageSize=${pageSize}&includeTotal=1`;
+        if (cursor) {
+            url += `&cursor=${encodeURIComponent(cursor)}&direction=${direction}`;
         }
 
         // Yêu cầu GET cho collections là công khai, không cần header xác thực
@@ -48,11 +53,10 @@ async function fetchCollectionData(page = 1) {
         contentDiv.appendChild(table);
 
         // Cập nhật trạng thái phân trang
-        if (result.last_doc_id && page < result.total_pages) {
-            if (lastDocIds.length <= page) {
-                lastDocIds.push(result.last_doc_id);
-            }
-        }
+        nextCursor = result.next_cursor;
+        prevCursor = result.prev_cursor;
+        currentCursor = cursor;
+        currentDirection = direction;
         currentPage = page;
         totalPages = result.total_pages;
         updatePaginationUI(result.total_records);
@@ -63,6 +67,13 @@ async function fetchCollectionData(page = 1) {
     }
 }
 
+/**
+ * Tải lại trang đang xem bằng chính cursor đã dùng để tải nó.
+ */
+function reloadCurrentPage() {
+    fetchCollectionData(currentPage, currentCursor, currentDirection);
+}
+
 // --- XỬ LÝ HÀNH ĐỘNG ---
 
 /**
@@ -86,7 +97,7 @@ function handleAction(action, docId, data, collection) {
             apiUrl: `/api/collections/${collection}`, // URL API cơ sở cho PUT
             editAction: 'UPDATE_COLLECTION_DOCUMENT',
             docId: docId,
-            onComplete: () => fetchCollectionData(currentPage) // Tải lại dữ liệu sau khi hoàn tất
+            onComplete: () => reloadCurrentPage() // Tải lại dữ liệu sau khi hoàn tất
         });
     } else if (action === 'delete') {
         // Hiển thị hộp thoại xác nhận trước khi xóa
@@ -110,7 +121,7 @@ async function deleteDocument(collection, docId) {
         });
         showAlert('success', 'Đã xóa thành công!');
         // Tải lại trang hiện tại.
-        fetchCollectionData(currentPage);
+        reloadCurrentPage();
     } catch (error) {
         // Thông báo lỗi đã được xử lý bởi authenticatedFetch
         console.error('Lỗi khi xóa tài liệu:', error);
@@ -132,10 +143,10 @@ function updatePaginationUI(totalRecords) {
         pageInfo.textContent = `Trang ${currentPage} / ${totalPages} | Tổng: ${totalRecords}`;
     }
     if (prevButton) {
-        prevButton.disabled = currentPage <= 1;
+        prevButton.disabled = !prevCursor;
     }
     if (nextButton) {
-        nextButton.disabled = currentPage >= totalPages;
+        nextButton.disabled = !nextCursor;
     }
 }
 
@@ -151,13 +162,13 @@ function setupEventListeners() {
 
     // Nút phân trang
     document.getElementById('category-prev-page')?.addEventListener('click', () => {
-        if (currentPage > 1) {
-            fetchCollectionData(currentPage - 1);
+        if (prevCursor) {
+            fetchCollectionData(currentPage - 1, prevCursor, 'prev');
         }
     });
     document.getElementById('category-next-page')?.addEventListener('click', () => {
-        if (currentPage < totalPages) {
-            fetchCollectionData(currentPage + 1);
+        if (nextCursor) {
+            fetchCollectionData(currentPage + 1, nextCursor, 'next');
         }
     });
 
@@ -177,7 +188,6 @@ function setupEventListeners() {
             addAction: 'ADD_COLLECTION_DOCUMENT',
             onComplete: () => {
                 // Chuyển về trang đầu tiên để xem mục mới
-                lastDocIds = [null]; 
                 fetchCollectionData(1);
             }
         });
@@ -188,7 +198,7 @@ function setupEventListeners() {
 export function loadCategoryPage() {
     currentPage = 1;
     totalPages = 1;
-    lastDocIds = [null];
+    nextCursor = prevCursor = currentCursor = null;
     fetchCollectionData(1);
     setupEventListeners(); // Ensure listeners are set up once
 }
@@ -9,19 +9,18 @@ const currentYear = now.getFullYear();
 // --- LOAN PAGINATION STATE ---
 let loanCurrentPage = 1;
 const LOAN_PAGE_SIZE = 5; // Display 5 loans per page
-// An array to store the document ID of the first item of each page.
-// pageStartDocs[0] is always null (for the first page)
-// pageStartDocs[1] is the ID of the first doc on page 2, etc.
-let loanPageStartDocs = [null]; 
+// Opaque cursors returned by the API for the pages before/after the current one (null when there is none).
+let loanNextCursor = null;
+let loanPrevCursor = null;
+const PAYMENT_PAGE_SIZE = 20; // Payments loaded per "Xem thêm" click, newest first
 /**
- * Fetches data and renders the expense category pie chart.
+ * Renders the expense category pie chart.
+ * @param {Array<{name: string, value: number}>} data - The `pie` section of the dashboard bundle.
  */
-async function renderExpensePieChart() {
+function renderExpensePieChart(data) {
      try {       
         document.getElementById('current_date').innerHTML= ' tháng '+currentMonth +' năm '+currentYear;
-        const response = await fetch(`/api/dashboard/pie/${currentYear}/${currentMonth}`);
-        if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-        const data = await response.json();
+        if (!data) throw new Error('Không có dữ liệu');
 
         const ctx = document.getElementById('expense-category-chart').getContext('2d');
 
@@ -73,7 +72,7 @@ async function renderSavingsTable() {
         const year = document.getElementById('home-year-select').value;
         const response = await fetch(`/api/dashboard/save`);
         if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-        const data = await response.json();
+        const { data } = await response.json();
         
         let html = '<div class="overflow-x-auto shadow-lg rounded-lg"><table class="min-w-full bg-white">';
         html += `<thead class="bg-green-600 text-white"><tr>
@@ -145,27 +144,28 @@ async function loadAndRenderLoans(direction) {
     const prevButton = document.getElementById('loan-prev-page');
     const nextButton = document.getElementById('loan-next-page');
 
-    let startAfterDocId = null;
+    let cursor = null;
+    let page = 1;
 
     if (direction === 'next') {
-        loanCurrentPage++;
-        startAfterDocId = loanPageStartDocs[loanCurrentPage -1];
+        cursor = loanNextCursor;
+        page = loanCurrentPage + 1;
     } else if (direction === 'prev') {
-        loanCurrentPage--;
-        startAfterDocId = loanPageStartDocs[loanCurrentPage-1];
+        cursor = loanPrevCursor;
+        page = loanCurrentPage - 1;
     } else { // 'first'
-        loanCurrentPage = 1;
-        loanPageStartDocs = [null];
-        startAfterDocId = null;
+        direction = 'next';
     }
 
     try {
-        const url = `/api/dashboard/loan?pageSize=${LOAN_PAGE_SIZE}` + (startAfterDocId ? `&startAfter=${startAfterDocId}` : '');
+        const url = `/api/dashboard/loan?pageSize=${LOAN_PAGE_SIZE}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}&direction=${direction}` : '');
         const response = await fetch(url);
         if (!response.ok) throw new Error(`API error: ${response.statusText}`);
         const result = await response.json();
         const loans = result.data;
-        const lastDocId = result.last_doc_id;
+        loanCurrentPage = page;
+        loanNextCursor = result.next_cursor;
+        loanPrevCursor = result.prev_cursor;
 
         const tableBody = document.querySelector("#loan-table tbody");
         tableBody.innerHTML = ""; // Clear existing rows
@@ -190,15 +190,9 @@ async function loadAndRenderLoans(direction) {
             tableBody.appendChild(row);
         });
 
-        // Set the start ID for the *next* page if it doesn't already exist
-        if (lastDocId && loanPageStartDocs.length <= loanCurrentPage) {
-            loanPageStartDocs.push(lastDocId);
-        }
-
-        // Update button states
-        prevButton.disabled = loanCurrentPage <= 1;
-        // Disable 'next' if we received fewer items than the page size, meaning we're on the last page.
-        nextButton.disabled = loans.length < LOAN_PAGE_SIZE;
+        // Update button states: the API only returns a cursor when a page exists in that direction.
+        prevButton.disabled = !loanPrevCursor;
+        nextButton.disabled = !loanNextCursor;
 
         // Add event listeners to the new "View" buttons
         document.querySelectorAll('.view-payments-btn').forEach(button => {
@@ -220,37 +214,57 @@ async function loadAndRenderLoans(direction) {
 }
 
 async function openPaymentsModal(loanId) {
+    const paymentHistoryBody = document.getElementById("payment-history-table-body");
+    paymentHistoryBody.innerHTML = ""; // Clear previous content
+    const loaded = await loadPaymentsPage(loanId, null);
+    if (!loaded) return;
+    if (paymentHistoryBody.children.length === 0) {
+        paymentHistoryBody.innerHTML = "<tr><td colspan='4' class='text-center p-4'>Không có lịch sử trả lãi cho khoản vay này.</td></tr>";
+    }
+    const modal = document.getElementById("payments-modal");
+    modal.classList.remove('hidden');
+}
+
+/**
+ * Appends one page of a loan's payments (newest first) to the payments modal,
+ * followed by a "Xem thêm" row while older payments remain.
+ * @returns {Promise<boolean>} false if the page could not be loaded.
+ */
+async function loadPaymentsPage(loanId, cursor) {
     try {
-        const response = await fetch(`/api/dashboard/loan/${loanId}/payments`);
+        const url = `/api/dashboard/loan/${loanId}/payments?pageSize=${PAYMENT_PAGE_SIZE}&order=desc`
+            + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+        const response = await fetch(url);
         if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-        const payments = await response.json();
+        const result = await response.json();
 
         const paymentHistoryBody = document.getElementById("payment-history-table-body");
-        paymentHistoryBody.innerHTML = ""; // Clear previous content
+        paymentHistoryBody.querySelector('.load-more-payments')?.remove();
+        const offset = paymentHistoryBody.children.length;
+        result.data.forEach((payment, index) => {
+            const row = document.createElement('tr');
+            row.className = (offset + index) % 2 === 0 ? 'bg-white' : 'bg-green-50';
+            row.innerHTML = `
+                <td class="py-3 px-4 text-center">${formatDateToYMD(payment.paidDate)}</td>
+                <td class="py-3 px-4 text-right">${formatCurrency(payment.principalPaid)}</td>
+                <td class="py-3 px-4 text-right">${formatCurrency(payment.interestPaid)}</td>
+                <td class="py-3 px-4 text-right">${formatCurrency(payment.totalPaid)}</td>
+            `;
+            paymentHistoryBody.appendChild(row);
+        });
 
-        if (payments.length === 0) {
-            paymentHistoryBody.innerHTML = "<tr><td colspan='4' class='text-center p-4'>Không có lịch sử trả lãi cho khoản vay này.</td></tr>";
-        } else {
-            payments.forEach((payment,index) => {
-                const rowClass = index % 2 === 0 ? 'bg-white' : 'bg-green-50';
-                const row = document.createElement('tr');
-                row.className = rowClass;
-                row.innerHTML = `
-                    <td class="py-3 px-4 text-center">${formatDateToYMD(payment.paidDate)}</td>
-                    <td class="py-3 px-4 text-right">${formatCurrency(payment.principalPaid)}</td>
-                    <td class="py-3 px-4 text-right">${formatCurrency(payment.interestPaid)}</td>
-                    <td class="py-3 px-4 text-right">${formatCurrency(payment.totalPaid)}</td>
-                `;
-                paymentHistoryBody.appendChild(row);
-            });
+        if (result.next_cursor) {
+            const moreRow = document.createElement('tr');
+            moreRow.className = 'load-more-payments';
+            moreRow.innerHTML = `<td colspan="4" class="text-center p-3"><button class="link-btn">Xem thêm</button></td>`;
+            moreRow.querySelector('button').addEventListener('click', () => loadPaymentsPage(loanId, result.next_cursor));
+            paymentHistoryBody.appendChild(moreRow);
         }
-
-        const modal = document.getElementById("payments-modal");
-        modal.classList.remove('hidden');
-
+        return true;
     } catch (error) {
         console.error("Error fetching loan payments:", error);
         showAlert('error', `Không thể tải lịch sử trả lãi: ${error.message}`);
+        return false;
     }
 }
 
@@ -259,36 +273,30 @@ async function openPaymentsModal(loanId) {
  */
 export async function loadHomePage() {
     try {       
-        LoadInfomation();
+        await LoadInfomation();
     } catch (error) {
         console.error('Failed to initialize home page:', error);
         showAlert('error', `Lỗi khởi tạo trang chủ: ${error.message}`);
     }
 }
-async function totalBook(){
-    const [booksResponse] = await Promise.all([        
-        fetch('/api/books')
-    ]);
-    const allBooks = await booksResponse.json();
+function totalBook(count){
     const books = document.getElementById('total-books');
-    books.textContent = allBooks.length + ' cuốn';
+    books.textContent = (count ?? 0) + ' cuốn';
 }
-async function totalSaving(){
-    const response = await fetch(`/api/dashboard/save`);
-    if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-    const data = await response.json();
-    let total = 0;
+function totalSaving(savings){
+    if (!savings) return;
+    // Tổng tiền gốc được tổng hợp sẵn ở máy chủ; lợi tức vẫn tính theo từng khoản gửi
+    const total = savings.summary.total_principal;
     let totalYield = 0;
     const today = new Date();
     today.setHours(0, 0, 0, 0); 
-    data.forEach((item, index) => {
+    savings.data.forEach((item, index) => {
         const startDate = new Date(item.date); // Assumes date format is parseable by new Date() e.g., 'YYYY-MM-DD'                
         const rate = item.rate;           
         const days = Math.ceil((today - startDate) / (1000 * 60 * 60 * 24));;
         
         const interestYield = Math.round(item.amount * rate * days / 36500,0);
         totalYield += interestYield;
-        total += item.amount;
         
     });
     const totalSaving = document.getElementById('total-savings');
@@ -296,10 +304,8 @@ async function totalSaving(){
     const totalYieldElement = document.getElementById('total-interest');
     totalYieldElement.textContent = formatCurrency(totalYield);
 }
-async function loadRecentTransactions(){
-
-    const response = await fetch(`/api/collections/Year/${currentYear}/Months/${currentMonth}/Types/Chi/recent?limit=5`);
-    const data = await response.json();
+function loadRecentTransactions(data){
+    if (!data) return;
     const table = document.getElementById("recent-transactions");
     table.innerHTML = ""; // Clear existing rows    
     let tableHeader =`<table class="min-w-full bg-white">
@@ -321,10 +327,8 @@ async function loadRecentTransactions(){
     tableHeader += `</tbody></table>`
     table.innerHTML = tableHeader;      
 }
-async function loadChart(){
-    const response = await fetch(`/api/dashboard/summary/${currentYear}/${currentMonth}`);
-    if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-    const data = await response.json();
+function loadChart(data, prevData){
+    if (!data) return;
     
     const income = document.getElementById('monthly-income');
     const expense = document.getElementById('monthly-expense');
@@ -333,14 +337,8 @@ async function loadChart(){
     expense.textContent = formatCurrency(data.expense);
     outstanding.textContent = formatCurrency(data.income- data.expense);
     
-    // Lấy tổng thu trong tháng trước
-    let previousMonth = currentMonth === 1 ? 12 : currentMonth - 1;
-    let yearForPreviousMonth = currentMonth === 1 ? currentYear - 1 : currentYear;    
-    const preResponse = await fetch(`/api/dashboard/summary/${yearForPreviousMonth}/${previousMonth}`);
-    if (!preResponse.ok) throw new Error(`API error: ${preResponse.statusText}`);
-    const prevData = await preResponse.json();
-    
-    // So sánh và cập nhật thu nhập
+    // So sánh và cập nhật thu nhập với tháng trước
+    if (!prevData) return;
     const incomeChangeElement = document.getElementById('income-change');
     const incomeChange = ((data.income - prevData.income) / (prevData.income || 1)) * 100;
     incomeChangeElement.classList.remove('text-green-600', 'text-red-600');
@@ -355,18 +353,27 @@ async function loadChart(){
     }
 }
 async function LoadInfomation(){
-    // Lấy thông tin tổng số sách
-    totalBook();
-    // Lấy tổng chi trong tháng
-    loadChart();    
-    // Lấy danh sách khoản tiết kiệm
+    // Lấy danh sách khoản vay
     loadAndRenderLoans('first');
+
+    // Toàn bộ dữ liệu còn lại của trang chủ được lấy trong một request duy nhất
+    const response = await fetch(`/api/dashboard/bundle/${currentYear}/${currentMonth}`);
+    if (!response.ok) throw new Error(`API error: ${response.statusText}`);
+    const bundle = await response.json();
+    Object.entries(bundle.errors || {}).forEach(([section, message]) => {
+        console.error(`Dashboard bundle section '${section}' failed: ${message}`);
+    });
+
+    // Lấy thông tin tổng số sách
+    totalBook(bundle.total_books);
+    // Lấy tổng thu chi trong tháng
+    loadChart(bundle.summary, bundle.previous_summary);
     // Biểu đồ thu chi
-    renderExpensePieChart(currentMonth,currentYear);
+    renderExpensePieChart(bundle.pie);
     // Lấy thông tin tiết kiệm
-    totalSaving();
+    totalSaving(bundle.savings);
     // Lấy thông tin các giao dịch gần đây top 5
-    loadRecentTransactions();
+    loadRecentTransactions(bundle.recent);
 }
 
     
\ No newline at end of file
@@ -158,7 +158,7 @@ async function renderSavingsTable() {
         const year = document.getElementById('home-year-select').value;
         const response = await fetch(`/api/dashboard/save`);
         if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-        const data = await response.json();
+        const { data } = await response.json();
         
         let html = '<div class="overflow-x-auto shadow-lg rounded-lg"><table class="min-w-full bg-white">';
         html += `<thead class="bg-green-600 text-white"><tr>
@@ -5,7 +5,7 @@ async function renderSavingsTable() {
         const year = new Date().getFullYear();
         const response = await fetch(`/api/dashboard/save`);
         if (!response.ok) throw new Error(`API error: ${response.statusText}`);
-        const data = await response.json();
+        const { data } = await response.json();
         
         let html = '<div class="overflow-x-auto shadow-lg rounded-lg"><table class="min-w-full bg-white">';
         html += `<thead class="bg-green-600 text-white"><tr>
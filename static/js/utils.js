@@ -121,6 +121,48 @@ export async function authenticatedFetch(url, options = {}) {
     }
 }
 
+/**
+ * Sends a chatbot message to /api/chatbot/stream and reads the Server-Sent Events
+ * reply as it is generated, calling onDelta for each chunk of text.
+ * @param {string} message - The user's message.
+ * @param {object} options - { saveHistory = true, onDelta(textChunk, replySoFar) }.
+ * @returns {Promise<string>} The full reply once the stream has ended.
+ */
+export async function streamChat(message, { saveHistory = true, onDelta = () => {} } = {}) {
+    const response = await authenticatedFetch('/api/chatbot/stream', {
+        method: 'POST',
+        body: JSON.stringify({ message, saveHistory })
+    });
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Events are separated by a blank line; keep a trailing partial event in the buffer.
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+            const payload = JSON.parse(data);
+            if (event === 'error') throw new Error(payload.reply);
+            if (event === 'done') return payload.reply ?? reply;
+            reply += payload.delta;
+            onDelta(payload.delta, reply);
+        }
+    }
+    return reply;
+}
+
 /**
  * Creates and displays a dynamic modal for adding or editing data.
  * @param {object} options - The configuration for the modal.